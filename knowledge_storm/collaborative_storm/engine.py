@@ -182,7 +182,8 @@ class CollaborativeStormLMConfigs(LMConfigs):
         """
         config_dict = {}
         for attr_name in self.__dict__:
-            config_dict[attr_name] = getattr(self, attr_name).kwargs
+            if "_lm" in attr_name:
+                config_dict[attr_name] = getattr(self, attr_name).kwargs
         return config_dict
 
 
@@ -254,6 +255,37 @@ class RunnerArgument:
             "help": "Trigger node expansion for node that contain more than N snippets"
         },
     )
+    vector_index_backend: str = field(
+        default="exact",
+        metadata={
+            "help": "Index used to rank knowledge base nodes when inserting information: 'exact' or 'hnsw' "
+            "(approximate, requires hnswlib)."
+        },
+    )
+    question_answering_max_info_tokens: int = field(
+        default=1300,
+        metadata={
+            "help": "Maximum number of tokens of search results question_answering_lm answers each question from."
+        },
+    )
+    question_asking_max_info_tokens: int = field(
+        default=1300,
+        metadata={
+            "help": "Maximum number of tokens of unused search results question_asking_lm raises new questions from."
+        },
+    )
+    knowledge_base_max_info_tokens: int = field(
+        default=5200,
+        metadata={
+            "help": "Maximum number of tokens of cited information knowledge_base_lm writes each report section from."
+        },
+    )
+    discourse_manage_max_background_tokens: int = field(
+        default=130,
+        metadata={
+            "help": "Maximum number of tokens of background information discourse_manage_lm selects experts from."
+        },
+    )
     disable_moderator: bool = field(
         default=False,
         metadata={"help": "If True, disable moderator."},
@@ -376,7 +408,8 @@ class DiscourseManager:
             callback_handler=self.callback_handler,
         )
         self.generate_expert_module = GenerateExpertModule(
-            engine=self.lm_config.discourse_manage_lm
+            engine=self.lm_config.discourse_manage_lm,
+            max_background_tokens=self.runner_argument.discourse_manage_max_background_tokens,
         )
         self.next_turn_moderator_override = False
 
@@ -527,6 +560,8 @@ class CoStormRunner:
             knowledge_base_lm=self.lm_config.knowledge_base_lm,
             node_expansion_trigger_count=self.runner_argument.node_expansion_trigger_count,
             encoder=self.encoder,
+            vector_index_backend=self.runner_argument.vector_index_backend,
+            report_max_info_tokens=self.runner_argument.knowledge_base_max_info_tokens,
         )
         self.discourse_manager = DiscourseManager(
             lm_config=self.lm_config,
@@ -576,6 +611,8 @@ class CoStormRunner:
             knowledge_base_lm=costorm_runner.lm_config.knowledge_base_lm,
             node_expansion_trigger_count=costorm_runner.runner_argument.node_expansion_trigger_count,
             encoder=costorm_runner.encoder,
+            vector_index_backend=costorm_runner.runner_argument.vector_index_backend,
+            report_max_info_tokens=costorm_runner.runner_argument.knowledge_base_max_info_tokens,
         )
         return costorm_runner
 
@@ -626,6 +663,8 @@ class CoStormRunner:
                         knowledge_base_lm=self.lm_config.knowledge_base_lm,
                         node_expansion_trigger_count=self.runner_argument.node_expansion_trigger_count,
                         encoder=self.encoder,
+                        vector_index_backend=self.runner_argument.vector_index_backend,
+                        report_max_info_tokens=self.runner_argument.knowledge_base_max_info_tokens,
                     )
                 if self.conversation_history is None:
                     self.conversation_history = []
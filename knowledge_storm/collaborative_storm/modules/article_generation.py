@@ -4,6 +4,7 @@ from typing import Set, Union
 
 from .collaborative_storm_utils import clean_up_section
 from ...dataclass import KnowledgeBase, KnowledgeNode
+from ...utils import TokenCounter
 
 
 class ArticleGenerationModule(dspy.Module):
@@ -12,27 +13,31 @@ class ArticleGenerationModule(dspy.Module):
     def __init__(
         self,
         engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_info_tokens: int = 5200,
     ):
         super().__init__()
         self.write_section = dspy.Predict(WriteSection)
         self.engine = engine
+        self.max_info_tokens = max_info_tokens
 
     def _get_cited_information_string(
         self,
         all_citation_index: Set[int],
         knowledge_base: KnowledgeBase,
-        max_words: int = 4000,
+        max_tokens: int = 5200,
     ):
+        token_counter = TokenCounter.for_lm(self.engine)
         information = []
-        cur_word_count = 0
+        cur_token_count = 0
         for index in sorted(list(all_citation_index)):
             info = knowledge_base.info_uuid_to_info_dict[index]
             snippet = info.snippets[0]
             info_text = f"[{index}]: {snippet} (Question: {info.meta['question']}. Query: {info.meta['query']})"
-            cur_snippet_length = len(info_text.split())
-            if cur_snippet_length + cur_word_count > max_words:
+            # Plus one for the newline joining the snippets.
+            cur_snippet_length = token_counter.count(info_text) + 1
+            if cur_snippet_length + cur_token_count > max_tokens:
                 break
-            cur_word_count += cur_snippet_length
+            cur_token_count += cur_snippet_length
             information.append(info_text)
         return "\n".join(information)
 
@@ -49,7 +54,9 @@ class ArticleGenerationModule(dspy.Module):
             return node.synthesize_output
         all_citation_index = node.collect_all_content()
         information = self._get_cited_information_string(
-            all_citation_index=all_citation_index, knowledge_base=knowledge_base
+            all_citation_index=all_citation_index,
+            knowledge_base=knowledge_base,
+            max_tokens=self.max_info_tokens,
         )
         with dspy.settings.context(lm=self.engine):
             synthesize_output = clean_up_section(
@@ -57,6 +57,18 @@ class BaseCallbackHandler:
         """Run when the warm start process has update."""
         pass
 
+    def on_expert_utterance_generation_chunk(self, chunk: str, **kwargs):
+        """Run when the next chunk of the expert's answer is generated, to show partial text while generation is still running."""
+        pass
+
+    def on_expert_utterance_polishing_chunk(self, chunk: str, **kwargs):
+        """Run when the next chunk of the polished expert utterance is generated."""
+        pass
+
+    def streams(self, hook: str) -> bool:
+        """Whether the chunk hook `hook` is implemented, i.e., whether LM output should be streamed to it."""
+        return getattr(type(self), hook) is not getattr(BaseCallbackHandler, hook)
+
 
 class LocalConsolePrintCallBackHandler(BaseCallbackHandler):
     def __init__(self):
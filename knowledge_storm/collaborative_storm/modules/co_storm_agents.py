@@ -15,6 +15,7 @@ from .simulate_user import GenSimulatedUserUtterance
 from ...dataclass import ConversationTurn, KnowledgeBase
 from ...encoder import Encoder
 from ...interface import Agent, Information, LMConfigs
+from ...lm import stream_lm_output
 from ...logging_wrapper import LoggingWrapper
 
 if TYPE_CHECKING:
@@ -99,11 +100,17 @@ class CoStormExpert(Agent):
         with self.logging_wrapper.log_event(
             "CoStormExpert generate utterance: polish utterance"
         ):
+            stream_callback = None
             if self.callback_handler is not None:
                 self.callback_handler.on_expert_utterance_polishing_start()
-            self.costorm_agent_utterance_generator.polish_utterance(
-                conversation_turn=conv_turn, last_conv_turn=last_conv_turn
-            )
+                if self.callback_handler.streams("on_expert_utterance_polishing_chunk"):
+                    stream_callback = (
+                        self.callback_handler.on_expert_utterance_polishing_chunk
+                    )
+            with stream_lm_output(stream_callback):
+                self.costorm_agent_utterance_generator.polish_utterance(
+                    conversation_turn=conv_turn, last_conv_turn=last_conv_turn
+                )
         return conv_turn
 
 
@@ -182,7 +189,8 @@ class Moderator(Agent):
         self.runner_argument = runner_argument
         self.logging_wrapper = logging_wrapper
         self.grounded_question_generation_module = GroundedQuestionGenerationModule(
-            engine=self.lm_config.question_asking_lm
+            engine=self.lm_config.question_asking_lm,
+            max_info_tokens=self.runner_argument.question_asking_max_info_tokens,
         )
         self.callback_handler = callback_handler
         self.encoder = encoder
@@ -265,6 +273,8 @@ class Moderator(Agent):
             )
             batch_snippets.append(conv_turn.claim_to_make)
             batch_snippets.extend(conv_turn.queries)
+        # Embed everything in one batched call to warm up the encoder's in-memory cache;
+        # the per-turn encode calls below are then served from the cache.
         self.encoder.encode(batch_snippets, max_workers=20)
 
         # get sorted unused snippets for each turn
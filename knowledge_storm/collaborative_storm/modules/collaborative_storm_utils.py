@@ -10,6 +10,7 @@ if TYPE_CHECKING:
 from ...interface import Information, Retriever, LMConfigs
 from ...logging_wrapper import LoggingWrapper
 from ...rm import BingSearch
+from ...utils import TokenCounter
 
 
 def extract_storm_info_snippet(info: Information, snippet_index: int) -> Information:
@@ -35,23 +36,27 @@ def extract_storm_info_snippet(info: Information, snippet_index: int) -> Informa
 
 def format_search_results(
     searched_results: List[Information],
-    info_max_num_words: int = 1000,
+    info_max_num_tokens: int = 1300,
     mode: str = "brief",
+    token_counter: Optional[TokenCounter] = None,
 ) -> Tuple[str, Dict[int, Information]]:
     """
-    Constructs a string from a list of search results with a specified word limit and returns a mapping of indices to Information.
+    Constructs a string from a list of search results with a specified token limit and returns a mapping of indices to Information.
 
     Args:
         searched_results (List[Information]): List of Information objects to process.
-        info_max_num_words (int, optional): Maximum number of words allowed in the output string. Defaults to 1000.
+        info_max_num_tokens (int, optional): Maximum number of tokens allowed in the output string. Defaults to 1300.
         mode (str, optional): Mode of summarization. 'brief' takes only the first snippet of each Information.
-                                'extensive' adds snippets iteratively until the word limit is reached. Defaults to 'brief'.
+                                'extensive' adds snippets iteratively until the token limit is reached. Defaults to 'brief'.
+        token_counter (TokenCounter, optional): Counts tokens for the model the string is sent to. Defaults to the
+                                approximate counter.
 
     Returns:
         Tuple[str, Dict[int, Information]]:
-            - Formatted string with search results, constrained by the word limit.
+            - Formatted string with search results, constrained by the token limit.
             - Dictionary mapping indices to the corresponding Information objects.
     """
+    token_counter = token_counter or TokenCounter.for_lm(None)
     total_length = 0
 
     extracted_snippet_queue = []
@@ -65,8 +70,9 @@ def format_search_results(
         for info in searched_results:
             if i < len(info.snippets) and not abort:
                 cur_snippet = info.snippets[i]
-                cur_snippet_len = len(info.snippets[i].split())
-                if total_length + cur_snippet_len > info_max_num_words:
+                # Each snippet also costs its "[index]: " prefix and newline.
+                cur_snippet_len = token_counter.count(info.snippets[i]) + 4
+                if total_length + cur_snippet_len > info_max_num_tokens:
                     abort = True
                     break
                 if cur_snippet not in included_snippets:
@@ -258,4 +264,5 @@ def _get_answer_question_module_instance(
         max_search_queries=runner_argument.max_search_queries,
         question_answering_lm=lm_config.question_answering_lm,
         logging_wrapper=logging_wrapper,
+        max_info_tokens=runner_argument.question_answering_max_info_tokens,
     )
@@ -2,6 +2,8 @@ import dspy
 import re
 from typing import Union
 
+from ...utils import TokenCounter
+
 
 class GenerateExpertGeneral(dspy.Signature):
     """You need to select a group of diverse experts who will be suitable to be invited to a roundtable discussion on the given topic.
@@ -41,18 +43,21 @@ class GenerateExpertWithFocus(dspy.Signature):
 
 
 class GenerateExpertModule(dspy.Module):
-    def __init__(self, engine: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_background_tokens: int = 130,
+    ):
         self.engine = engine
+        self.max_background_tokens = max_background_tokens
         self.generate_expert_general = dspy.Predict(GenerateExpertGeneral)
         self.generate_expert_w_focus = dspy.ChainOfThought(GenerateExpertWithFocus)
 
-    def trim_background(self, background: str, max_words: int = 100):
-        words = background.split()
-        cur_len = len(words)
-        if cur_len <= max_words:
+    def trim_background(self, background: str, max_tokens: int = 130):
+        token_counter = TokenCounter.for_lm(self.engine)
+        if token_counter.count(background) <= max_tokens:
             return background
-        trimmed_words = words[: min(cur_len, max_words)]
-        trimmed_background = " ".join(trimmed_words)
+        trimmed_background = token_counter.truncate(background, max_tokens)
         return f"{trimmed_background} [rest content omitted]."
 
     def forward(
@@ -65,7 +70,7 @@ class GenerateExpertModule(dspy.Module):
                 ).experts
             else:
                 background_info = self.trim_background(
-                    background=background_info, max_words=100
+                    background=background_info, max_tokens=self.max_background_tokens
                 )
                 output = self.generate_expert_w_focus(
                     topic=topic,
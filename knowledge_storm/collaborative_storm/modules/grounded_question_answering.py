@@ -8,8 +8,9 @@ from .collaborative_storm_utils import (
     extract_cited_storm_info,
     separate_citations,
 )
+from ...lm import stream_lm_output
 from ...logging_wrapper import LoggingWrapper
-from ...utils import ArticleTextProcessing
+from ...utils import ArticleTextProcessing, TokenCounter
 from ...interface import Information
 
 
@@ -54,9 +55,11 @@ class AnswerQuestionModule(dspy.Module):
         max_search_queries: int,
         question_answering_lm: Union[dspy.dsp.LM, dspy.dsp.HFModel],
         logging_wrapper: LoggingWrapper,
+        max_info_tokens: int = 1300,
     ):
         super().__init__()
         self.question_answering_lm = question_answering_lm
+        self.max_info_tokens = max_info_tokens
         self.question_to_query = dspy.Predict(QuestionToQuery)
         self.answer_question = dspy.Predict(AnswerQuestion)
         self.retriever = retriever
@@ -124,9 +127,17 @@ class AnswerQuestionModule(dspy.Module):
             callback_handler.on_expert_information_collection_end(searched_results)
         # format information string for answer generation
         info_text, index_to_information_mapping = format_search_results(
-            searched_results, mode=mode
+            searched_results,
+            info_max_num_tokens=self.max_info_tokens,
+            mode=mode,
+            token_counter=TokenCounter.for_lm(self.question_answering_lm),
         )
         answer = "Sorry, there is insufficient information to answer the question."
+        stream_callback = None
+        if callback_handler is not None and callback_handler.streams(
+            "on_expert_utterance_generation_chunk"
+        ):
+            stream_callback = callback_handler.on_expert_utterance_generation_chunk
         # generate answer to the question
         if info_text:
             with self.logging_wrapper.log_event(
@@ -134,7 +145,7 @@ class AnswerQuestionModule(dspy.Module):
             ):
                 with dspy.settings.context(
                     lm=self.question_answering_lm, show_guidelines=False
-                ):
+                ), stream_lm_output(stream_callback):
                     answer = self.answer_question(
                         topic=topic, question=question, info=info_text, style=style
                     ).answer
@@ -18,6 +18,7 @@ from .collaborative_storm_utils import (
 )
 from ...dataclass import ConversationTurn, KnowledgeBase
 from ...interface import Information
+from ...utils import TokenCounter
 
 
 class KnowledgeBaseSummmary(dspy.Signature):
@@ -72,8 +73,13 @@ class GroundedQuestionGeneration(dspy.Signature):
 
 
 class GroundedQuestionGenerationModule(dspy.Module):
-    def __init__(self, engine: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_info_tokens: int = 1300,
+    ):
         self.engine = engine
+        self.max_info_tokens = max_info_tokens
         self.gen_focus = dspy.Predict(GroundedQuestionGeneration)
         self.polish_style = dspy.Predict(ConvertUtteranceStyle)
         self.gen_summary = dspy.Predict(KnowledgeBaseSummmary)
@@ -86,7 +92,9 @@ class GroundedQuestionGenerationModule(dspy.Module):
         unused_snippets: List[Information],
     ):
         information, index_to_information_mapping = format_search_results(
-            unused_snippets, info_max_num_words=1000
+            unused_snippets,
+            info_max_num_tokens=self.max_info_tokens,
+            token_counter=TokenCounter.for_lm(self.engine),
         )
         summary = knowledge_base.get_knowledge_base_summary()
         last_utterance, _ = extract_and_remove_citations(last_conv_turn.utterance)
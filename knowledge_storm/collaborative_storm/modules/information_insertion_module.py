@@ -152,9 +152,16 @@ class InsertInformationModule(dspy.Module):
         outlines: List[str],
         question: str,
         query: str,
+        knowledge_base: Optional[KnowledgeBase] = None,
+        top_k: Optional[int] = None,
     ):
         if encoded_outline is not None and encoded_outline.size > 0:
             encoded_query = self.encoder.encode(f"{question}, {query}")
+            if knowledge_base is not None and top_k is not None:
+                # Only the top candidates are used, so let the knowledge base's vector index find them.
+                return knowledge_base.rank_knowledge_base_structure(
+                    encoded_query, outlines, top_k
+                )
             sim = cosine_similarity([encoded_query], encoded_outline)[0]
             sorted_indices = np.argsort(sim)
             sorted_outlines = np.array(outlines)[sorted_indices[::-1]]
@@ -179,9 +186,15 @@ class InsertInformationModule(dspy.Module):
         encoded_outlines: np.ndarray,
         outlines: List[str],
         top_N_candidates: int = 5,
+        knowledge_base: Optional[KnowledgeBase] = None,
     ):
         sorted_candidates = self._get_sorted_embed_sim_section(
-            encoded_outlines, outlines, question, query
+            encoded_outlines,
+            outlines,
+            question,
+            query,
+            knowledge_base=knowledge_base,
+            top_k=top_N_candidates,
         )
         considered_candidates = sorted_candidates[
             : min(len(sorted_candidates), top_N_candidates)
@@ -244,6 +257,7 @@ class InsertInformationModule(dspy.Module):
                         encoded_outlines=encoded_outlines,
                         outlines=outlines,
                         top_N_candidates=8,
+                        knowledge_base=knowledge_base,
                     )
                 if candidate_placement is None:
                     candidate_placement = self.layer_by_layer_navigation_placement(
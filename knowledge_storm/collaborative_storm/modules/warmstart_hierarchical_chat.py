@@ -319,7 +319,8 @@ class WarmStartModule:
         callback_handler: BaseCallbackHandler = None,
     ):
         generate_expert_module = GenerateExpertModule(
-            engine=lm_config.discourse_manage_lm
+            engine=lm_config.discourse_manage_lm,
+            max_background_tokens=runner_argument.discourse_manage_max_background_tokens,
         )
         self.warmstart_conv = WarmStartConversation(
             question_asking_lm=lm_config.question_asking_lm,
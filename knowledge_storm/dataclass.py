@@ -4,7 +4,7 @@ import re
 import threading
 from typing import Set, Dict, List, Optional, Union, Tuple
 
-from .encoder import Encoder
+from .encoder import Encoder, VectorIndex, create_vector_index
 from .interface import Information
 
 
@@ -311,12 +311,18 @@ class KnowledgeBase:
         knowledge_base_lm: Union[dspy.dsp.LM, dspy.dsp.HFModel],
         node_expansion_trigger_count: int,
         encoder: Encoder,
+        vector_index_backend: str = "exact",
+        report_max_info_tokens: int = 5200,
     ):
         """
         Initializes a KnowledgeBase instance.
 
         Args:
             topic (str): The topic of the knowledge base
+            vector_index_backend (str): Index used to rank knowledge base nodes when inserting information,
+                "exact" or "hnsw" (approximate, requires `hnswlib`). The index grows as nodes are added.
+            report_max_info_tokens (int): Maximum number of tokens of cited information each report section is
+                written from.
             expand_node_module (dspy.Module): The module that organize knowledge base in place.
                 The module should accept knowledge base as param. E.g. expand_node_module(self)
             article_generation_module (dspy.Module): The module that generate report from knowledge base.
@@ -345,7 +351,7 @@ class KnowledgeBase:
             node_expansion_trigger_count=node_expansion_trigger_count,
         )
         self.article_generation_module = ArticleGenerationModule(
-            engine=knowledge_base_lm
+            engine=knowledge_base_lm, max_info_tokens=report_max_info_tokens
         )
         self.gen_summary_module = KnowledgeBaseSummaryModule(engine=knowledge_base_lm)
 
@@ -358,6 +364,10 @@ class KnowledgeBase:
         self.info_uuid_to_info_dict: Dict[int, Information] = {}
         self.info_hash_to_uuid_dict: Dict[int, int] = {}
         self._lock = threading.Lock()
+        self.vector_index_backend = vector_index_backend
+        self._structure_index: Optional[VectorIndex] = None
+        self._structure_index_ids: Dict[str, int] = {}
+        self._structure_index_strings: List[str] = []
 
     def to_dict(self):
         info_uuid_to_info_dict = {
@@ -377,12 +387,16 @@ class KnowledgeBase:
         knowledge_base_lm: Union[dspy.dsp.LM, dspy.dsp.HFModel],
         node_expansion_trigger_count: int,
         encoder: Encoder,
+        vector_index_backend: str = "exact",
+        report_max_info_tokens: int = 5200,
     ):
         knowledge_base = cls(
             topic=data["topic"],
             knowledge_base_lm=knowledge_base_lm,
             node_expansion_trigger_count=node_expansion_trigger_count,
             encoder=encoder,
+            vector_index_backend=vector_index_backend,
+            report_max_info_tokens=report_max_info_tokens,
         )
         knowledge_base.root = KnowledgeNode.from_dict(data["tree"])
         knowledge_base.info_hash_to_uuid_dict = {
@@ -412,6 +426,7 @@ class KnowledgeBase:
                 outline.replace(" -> ", ", ") for outline in outline_strings
             ]
             encoded_outline = self.encoder.encode(cleaned_outline_strings)
+            self._update_structure_index(outline_strings, encoded_outline)
             self.kb_embedding = {
                 "hash": outline_string_hash,
                 "encoded_structure": encoded_outline,
@@ -422,6 +437,56 @@ class KnowledgeBase:
             self.kb_embedding["structure_string"],
         )
 
+    def _update_structure_index(
+        self, outline_strings: List[str], encoded_outline: np.ndarray
+    ):
+        if encoded_outline.size == 0:
+            return
+        if (
+            self._structure_index is not None
+            and len(self._structure_index) > 2 * len(outline_strings) + 64
+        ):
+            # Renamed or removed nodes leave stale vectors behind; rebuild once they dominate the index.
+            self._structure_index = None
+        if self._structure_index is None:
+            self._structure_index = create_vector_index(
+                self.vector_index_backend, dim=encoded_outline.shape[1]
+            )
+            self._structure_index_ids = {}
+            self._structure_index_strings = []
+        new_rows = []
+        for row, outline in enumerate(outline_strings):
+            if outline not in self._structure_index_ids:
+                self._structure_index_ids[outline] = len(self._structure_index_strings)
+                self._structure_index_strings.append(outline)
+                new_rows.append(row)
+        if new_rows:
+            self._structure_index.add(encoded_outline[new_rows])
+
+    def rank_knowledge_base_structure(
+        self, encoded_query: np.ndarray, outlines: List[str], top_k: int
+    ) -> List[str]:
+        """
+        Returns up to `top_k` of `outlines` ordered by similarity to `encoded_query`.
+
+        Uses the structure index maintained by `get_knowledge_base_structure_embedding`. The index may
+        also hold outlines of renamed nodes or nodes outside the current root; those are skipped.
+        """
+        if self._structure_index is None or len(outlines) == 0:
+            return []
+        allowed = set(outlines)
+        index_size = len(self._structure_index)
+        k = min(index_size, top_k + max(index_size - len(allowed), 0))
+        _, ids = self._structure_index.search(encoded_query, k)
+        ranked = []
+        for i in ids[0]:
+            outline = self._structure_index_strings[i]
+            if outline in allowed:
+                ranked.append(outline)
+                if len(ranked) == top_k:
+                    break
+        return ranked
+
     def traverse_down(self, node):
         """
         Traverses the tree downward from the given node.
@@ -1,6 +1,15 @@
+import hashlib
+import json
+import logging
 import os
+import random
+import re
+import sys
+import threading
+import time
 import numpy as np
 
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Tuple, Union, Optional, Dict, Literal
 from pathlib import Path
@@ -32,6 +41,366 @@ except ImportError:
 
     litellm = LitellmPlaceholder()
 
+_SENTENCE_TRANSFORMERS: Dict[Tuple[str, Optional[str]], "SentenceTransformer"] = {}
+_SENTENCE_TRANSFORMERS_LOCK = threading.Lock()
+
+
+def get_sentence_transformer(
+    model_name: str = "paraphrase-MiniLM-L6-v2", device: Optional[str] = None
+) -> "SentenceTransformer":
+    """
+    Returns a process-wide SentenceTransformer for the given model name and device.
+
+    Each (model_name, device) pair is loaded once and shared by all callers, so running many
+    topics in one process does not reload the model weights every time. Loading is guarded by a
+    lock, so concurrent callers wait for the first load instead of loading the model again.
+
+    Args:
+        model_name (str): Name or path of the SentenceTransformer model.
+        device (Optional[str]): Device to run the model on, e.g. "cpu", "cuda", "mps". If None,
+            SentenceTransformer picks the device.
+    """
+    key = (model_name, device)
+    model = _SENTENCE_TRANSFORMERS.get(key)
+    if model is not None:
+        return model
+    with _SENTENCE_TRANSFORMERS_LOCK:
+        model = _SENTENCE_TRANSFORMERS.get(key)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            start_time = time.time()
+            model = SentenceTransformer(model_name, device=device)
+            logging.info(
+                f"Loaded local encoder {model_name} on {model.device} in {time.time() - start_time:.4f} seconds"
+            )
+            _SENTENCE_TRANSFORMERS[key] = model
+    return model
+
+
+class EmbeddingCache:
+    """
+    A thread-safe, in-memory LRU cache of embedding vectors.
+
+    Entries are keyed by (model name, text) and stored as read-only float32 arrays. The cache is
+    bounded by the approximate memory its entries occupy rather than by the number of entries, so
+    the same budget holds for embedding models of different dimensions.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes (int): Memory budget of the cache. Least recently used entries are evicted
+                once the total size of the stored vectors and texts exceeds it.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(key: Tuple[str, str], vector: np.ndarray) -> int:
+        return vector.nbytes + sys.getsizeof(key[1])
+
+    def get(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._data.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: Tuple[str, str], vector: np.ndarray):
+        size = self._entry_size(key, vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._entry_size(key, self._data.pop(key))
+            self._data[key] = vector
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                old_key, old_vector = self._data.popitem(last=False)
+                self.current_bytes -= self._entry_size(old_key, old_vector)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def get_stats(self, reset: bool = False) -> Dict[str, int]:
+        """
+        Returns hit/miss/eviction counters and the current size of the cache.
+
+        Args:
+            reset (bool): If True, resets the hit/miss/eviction counters after retrieval.
+        """
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "bytes": self.current_bytes,
+            }
+            if reset:
+                self.hits = self.misses = self.evictions = 0
+        return stats
+
+
+class EmbeddingStore:
+    """
+    A persistent embedding store shared by processes on the same machine.
+
+    Each embedding model gets its own subdirectory holding:
+        - `vectors.f32`: an append-only matrix of float32 rows, memory-mapped for reading.
+        - `index.tsv`: an append-only index mapping the content hash of a text to its row.
+        - `meta.json`: the embedding dimension.
+
+    Lookups are served from the memory-mapped matrix without copying, so many worker processes
+    can share one warm cache. Writes and index refreshes are serialized across processes with a
+    file lock. When the matrix grows beyond `max_bytes`, the store is compacted to keep the most
+    recently added embeddings (see `compact`).
+
+    To compact a store from the command line, run:
+        python -m knowledge_storm.encoder STORE_DIR --model MODEL_NAME [--max-bytes N]
+    """
+
+    def __init__(
+        self, store_dir: str, model_name: str, max_bytes: int = 2 * 1024 * 1024 * 1024
+    ):
+        """
+        Args:
+            store_dir (str): Root directory of the store.
+            model_name (str): Name of the embedding model. Embeddings of different models are
+                stored separately.
+            max_bytes (int): Size cap of the vector matrix on disk.
+        """
+        try:
+            from filelock import FileLock
+        except ImportError as err:
+            raise ImportError(
+                "EmbeddingStore requires `pip install filelock`."
+            ) from err
+
+        self.store_dir = os.path.join(
+            store_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        )
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.store_dir, "vectors.f32")
+        self.index_path = os.path.join(self.store_dir, "index.tsv")
+        self.meta_path = os.path.join(self.store_dir, "meta.json")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._file_lock = FileLock(os.path.join(self.store_dir, ".lock"))
+        self._thread_lock = threading.RLock()
+        self._reset_state()
+        with self._file_lock:
+            self._refresh()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _reset_state(self):
+        self.dim: Optional[int] = None
+        self._key_to_row: Dict[str, int] = {}
+        self._index_offset = 0
+        self._index_inode = None
+        self._num_rows = 0
+        self._matrix: Optional[np.ndarray] = None
+
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(np.float32).itemsize
+
+    def _refresh(self):
+        """Read index lines appended by any process and remap the matrix. Requires the file lock."""
+        if not os.path.exists(self.index_path):
+            self._reset_state()
+            return
+        stat = os.stat(self.index_path)
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+            # The index was rewritten by a compaction, so every row may have moved.
+            self._reset_state()
+            self._index_inode = stat.st_ino
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                self.dim = json.load(f)["dim"]
+        if stat.st_size > self._index_offset:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_offset)
+                chunk = f.read()
+            # Only consume complete lines; a partially written line is picked up next time.
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].decode("utf-8").splitlines():
+                key, row = line.split("\t")
+                row = int(row)
+                self._key_to_row[key] = row
+                self._num_rows = max(self._num_rows, row + 1)
+            self._index_offset += end
+        if self._num_rows and (
+            self._matrix is None or self._matrix.shape[0] < self._num_rows
+        ):
+            num_rows = os.path.getsize(self.vectors_path) // self._row_bytes()
+            self._matrix = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(num_rows, self.dim),
+            )
+
+    def __len__(self):
+        with self._thread_lock, self._file_lock:
+            self._refresh()
+            return len(self._key_to_row)
+
+    def get(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up the embeddings of `texts`.
+
+        Returns:
+            List[Optional[np.ndarray]]: A read-only float32 row for each stored text, None otherwise.
+        """
+        keys = [self._hash(text) for text in texts]
+        with self._thread_lock:
+            if any(key not in self._key_to_row for key in keys):
+                with self._file_lock:
+                    self._refresh()
+            results = []
+            for key in keys:
+                row = self._key_to_row.get(key)
+                results.append(None if row is None else np.asarray(self._matrix[row]))
+            num_hits = sum(result is not None for result in results)
+            self.hits += num_hits
+            self.misses += len(results) - num_hits
+        return results
+
+    def put(self, texts: List[str], embeddings: np.ndarray):
+        """Append the embeddings of `texts` that are not stored yet."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._thread_lock, self._file_lock:
+            self._refresh()
+            new_keys, new_rows = [], []
+            for text, embedding in zip(texts, embeddings):
+                key = self._hash(text)
+                if key not in self._key_to_row and key not in new_keys:
+                    new_keys.append(key)
+                    new_rows.append(embedding)
+            if not new_keys:
+                return
+
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match the store dimension {self.dim}."
+                )
+
+            # Rows after the last indexed one may be left over from an interrupted write;
+            # they are unreferenced, so appending after them is safe.
+            size = (
+                os.path.getsize(self.vectors_path)
+                if os.path.exists(self.vectors_path)
+                else 0
+            )
+            start_row = -(-size // self._row_bytes())
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(start_row * self._row_bytes())
+                f.write(np.stack(new_rows).tobytes())
+            # The index is written after the vectors, so it never refers to a missing row.
+            with open(self.index_path, "ab") as f:
+                f.write(
+                    "".join(
+                        f"{key}\t{start_row + i}\n" for i, key in enumerate(new_keys)
+                    ).encode("utf-8")
+                )
+            self._refresh()
+
+            if os.path.getsize(self.vectors_path) > self.max_bytes:
+                # Leave some headroom so that the next few appends do not compact again.
+                self._compact(int(self.max_bytes * 0.75))
+
+    def compact(self, max_bytes: Optional[int] = None) -> Dict[str, int]:
+        """
+        Rewrite the store without unreferenced rows, keeping the most recently added embeddings
+        that fit into `max_bytes` (defaults to the size cap of the store).
+
+        Returns:
+            Dict[str, int]: Number of entries and bytes before and after compaction.
+        """
+        with self._thread_lock, self._file_lock:
+            self._refresh()
+            return self._compact(self.max_bytes if max_bytes is None else max_bytes)
+
+    def _compact(self, max_bytes: int) -> Dict[str, int]:
+        bytes_before = (
+            os.path.getsize(self.vectors_path)
+            if os.path.exists(self.vectors_path)
+            else 0
+        )
+        stats = {"entries_before": len(self._key_to_row), "bytes_before": bytes_before}
+        if self.dim is None:
+            return {**stats, "entries_after": 0, "bytes_after": bytes_before}
+
+        max_rows = max_bytes // self._row_bytes()
+        entries = sorted(self._key_to_row.items(), key=lambda x: x[1])
+        entries = entries[-max_rows:] if max_rows > 0 else []
+
+        tmp_vectors_path = self.vectors_path + ".tmp"
+        tmp_index_path = self.index_path + ".tmp"
+        with open(tmp_vectors_path, "wb") as fv, open(tmp_index_path, "wb") as fi:
+            for start in range(0, len(entries), 4096):
+                chunk = entries[start : start + 4096]
+                rows = np.array([row for _, row in chunk], dtype=np.int64)
+                fv.write(np.ascontiguousarray(self._matrix[rows]).tobytes())
+                fi.write(
+                    "".join(
+                        f"{key}\t{start + i}\n" for i, (key, _) in enumerate(chunk)
+                    ).encode("utf-8")
+                )
+        self._matrix = None
+        os.replace(tmp_vectors_path, self.vectors_path)
+        os.replace(tmp_index_path, self.index_path)
+        self._reset_state()
+        self._refresh()
+        return {
+            **stats,
+            "entries_after": len(self._key_to_row),
+            "bytes_after": os.path.getsize(self.vectors_path),
+        }
+
+    def get_stats(self, reset: bool = False) -> Dict[str, int]:
+        """
+        Returns hit/miss counters and the current size of the store.
+
+        Args:
+            reset (bool): If True, resets the hit/miss counters after retrieval.
+        """
+        with self._thread_lock:
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._key_to_row),
+                "bytes": (
+                    os.path.getsize(self.vectors_path)
+                    if os.path.exists(self.vectors_path)
+                    else 0
+                ),
+            }
+            if reset:
+                self.hits = self.misses = 0
+        return stats
+
 
 class Encoder:
     """
@@ -45,7 +414,11 @@ class Encoder:
 
     Features:
         - Support for multiple embedding models (e.g., OpenAI, Azure).
+        - Batched requests: texts are packed into size- and token-bounded batches so that
+          one API call embeds many texts, and several batches are sent concurrently.
         - Parallel processing for faster embedding generation.
+        - In-memory LRU cache of float32 embeddings, checked before the LiteLLM disk cache.
+        - Optional persistent, memory-mapped embedding store shared across processes.
         - Local disk caching to store and reuse embedding results.
         - Total token usage tracking for cost monitoring.
 
@@ -54,12 +427,23 @@ class Encoder:
         https://docs.litellm.ai/docs/embedding/supported_embedding
     """
 
+    # Input limit of the OpenAI embedding models, used if LiteLLM does not know the model.
+    DEFAULT_MAX_INPUT_TOKENS = 8191
+
     def __init__(
         self,
         encoder_type: Optional[str] = None,
         api_key: Optional[str] = None,
         api_base: Optional[str] = None,
         api_version: Optional[str] = None,
+        batch_size: int = 64,
+        max_batch_tokens: int = 50000,
+        max_retries: int = 3,
+        max_input_tokens: Optional[int] = None,
+        on_failure: Literal["zero", "nan", "raise"] = "zero",
+        cache_max_bytes: int = 256 * 1024 * 1024,
+        embedding_store_dir: Optional[str] = None,
+        embedding_store_max_bytes: int = 2 * 1024 * 1024 * 1024,
     ):
         """
         Initializes the Encoder with the appropriate embedding model.
@@ -69,10 +453,41 @@ class Encoder:
             api_key (Optional[str]): API key for the encoder service.
             api_base (Optional[str]): API base URL for the encoder service.
             api_version (Optional[str]): API version for the encoder service.
+            batch_size (int): Maximum number of texts sent in one embedding request. Set to 1 to
+                send one request per text.
+            max_batch_tokens (int): Approximate upper bound on the number of tokens in one
+                embedding request.
+            max_retries (int): Number of times a failed request is retried before giving up. A
+                batch that still fails is split in halves that are sent separately, down to single
+                texts, so that one invalid text does not fail the whole batch.
+            max_input_tokens (Optional[int]): Texts longer than this are truncated before they are
+                sent. Defaults to the input limit of the embedding model reported by LiteLLM.
+            on_failure (str): What to do with texts that still fail after retries when encoding a
+                list. 'zero' fills their rows with zeros (cosine similarity 0 to everything), 'nan'
+                fills them with NaN, and 'raise' raises a RuntimeError. Rows are filled even if
+                every text fails, as long as the embedding dimension is known from an earlier
+                embedding, the persistent store or LiteLLM's model info.
+            cache_max_bytes (int): Memory budget of the in-memory embedding cache. Set to 0 to
+                disable the cache.
+            embedding_store_dir (Optional[str]): Directory of the persistent embedding store. If
+                None, embeddings are not persisted beyond the LiteLLM disk cache.
+            embedding_store_max_bytes (int): Size cap of the persistent embedding store.
         """
         self.embedding_model_name = None
         self.kargs = {}
         self.total_token_usage = 0
+        self.batch_size = max(1, batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        if on_failure not in ("zero", "nan", "raise"):
+            raise ValueError(
+                f"Unsupported on_failure '{on_failure}'. Supported values are 'zero', 'nan', 'raise'."
+            )
+        self.on_failure = on_failure
+        self._token_usage_lock = threading.Lock()
+        self.embedding_cache = (
+            EmbeddingCache(max_bytes=cache_max_bytes) if cache_max_bytes > 0 else None
+        )
 
         # Initialize the appropriate embedding model
         encoder_type = encoder_type or os.getenv("ENCODER_API_TYPE")
@@ -94,6 +509,39 @@ class Encoder:
                 f"Unsupported ENCODER_API_TYPE '{encoder_type}'. Supported types are 'openai', 'azure', 'together'."
             )
 
+        self.max_input_tokens = max_input_tokens or self._get_model_info(
+            "max_input_tokens", self.DEFAULT_MAX_INPUT_TOKENS
+        )
+        # Set from the first embedding; used to fill the rows of failed texts.
+        self.embedding_dim: Optional[int] = None
+        self._token_counter = None
+
+        self.embedding_store = (
+            EmbeddingStore(
+                store_dir=embedding_store_dir,
+                model_name=self.embedding_model_name,
+                max_bytes=embedding_store_max_bytes,
+            )
+            if embedding_store_dir
+            else None
+        )
+
+    def _get_model_info(self, key: str, default):
+        """Returns an entry of LiteLLM's model info for the embedding model, or `default` if it is unknown."""
+        try:
+            value = litellm.get_model_info(self.embedding_model_name).get(key)
+        except Exception:
+            value = None
+        return value if isinstance(value, int) and value > 0 else default
+
+    def _get_embedding_dim(self) -> Optional[int]:
+        """Returns the embedding dimension of the model if any embedding or the model info tells it."""
+        if self.embedding_dim is None and self.embedding_store is not None:
+            self.embedding_dim = self.embedding_store.dim
+        if self.embedding_dim is None:
+            self.embedding_dim = self._get_model_info("output_vector_size", None)
+        return self.embedding_dim
+
     def get_total_token_usage(self, reset: bool = False) -> int:
         """
         Retrieves the total token usage.
@@ -109,18 +557,95 @@ class Encoder:
             self.total_token_usage = 0
         return token_usage
 
+    def get_cache_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Retrieves the hit/miss counters of the in-memory embedding cache and the persistent store.
+
+        Args:
+            reset (bool): If True, resets the counters after retrieval.
+
+        Returns:
+            Dict[str, Dict[str, int]]: Statistics under the keys 'memory' and 'store'; disabled
+            caches are omitted.
+        """
+        stats = {}
+        if self.embedding_cache is not None:
+            stats["memory"] = self.embedding_cache.get_stats(reset=reset)
+        if self.embedding_store is not None:
+            stats["store"] = self.embedding_store.get_stats(reset=reset)
+        return stats
+
     def encode(self, texts: Union[str, List[str]], max_workers: int = 5) -> np.ndarray:
         """
         Public method to get embeddings for the given texts.
 
         Args:
             texts (Union[str, List[str]]): A single text string or a list of text strings to embed.
+            max_workers (int): The maximum number of requests in flight at the same time.
 
         Returns:
             np.ndarray: The array of embeddings.
         """
         return self._get_text_embeddings(texts, max_workers=max_workers)
 
+    def _truncate_input(self, text: str) -> str:
+        """Truncate `text` to the input limit of the embedding model, which would reject it otherwise."""
+        # A token covers at least one byte, so shorter texts never need to be tokenized.
+        if len(text.encode("utf-8")) <= self.max_input_tokens:
+            return text
+        if self._token_counter is None:
+            from .utils import TokenCounter
+
+            self._token_counter = TokenCounter(self.embedding_model_name)
+        truncated = self._token_counter.truncate(text, self.max_input_tokens)
+        if len(truncated) < len(text):
+            logging.warning(
+                f"Truncated a text of {len(text)} characters to the {self.max_input_tokens}-token input limit of {self.embedding_model_name}."
+            )
+        return truncated
+
+    @staticmethod
+    def _estimate_num_tokens(text: str) -> int:
+        """Cheap token count estimate (~4 characters per token) used for batch packing."""
+        return len(text) // 4 + 1
+
+    def _make_batches(self, texts: List[str]) -> List[Tuple[int, List[str]]]:
+        """
+        Pack texts into consecutive batches bounded by `batch_size` and `max_batch_tokens`.
+
+        Returns:
+            List[Tuple[int, List[str]]]: The start offset of each batch in `texts` and the batch itself.
+        """
+        batches = []
+        start, current, current_tokens = 0, [], 0
+        for idx, text in enumerate(texts):
+            num_tokens = self._estimate_num_tokens(text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_tokens + num_tokens > self.max_batch_tokens
+            ):
+                batches.append((start, current))
+                start, current, current_tokens = idx, [], 0
+            current.append(text)
+            current_tokens += num_tokens
+        if current:
+            batches.append((start, current))
+        return batches
+
+    def _with_retry(self, func, *args):
+        """Call `func(*args)`, retrying with exponential backoff and jitter on failure."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait_time = min(2**attempt, 30) * (0.5 + random.random())
+                logging.warning(
+                    f"Embedding request failed ({e}). Retrying in {wait_time:.1f} seconds."
+                )
+                time.sleep(wait_time)
+
     def _get_single_text_embedding(self, text):
         response = litellm.embedding(
             model=self.embedding_model_name, input=text, caching=True, **self.kargs
@@ -129,50 +654,457 @@ class Encoder:
         token_usage = response.get("usage", {}).get("total_tokens", 0)
         return text, embedding, token_usage
 
+    def _get_batch_embeddings(self, batch: List[str]):
+        response = litellm.embedding(
+            model=self.embedding_model_name, input=batch, caching=True, **self.kargs
+        )
+        # The API may return items out of order; `index` refers to the position in `batch`.
+        data = sorted(response.data, key=lambda x: x["index"])
+        embeddings = [item["embedding"] for item in data]
+        if len(embeddings) != len(batch):
+            raise ValueError(
+                f"Expected {len(batch)} embeddings but received {len(embeddings)}."
+            )
+        token_usage = response.get("usage", {}).get("total_tokens", 0)
+        return embeddings, token_usage
+
+    def _get_batch_embeddings_or_bisect(
+        self, batch: List[str], retry: bool = True
+    ) -> Tuple[List[Optional[List[float]]], int]:
+        """
+        Embed `batch`, splitting it in halves that are embedded separately if it fails.
+
+        A failing batch is retried as a whole first. Its halves are sent once each, and only single
+        texts are retried again, so one invalid text costs a few extra requests instead of the
+        embeddings of the whole batch.
+
+        Returns:
+            Tuple[List[Optional[List[float]]], int]: The embedding of each text in `batch`, or None
+            if the text could not be embedded, and the number of tokens used.
+        """
+        try:
+            if retry or len(batch) == 1:
+                return self._with_retry(self._get_batch_embeddings, batch)
+            return self._get_batch_embeddings(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logging.error(
+                    f"Failed to embed text starting with: {batch[0][:100]!r}. {e}"
+                )
+                return [None], 0
+            logging.warning(
+                f"Failed to embed a batch of {len(batch)} texts, splitting it. {e}"
+            )
+        middle = len(batch) // 2
+        left, left_tokens = self._get_batch_embeddings_or_bisect(
+            batch[:middle], retry=False
+        )
+        right, right_tokens = self._get_batch_embeddings_or_bisect(
+            batch[middle:], retry=False
+        )
+        return left + right, left_tokens + right_tokens
+
+    def _get_unique_text_embeddings(
+        self, texts: List[str], max_workers: int = 5
+    ) -> List[Optional[List[float]]]:
+        """
+        Embed distinct `texts`, sending up to `max_workers` requests at once.
+
+        Texts are truncated to the input limit of the model first. When `batch_size` > 1, texts are
+        sent in batches and each batch is retried independently, so one failing batch does not
+        resend the others; a batch that keeps failing is bisected down to its failing texts.
+
+        Returns:
+            List[Optional[List[float]]]: The embedding at the position of each text, or None if
+            the text could not be embedded.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        total_tokens = 0
+        inputs = [self._truncate_input(text) for text in texts]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if self.batch_size > 1:
+                futures = {
+                    executor.submit(self._get_batch_embeddings_or_bisect, batch): (
+                        start,
+                        len(batch),
+                    )
+                    for start, batch in self._make_batches(inputs)
+                }
+            else:
+                futures = {
+                    executor.submit(
+                        self._with_retry, self._get_single_text_embedding, text
+                    ): (idx, 1)
+                    for idx, text in enumerate(inputs)
+                }
+
+            for future in as_completed(futures):
+                start, size = futures[future]
+                try:
+                    if self.batch_size > 1:
+                        embeddings, tokens = future.result()
+                    else:
+                        _, embedding, tokens = future.result()
+                        embeddings = [embedding]
+                    results[start : start + size] = embeddings
+                    total_tokens += tokens
+                except Exception as e:
+                    logging.error(
+                        f"Failed to embed {size} text(s) starting with: {texts[start][:100]!r}. {e}"
+                    )
+
+        with self._token_usage_lock:
+            self.total_token_usage += total_tokens
+        return results
+
+    def _lookup_embeddings(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up `texts` in the in-memory cache, then in the persistent store."""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        if self.embedding_cache is not None:
+            results = [
+                self.embedding_cache.get((self.embedding_model_name, text))
+                for text in texts
+            ]
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if missing and self.embedding_store is not None:
+            stored = self.embedding_store.get([texts[idx] for idx in missing])
+            for idx, vector in zip(missing, stored):
+                if vector is not None:
+                    results[idx] = vector
+                    if self.embedding_cache is not None:
+                        self.embedding_cache.put(
+                            (self.embedding_model_name, texts[idx]), vector
+                        )
+        return results
+
+    def _save_embeddings(
+        self, texts: List[str], embeddings: List[List[float]]
+    ) -> List[np.ndarray]:
+        """Add new embeddings to the in-memory cache and the persistent store."""
+        vectors = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            self.embedding_dim = vector.shape[0]
+            # Cached rows are shared between callers, so they must not be modified in place.
+            vector.flags.writeable = False
+            if self.embedding_cache is not None:
+                self.embedding_cache.put((self.embedding_model_name, text), vector)
+            vectors.append(vector)
+        if self.embedding_store is not None and vectors:
+            try:
+                self.embedding_store.put(texts, np.stack(vectors))
+            except Exception as e:
+                logging.error(f"Failed to persist embeddings: {e}")
+        return vectors
+
     def _get_text_embeddings(
         self,
         texts: Union[str, List[str]],
         max_workers: int = 5,
-    ) -> Tuple[np.ndarray, int]:
+    ) -> np.ndarray:
         """
-        Get text embeddings using OpenAI's text-embedding-3-small model.
+        Get text embeddings using the configured embedding model.
+
+        Texts found in the in-memory cache or the persistent store are served without any request. The remaining
+        identical texts are embedded once and the vector is copied to every position where the
+        text appears. Texts that could not be embedded are handled according to `on_failure`, so
+        row i of the result always corresponds to texts[i].
 
         Args:
             texts (Union[str, List[str]]): A single text string or a list of text strings to embed.
             max_workers (int): The maximum number of workers for parallel processing.
-            api_key (str): The API key for accessing OpenAI's services.
-            embedding_cache (Optional[Dict[str, np.ndarray]]): A cache to store previously computed embeddings.
 
         Returns:
-            Tuple[np.ndarray, int]: The 2D array of embeddings and the total token usage.
+            np.ndarray: A 1D float32 embedding for a single text, or a 2D float32 array with one
+            row per input text.
         """
 
         if isinstance(texts, str):
-            _, embedding, tokens = self._get_single_text_embedding(texts)
-            self.total_token_usage += tokens
-            return np.array(embedding)
+            cached = self._lookup_embeddings([texts])[0]
+            if cached is not None:
+                return cached
+            _, embedding, tokens = self._with_retry(
+                self._get_single_text_embedding, self._truncate_input(texts)
+            )
+            with self._token_usage_lock:
+                self.total_token_usage += tokens
+            return self._save_embeddings([texts], [embedding])[0]
 
-        embeddings = []
-        total_tokens = 0
+        if len(texts) == 0:
+            return np.array([])
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(self._get_single_text_embedding, text): text
-                for text in texts
-            }
+        # dict preserves insertion order, so this deduplicates in linear time.
+        text_to_row = {}
+        for text in texts:
+            text_to_row.setdefault(text, len(text_to_row))
+        unique_texts = list(text_to_row)
+        unique_embeddings = self._lookup_embeddings(unique_texts)
+        missing_rows = [
+            row for row, embedding in enumerate(unique_embeddings) if embedding is None
+        ]
+        if missing_rows:
+            fetched = self._get_unique_text_embeddings(
+                [unique_texts[row] for row in missing_rows], max_workers=max_workers
+            )
+            fetched_rows = [
+                row
+                for row, embedding in zip(missing_rows, fetched)
+                if embedding is not None
+            ]
+            vectors = self._save_embeddings(
+                [unique_texts[row] for row in fetched_rows],
+                [embedding for embedding in fetched if embedding is not None],
+            )
+            for row, vector in zip(fetched_rows, vectors):
+                unique_embeddings[row] = vector
+
+        failed = [
+            text
+            for text, embedding in zip(unique_texts, unique_embeddings)
+            if embedding is None
+        ]
+        dim = (
+            next((len(e) for e in unique_embeddings if e is not None), None)
+            or self._get_embedding_dim()
+        )
+        if failed and (self.on_failure == "raise" or dim is None):
+            # Without any embedding of the model, the shape of the fill rows is unknown.
+            raise RuntimeError(
+                f"Failed to embed {len(failed)} out of {len(unique_texts)} distinct texts."
+            )
+
+        fill_value = np.nan if self.on_failure == "nan" else 0.0
+        unique_matrix = np.full((len(unique_texts), dim), fill_value, dtype=np.float32)
+        for row, embedding in enumerate(unique_embeddings):
+            if embedding is not None:
+                unique_matrix[row] = embedding
+
+        return unique_matrix[[text_to_row[text] for text in texts]]
+
+
+def l2_normalize(matrix) -> np.ndarray:
+    """Returns `matrix` as float32 with every row scaled to unit length; all-zero rows stay zero."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """
+    Base class of the cosine-similarity indexes used to rank collected information.
+
+    Vectors are identified by their insertion order and can be added in several calls, so an index
+    can grow together with the information it covers. Subclasses implement `_add` and `_search`
+    on unit-normalized float32 vectors.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add(self, vectors: np.ndarray, normalized: bool = False):
+        """
+        Appends vectors to the index. Their ids continue from the current size of the index.
+
+        Args:
+            vectors (np.ndarray): 2D array with one vector per row.
+            normalized (bool): Set to True if the rows are already unit-normalized float32, which
+                lets the exact index keep a reference (e.g., to a memory map) instead of a copy.
+        """
+        vectors = np.asarray(vectors)
+        if vectors.size == 0:
+            return
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}."
+            )
+        if not normalized or vectors.dtype != np.float32:
+            vectors = l2_normalize(vectors)
+        with self._lock:
+            self._add(vectors)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k most similar vectors for every query.
+
+        Args:
+            queries (np.ndarray): 1D query vector or 2D array with one query per row.
+            k (int): Number of neighbours to return per query; capped at the size of the index.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Cosine similarities and ids, both of shape (num_queries, k),
+            ordered from most to least similar.
+        """
+        queries = l2_normalize(np.atleast_2d(queries))
+        k = min(k, len(self))
+        if k <= 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        return self._search(queries, k)
+
+    def _add(self, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+
+class ExactVectorIndex(VectorIndex):
+    """Brute-force index that scores every query against every vector with one matrix product."""
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self._chunks: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _add(self, vectors: np.ndarray):
+        self._chunks.append(vectors)
+        self._size += vectors.shape[0]
+        self._matrix = None
+
+    def _get_matrix(self) -> np.ndarray:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = (
+                    self._chunks[0]
+                    if len(self._chunks) == 1
+                    else np.concatenate(self._chunks)
+                )
+                self._chunks = [self._matrix]
+            return self._matrix
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sim = queries @ self._get_matrix().T
+        # Only the k best candidates of every row are sorted.
+        ids = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(sim, ids, axis=1)
+        order = np.argsort(-scores, axis=1)
+        return (
+            np.take_along_axis(scores, order, axis=1),
+            np.take_along_axis(ids, order, axis=1),
+        )
+
+
+class HNSWVectorIndex(VectorIndex):
+    """
+    Approximate index backed by an HNSW graph from `hnswlib`.
+
+    Vectors are inserted into the graph as they are added, so the index never has to be rebuilt
+    from scratch. Use `recall_at_k` against an `ExactVectorIndex` to choose `ef_search` and `M`.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        initial_capacity: int = 1024,
+    ):
+        """
+        Args:
+            dim (int): Dimension of the vectors.
+            M (int): Number of graph links per vector. Higher values raise recall and memory usage.
+            ef_construction (int): Candidate list size while inserting. Higher values build a better
+                graph more slowly.
+            ef_search (int): Candidate list size while searching. Higher values raise recall and
+                latency; it is raised to k automatically when needed.
+            initial_capacity (int): Number of vectors to allocate for; the graph doubles its
+                capacity when it is full.
+        """
+        super().__init__(dim)
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("HNSWVectorIndex requires `pip install hnswlib`.")
+        self.ef_search = ef_search
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(
+            max_elements=max(initial_capacity, 1), ef_construction=ef_construction, M=M
+        )
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _add(self, vectors: np.ndarray):
+        required = self._size + vectors.shape[0]
+        capacity = self._index.get_max_elements()
+        if required > capacity:
+            self._index.resize_index(max(required, 2 * capacity))
+        self._index.add_items(vectors, np.arange(self._size, required, dtype=np.int64))
+        self._size = required
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            self._index.set_ef(max(self.ef_search, k))
+            ids, distances = self._index.knn_query(queries, k=k)
+        # hnswlib reports 1 - inner product for the "ip" space.
+        return (1.0 - distances).astype(np.float32), ids.astype(np.int64)
+
+
+def create_vector_index(backend: str, dim: int, **kwargs) -> VectorIndex:
+    """
+    Creates an empty vector index.
+
+    Args:
+        backend (str): "exact" for brute-force numpy search or "hnsw" for an approximate
+            HNSW graph (requires `hnswlib`).
+        dim (int): Dimension of the vectors.
+        **kwargs: Passed to the index class, e.g. `ef_search` for "hnsw".
+    """
+    if backend == "exact":
+        return ExactVectorIndex(dim, **kwargs)
+    if backend == "hnsw":
+        return HNSWVectorIndex(dim, **kwargs)
+    raise ValueError(f"Unknown vector index backend: {backend}")
+
+
+def recall_at_k(
+    index: VectorIndex, exact_index: ExactVectorIndex, queries: np.ndarray, k: int
+) -> float:
+    """
+    Returns the fraction of the exact top-k neighbours that `index` also returns, averaged over queries.
+
+    Both indexes must contain the same vectors in the same order.
+    """
+    _, approximate_ids = index.search(queries, k)
+    _, exact_ids = exact_index.search(queries, k)
+    if exact_ids.size == 0:
+        return 1.0
+    found = sum(
+        len(set(approximate_row.tolist()) & set(exact_row.tolist()))
+        for approximate_row, exact_row in zip(approximate_ids, exact_ids)
+    )
+    return found / exact_ids.size
 
-            for future in as_completed(futures):
-                try:
-                    text, embedding, tokens = future.result()
-                    embeddings.append((text, embedding, tokens))
-                    total_tokens += tokens
-                except Exception as e:
-                    print(f"An error occurred for text: {futures[future]}")
-                    print(e)
 
-        # Sort results to match the order of the input texts
-        embeddings.sort(key=lambda x: texts.index(x[0]))
-        embeddings = [result[1] for result in embeddings]
-        self.total_token_usage += total_tokens
+if __name__ == "__main__":
+    import argparse
 
-        return np.array(embeddings)
+    parser = argparse.ArgumentParser(
+        description="Compact a persistent embedding store."
+    )
+    parser.add_argument("store_dir", help="Root directory of the embedding store.")
+    parser.add_argument(
+        "--model",
+        required=True,
+        help="Embedding model name, e.g. text-embedding-3-small.",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=None,
+        help="Keep the most recently added embeddings that fit into this many bytes.",
+    )
+    args = parser.parse_args()
+    store = EmbeddingStore(store_dir=args.store_dir, model_name=args.model)
+    print(store.compact(max_bytes=args.max_bytes))
@@ -1,4 +1,6 @@
+import asyncio
 import concurrent.futures
+import copy
 import dspy
 import functools
 import hashlib
@@ -7,9 +9,20 @@ import logging
 import time
 from abc import ABC, abstractmethod
 from collections import OrderedDict
-from typing import Dict, List, Optional, Union, TYPE_CHECKING
-
-from .utils import ArticleTextProcessing
+from typing import Callable, Dict, List, Optional, Union, TYPE_CHECKING
+
+from .lm import RecordingLM, ReplayLM
+from .utils import (
+    ArticleTextProcessing,
+    CallRecording,
+    LMHistoryBuffer,
+    LMHistorySink,
+    SingleFlight,
+    get_async_http_client,
+    get_http_session_pool,
+    has_native_aforward,
+    run_coroutine_sync,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(name)s : %(levelname)-8s : %(message)s"
@@ -269,11 +282,19 @@ class Retriever:
     def __init__(self, rm: dspy.Retrieve, max_thread: int = 1):
         self.max_thread = max_thread
         self.rm = rm
+        # Threads (e.g., personas or experts) searching the same query at the same time share one search.
+        self._single_flight = SingleFlight()
 
     def collect_and_reset_rm_usage(self):
+        """
+        Returns the number of queries sent by this retriever's retrieval module and resets it.
+
+        The HTTP session pool and the extracted-page cache are shared by all retrievers in the process, so their
+        statistics are reported by `Engine.collect_and_reset_shared_rm_stats` instead.
+        """
         combined_usage = []
-        if hasattr(getattr(self, "rm"), "get_usage_and_reset"):
-            combined_usage.append(getattr(self, "rm").get_usage_and_reset())
+        if hasattr(self.rm, "get_usage_and_reset"):
+            combined_usage.append(self.rm.get_usage_and_reset())
 
         name_to_usage = {}
         for usage in combined_usage:
@@ -282,31 +303,49 @@ class Retriever:
                     name_to_usage[model_name] = query_cnt
                 else:
                     name_to_usage[model_name] += query_cnt
+        coalesced = self._single_flight.get_coalesced_and_reset()
+        if coalesced:
+            name_to_usage["coalesced in-flight queries"] = coalesced
 
         return name_to_usage
 
+    @staticmethod
+    def _single_flight_key(query: str, exclude_urls: List[str]) -> str:
+        return json.dumps([query, sorted(exclude_urls)])
+
+    @staticmethod
+    def _to_information_list(retrieved_data_list, query: str) -> List[Information]:
+        local_to_return = []
+        for data in retrieved_data_list:
+            for i in range(len(data["snippets"])):
+                # STORM generate the article with citations. We do not consider multi-hop citations.
+                # Remove citations in the source to avoid confusion.
+                data["snippets"][i] = ArticleTextProcessing.remove_citations(
+                    data["snippets"][i]
+                )
+            storm_info = Information.from_dict(data)
+            storm_info.meta["query"] = query
+            local_to_return.append(storm_info)
+        return local_to_return
+
     def retrieve(
         self, query: Union[str, List[str]], exclude_urls: List[str] = []
     ) -> List[Information]:
+        if has_native_aforward(self.rm):
+            return run_coroutine_sync(self.aretrieve(query, exclude_urls=exclude_urls))
+
         queries = query if isinstance(query, list) else [query]
         to_return = []
 
         def process_query(q):
-            retrieved_data_list = self.rm(
-                query_or_queries=[q], exclude_urls=exclude_urls
+            retrieved_data_list = self._single_flight.do(
+                self._single_flight_key(q, exclude_urls),
+                self.rm,
+                query_or_queries=[q],
+                exclude_urls=exclude_urls,
             )
-            local_to_return = []
-            for data in retrieved_data_list:
-                for i in range(len(data["snippets"])):
-                    # STORM generate the article with citations. We do not consider multi-hop citations.
-                    # Remove citations in the source to avoid confusion.
-                    data["snippets"][i] = ArticleTextProcessing.remove_citations(
-                        data["snippets"][i]
-                    )
-                storm_info = Information.from_dict(data)
-                storm_info.meta["query"] = q
-                local_to_return.append(storm_info)
-            return local_to_return
+            # The results may be shared with other callers and are modified in place below.
+            return self._to_information_list(copy.deepcopy(retrieved_data_list), q)
 
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.max_thread
@@ -318,6 +357,43 @@ class Retriever:
 
         return to_return
 
+    async def aretrieve(
+        self, query: Union[str, List[str]], exclude_urls: List[str] = []
+    ) -> List[Information]:
+        """
+        Asynchronous version of `retrieve`.
+
+        Queries are searched concurrently, at most `max_thread` at a time. Retrieval modules with an `aforward`
+        method are awaited directly; others run in a worker thread.
+        """
+        queries = query if isinstance(query, list) else [query]
+        semaphore = asyncio.Semaphore(self.max_thread)
+        use_aforward = has_native_aforward(self.rm)
+
+        async def search(q):
+            if use_aforward:
+                return await self.rm.aforward(
+                    query_or_queries=[q], exclude_urls=exclude_urls
+                )
+            return await asyncio.to_thread(
+                self.rm, query_or_queries=[q], exclude_urls=exclude_urls
+            )
+
+        async def process_query(q):
+            async with semaphore:
+                retrieved_data_list = await self._single_flight.ado(
+                    self._single_flight_key(q, exclude_urls), search, q
+                )
+            # The results may be shared with other callers and are modified in place below.
+            return self._to_information_list(copy.deepcopy(retrieved_data_list), q)
+
+        results = await asyncio.gather(*(process_query(q) for q in queries))
+        to_return = []
+        for result in results:
+            to_return.extend(result)
+
+        return to_return
+
 
 class KnowledgeCurationModule(ABC):
     """
@@ -440,7 +516,82 @@ class LMConfigs(ABC):
                     f"Language model for {attr_name} is not initialized. Please call set_{attr_name}()"
                 )
 
+    def set_history_sink(self, history_sink: Optional[LMHistorySink]):
+        """
+        Streams the call history of all language models to `history_sink` instead of keeping it in memory.
+
+        Each language model keeps its own recent calls in memory (see `LMHistorySink.buffer`), so its
+        `inspect_history` only shows its own calls. Language models set after this call are attached the next time
+        the history is collected. Pass None to go back to in-memory history lists.
+        """
+        # Not named with '_lm' so that it is not mistaken for a language model.
+        self.history_sink = history_sink
+        self._attach_history_sink()
+
+    def _attach_history_sink(self):
+        history_sink = getattr(self, "history_sink", None)
+        for attr_name in self.__dict__:
+            if "_lm" in attr_name and hasattr(getattr(self, attr_name), "history"):
+                lm = getattr(self, attr_name)
+                attached = isinstance(lm.history, LMHistoryBuffer)
+                if history_sink is not None and not (
+                    attached and lm.history.sink is history_sink
+                ):
+                    history = history_sink.buffer()
+                    if not attached:
+                        # Keep the calls made before the sink was attached.
+                        history.extend(lm.history)
+                    lm.history = history
+                elif history_sink is None and attached:
+                    lm.history = []
+
+    def record_to(self, recording: CallRecording):
+        """
+        Records every call of every language model to `recording`, keyed by the role, for `replay_from`.
+
+        Call it before the language models are handed to a runner, as the runner's modules keep their own references.
+        """
+        for attr_name in list(self.__dict__):
+            lm = getattr(self, attr_name)
+            if "_lm" in attr_name and lm is not None:
+                setattr(self, attr_name, RecordingLM(lm, recording, name=attr_name))
+
+    def replay_from(
+        self,
+        recording: CallRecording,
+        latency_scale: float = 0.0,
+        latency_sampler: Optional[Callable[[], float]] = None,
+    ):
+        """
+        Replaces every language model recorded by `record_to` with a `ReplayLM` serving its recorded outputs.
+
+        See `ReplayLM` for the latency arguments. Call it before the language models are handed to a runner.
+        """
+        for attr_name in list(self.__dict__):
+            if "_lm" in attr_name and recording.get_config("lm", attr_name):
+                setattr(
+                    self,
+                    attr_name,
+                    ReplayLM(
+                        recording,
+                        name=attr_name,
+                        latency_scale=latency_scale,
+                        latency_sampler=latency_sampler,
+                    ),
+                )
+
+    def iter_and_reset_lm_history(self):
+        """Like `collect_and_reset_lm_history`, but reads the calls lazily from the history sink if there is one."""
+        history_sink = getattr(self, "history_sink", None)
+        if history_sink is None:
+            return self.collect_and_reset_lm_history()
+        self._attach_history_sink()
+        return history_sink.read_and_reset()
+
     def collect_and_reset_lm_history(self):
+        if getattr(self, "history_sink", None) is not None:
+            return list(self.iter_and_reset_lm_history())
+
         history = []
         for attr_name in self.__dict__:
             if "_lm" in attr_name and hasattr(getattr(self, attr_name), "history"):
@@ -472,6 +623,41 @@ class LMConfigs(ABC):
 
         return model_name_to_usage
 
+    def collect_and_reset_lm_cache_stats(self):
+        """Returns LM response cache hits and misses for each language model role and resets them."""
+        role_to_cache_stats = {}
+        for attr_name in self.__dict__:
+            if "_lm" in attr_name and hasattr(
+                getattr(self, attr_name), "get_cache_stats_and_reset"
+            ):
+                role_to_cache_stats[attr_name] = getattr(
+                    self, attr_name
+                ).get_cache_stats_and_reset()
+
+        return role_to_cache_stats
+
+    def collect_and_reset_lm_telemetry(self):
+        """
+        Returns the latency and throughput of the calls each language model role sent to its provider and resets them.
+
+        Usage is keyed by model name and summed across roles, while telemetry is kept per role to show which role
+        dominates the wall time. Roles that share one LM instance share its telemetry. For self-hosted models sent
+        through a micro-batch dispatcher, the queue depth and batch sizes are reported under "queue".
+        """
+        role_to_telemetry = {}
+        for attr_name in self.__dict__:
+            lm = getattr(self, attr_name)
+            if "_lm" not in attr_name:
+                continue
+            if hasattr(lm, "telemetry"):
+                role_to_telemetry[attr_name] = lm.telemetry.get_stats(reset=True)
+            if hasattr(lm, "dispatcher"):
+                role_to_telemetry.setdefault(attr_name, {})["queue"] = (
+                    lm.dispatcher.get_stats(reset=True)
+                )
+
+        return role_to_telemetry
+
     def log(self):
         return OrderedDict(
             {
@@ -488,6 +674,9 @@ class Engine(ABC):
         self.time = {}
         self.lm_cost = {}  # Cost of language models measured by in/out tokens.
         self.rm_cost = {}  # Cost of retrievers measured by number of queries.
+        self.rm_http_stats = {}  # Connection reuse and page cache hits of retrievers.
+        self.lm_cache_stats = {}  # LM response cache hits and misses per role.
+        self.lm_telemetry = {}  # Latency and throughput of LM calls per role.
 
     def log_execution_time_and_lm_rm_usage(self, func):
         """Decorator to log the execution time, language model usage, and retrieval model usage of a function."""
@@ -501,14 +690,57 @@ class Engine(ABC):
             self.time[func.__name__] = execution_time
             logger.info(f"{func.__name__} executed in {execution_time:.4f} seconds")
             self.lm_cost[func.__name__] = self.lm_configs.collect_and_reset_lm_usage()
+            self.lm_cache_stats[func.__name__] = (
+                self.lm_configs.collect_and_reset_lm_cache_stats()
+            )
+            self.lm_telemetry[func.__name__] = (
+                self.lm_configs.collect_and_reset_lm_telemetry()
+            )
             if hasattr(self, "retriever"):
                 self.rm_cost[func.__name__] = (
                     self.retriever.collect_and_reset_rm_usage()
                 )
+                self.rm_http_stats[func.__name__] = (
+                    self.collect_and_reset_shared_rm_stats()
+                )
             return result
 
         return wrapper
 
+    def collect_and_reset_shared_rm_stats(self):
+        """
+        Returns how many HTTP requests of the retrieval modules reused a pooled connection and the extracted-page
+        cache hit rate, and resets them.
+
+        The HTTP clients and the extracted-page cache are shared by all retrievers in the process, so they are
+        reported once per pipeline stage here rather than by each `Retriever`.
+        """
+        # Wrapped retrieval modules (e.g., `CachedRM`) expose the module that fetches pages via `rm`.
+        rm = getattr(getattr(self, "retriever", None), "rm", None)
+        webpage_helper = getattr(rm, "webpage_helper", None) or getattr(
+            getattr(rm, "rm", None), "webpage_helper", None
+        )
+        # Blocking searches, async searches and page downloads each go through their own connection pool.
+        http_clients = [get_http_session_pool(), get_async_http_client()]
+        if webpage_helper is not None:
+            http_clients.append(webpage_helper.http_client)
+        requests = reused_connections = 0
+        for http_client in http_clients:
+            for host_stats in http_client.get_stats(reset=True).values():
+                requests += host_stats["requests"]
+                reused_connections += host_stats["reused_connections"]
+        stats = {}
+        if requests:
+            stats["HTTP requests"] = requests
+            stats["reused HTTP connections"] = reused_connections
+        page_cache = getattr(webpage_helper, "page_cache", None)
+        if page_cache is not None:
+            page_stats = page_cache.get_stats(reset=True)
+            if page_stats["hit_rate"] is not None:
+                stats["extracted page cache hit rate"] = page_stats["hit_rate"]
+                stats["extracted page cache bytes saved"] = page_stats["bytes_saved"]
+        return stats
+
     def apply_decorators(self):
         """Apply decorators to methods that need them."""
         methods_to_decorate = [
@@ -556,10 +788,36 @@ class Engine(ABC):
         for k, v in self.rm_cost.items():
             print(f"{k}: {v}")
 
+        print("***** HTTP and page cache statistics of retrieval models: *****")
+        for k, v in self.rm_http_stats.items():
+            print(f"{k}: {v}")
+
+        print("***** LM response cache hits and misses: *****")
+        for k, v in self.lm_cache_stats.items():
+            print(f"{k}")
+            for role, stats in v.items():
+                print(f"    {role}: {stats}")
+
+        print("***** Latency of language model calls: *****")
+        for k, v in self.lm_telemetry.items():
+            print(f"{k}")
+            for role, stats in v.items():
+                if stats.get("calls"):
+                    print(
+                        f"    {role}: {stats['calls']} calls, "
+                        f"total {stats['total_latency_seconds']}s, "
+                        f"p50 {stats['p50_latency_seconds']}s, "
+                        f"p90 {stats['p90_latency_seconds']}s, "
+                        f"queued {stats['total_queue_seconds']}s"
+                    )
+
     def reset(self):
         self.time = {}
         self.lm_cost = {}
         self.rm_cost = {}
+        self.rm_http_stats = {}
+        self.lm_cache_stats = {}
+        self.lm_telemetry = {}
 
 
 class Agent(ABC):
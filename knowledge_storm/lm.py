@@ -1,14 +1,24 @@
+import asyncio
 import backoff
+import concurrent.futures
 import dspy
-import functools
+import hashlib
+import json
 import logging
 import os
 import random
+import re
 import requests
 import threading
-from typing import Optional, Literal, Any
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Literal, Any, Callable, Dict, List
 import ujson
 from pathlib import Path
+from types import SimpleNamespace
 
 
 from dsp import ERRORS, backoff_hdlr, giveup_hdlr
@@ -37,11 +47,6 @@ with warnings.catch_warnings():
     litellm.drop_params = True
     litellm.telemetry = False
 
-from litellm.caching.caching import Cache
-
-disk_cache_dir = os.path.join(Path.home(), ".storm_local_cache")
-litellm.cache = Cache(disk_cache_dir=disk_cache_dir, type="disk")
-
 # except ImportError:
 
 #     class LitellmPlaceholder:
@@ -51,7 +56,6 @@ litellm.cache = Cache(disk_cache_dir=disk_cache_dir, type="disk")
 #             )
 
 # litellm = LitellmPlaceholder()
-LM_LRU_CACHE_MAX_SIZE = 3000
 
 
 class LM:
@@ -62,11 +66,22 @@ class LM:
         temperature=0.0,
         max_tokens=1000,
         cache=True,
+        cache_namespace: Optional[str] = None,
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         self.model = model
         self.model_type = model_type
         self.cache = cache
+        # Part of every cache key, e.g. a prompt-template version, so that changed prompts do not reuse old responses.
+        self.cache_namespace = cache_namespace
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache_stats_lock = threading.Lock()
+        # Shared by every LM instance of this model; see `get_rate_limiter`.
+        self.rate_limiter = get_rate_limiter(model, rpm=rpm_limit, tpm=tpm_limit)
+        self.telemetry = LMCallTelemetry()
         self.kwargs = dict(temperature=temperature, max_tokens=max_tokens, **kwargs)
         self.history = []
 
@@ -75,25 +90,146 @@ class LM:
                 max_tokens >= 5000 and temperature == 1.0
             ), "OpenAI's o1-* models require passing temperature=1.0 and max_tokens >= 5000 to `dspy.LM(...)`"
 
+    def _completion(self, messages, kwargs, cache: bool) -> Dict[str, Any]:
+        """Returns the response as a dict, served from the LM response cache when possible."""
+        request = dict(model=self.model, messages=messages, **kwargs)
+        completion = (
+            litellm_completion if self.model_type == "chat" else litellm_text_completion
+        )
+        stream_callback = _stream_callback.get()
+        # Only chat completions are streamed; other responses reach the callback in one piece.
+        streaming = stream_callback is not None and self.model_type == "chat"
+        if not cache:
+            response = self._send(
+                completion, request, stream_callback if streaming else None
+            )
+        else:
+            key, response = self._lookup_cache(request)
+            if response is None and streaming:
+                # Not coalesced, since the callers waiting for it would not receive the chunks.
+                response = self._send_and_cache(
+                    completion, request, key, stream_callback
+                )
+            elif response is None:
+                # Identical requests from other threads wait for this one instead of calling the provider again.
+                response = get_lm_single_flight().do(
+                    key, self._send_and_cache, completion, request, key
+                )
+                streaming = False
+            else:
+                streaming = False
+        if stream_callback is not None and not streaming:
+            _send_whole_response_to_stream(response, stream_callback)
+        return response
+
+    async def _acompletion(self, messages, kwargs, cache: bool) -> Dict[str, Any]:
+        """Async version of `_completion`."""
+        request = dict(model=self.model, messages=messages, **kwargs)
+        completion = (
+            litellm_acompletion
+            if self.model_type == "chat"
+            else litellm_atext_completion
+        )
+        stream_callback = _stream_callback.get()
+        streaming = stream_callback is not None and self.model_type == "chat"
+        if not cache:
+            response = await self._asend(
+                completion, request, stream_callback if streaming else None
+            )
+        else:
+            # The disk tier of the cache may wait for the SQLite lock, which must not block the event loop.
+            key, response = await asyncio.to_thread(self._lookup_cache, request)
+            if response is None and streaming:
+                response = await self._asend_and_cache(
+                    completion, request, key, stream_callback
+                )
+            elif response is None:
+                response = await get_lm_single_flight().ado(
+                    key, self._asend_and_cache, completion, request, key
+                )
+                streaming = False
+            else:
+                streaming = False
+        if stream_callback is not None and not streaming:
+            _send_whole_response_to_stream(response, stream_callback)
+        return response
+
+    def _lookup_cache(self, request: Dict[str, Any]):
+        response_cache = get_lm_response_cache()
+        key = response_cache.make_key(
+            request, namespace=self.cache_namespace, model_type=self.model_type
+        )
+        response = response_cache.get(key)
+        with self._cache_stats_lock:
+            if response is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        return key, response
+
+    def _send(
+        self, completion, request: Dict[str, Any], stream_callback=None
+    ) -> Dict[str, Any]:
+        tokens = estimate_request_tokens(request["messages"], request.get("max_tokens"))
+        with self.rate_limiter.limit(tokens, telemetry=self.telemetry) as slot:
+            if stream_callback is None:
+                response = completion(ujson.dumps(request))
+            else:
+                response = litellm_stream_completion(
+                    ujson.dumps(request), _on_chunk(slot, stream_callback)
+                )
+            slot.headers = _litellm_response_headers(response)
+            response = _response_to_dict(response)
+            slot.set_usage(response.get("usage"))
+        return response
+
+    def _send_and_cache(
+        self, completion, request: Dict[str, Any], key: str, stream_callback=None
+    ):
+        response = self._send(completion, request, stream_callback)
+        get_lm_response_cache().set(key, response)
+        return response
+
+    async def _asend_and_cache(
+        self, completion, request: Dict[str, Any], key: str, stream_callback=None
+    ):
+        response = await self._asend(completion, request, stream_callback)
+        await asyncio.to_thread(get_lm_response_cache().set, key, response)
+        return response
+
+    async def _asend(
+        self, completion, request: Dict[str, Any], stream_callback=None
+    ) -> Dict[str, Any]:
+        tokens = estimate_request_tokens(request["messages"], request.get("max_tokens"))
+        async with self.rate_limiter.alimit(tokens, telemetry=self.telemetry) as slot:
+            if stream_callback is None:
+                response = await completion(ujson.dumps(request))
+            else:
+                response = await litellm_astream_completion(
+                    ujson.dumps(request), _on_chunk(slot, stream_callback)
+                )
+            slot.headers = _litellm_response_headers(response)
+            response = _response_to_dict(response)
+            slot.set_usage(response.get("usage"))
+        return response
+
+    def get_cache_stats_and_reset(self) -> Dict[str, int]:
+        """Get the number of LM response cache hits and misses of this LM and reset them."""
+        with self._cache_stats_lock:
+            stats = {"hits": self.cache_hits, "misses": self.cache_misses}
+            self.cache_hits = 0
+            self.cache_misses = 0
+        return stats
+
     def __call__(self, prompt=None, messages=None, **kwargs):
         # Build the request.
         cache = kwargs.pop("cache", self.cache)
         messages = messages or [{"role": "user", "content": prompt}]
         kwargs = {**self.kwargs, **kwargs}
 
-        # Make the request and handle LRU & disk caching.
-        if self.model_type == "chat":
-            completion = cached_litellm_completion if cache else litellm_completion
-        else:
-            completion = (
-                cached_litellm_text_completion if cache else litellm_text_completion
-            )
-
-        response = completion(
-            ujson.dumps(dict(model=self.model, messages=messages, **kwargs))
-        )
+        response = self._completion(messages, kwargs, cache)
         outputs = [
-            c.message.content if hasattr(c, "message") else c["text"]
+            c["message"]["content"] if "message" in c else c["text"]
             for c in response["choices"]
         ]
 
@@ -112,9 +248,932 @@ class LM:
         _inspect_history(self, n)
 
 
-@functools.lru_cache(maxsize=LM_LRU_CACHE_MAX_SIZE)
-def cached_litellm_completion(request):
-    return litellm_completion(request, cache={"no-cache": False, "no-store": False})
+# Request fields that may carry credentials. They never become part of a cache key.
+_SECRET_FIELD_PATTERN = re.compile(
+    r"key|secret|password|credential|authorization|headers|(^|_)token$", re.IGNORECASE
+)
+
+
+class LMResponseCache:
+    """
+    Cache of LM responses shared by all LM wrappers in the process.
+
+    A bounded in-memory LRU tier sits in front of a persistent SQLite tier, so repeated prompts are served without
+    an API call across runs while memory stays bounded in long batch jobs. Entries are keyed by a SHA-256 digest of
+    the request with credentials removed, the model type and an optional namespace (e.g., a prompt-template version).
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: Optional[int] = 1024 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+    ):
+        """
+        Args:
+            cache_path: Path of the SQLite file. Defaults to ~/.storm_local_cache/lm_responses.db. Pass an empty
+                string to keep responses in memory only.
+            max_memory_bytes: Memory budget of the in-memory tier, measured on the serialized responses.
+            max_disk_bytes: Maximum size of the SQLite tier. None disables size-based eviction.
+            ttl_seconds: Maximum age of a cached response. None keeps responses until they are evicted.
+        """
+        # Imported here because utils imports this module.
+        from .utils import SQLiteCache
+
+        if cache_path is None:
+            cache_path = os.path.join(
+                Path.home(), ".storm_local_cache", "lm_responses.db"
+            )
+        self.disk_cache = (
+            SQLiteCache(cache_path, ttl_seconds=ttl_seconds, max_bytes=max_disk_bytes)
+            if cache_path
+            else None
+        )
+        self.max_memory_bytes = max_memory_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        request: Dict[str, Any],
+        namespace: Optional[str] = None,
+        model_type: str = "chat",
+    ) -> str:
+        request = {
+            k: v for k, v in request.items() if not _SECRET_FIELD_PATTERN.search(k)
+        }
+        payload = json.dumps(
+            [namespace, model_type, request], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and (
+                self.ttl_seconds is not None
+                and time.time() - entry[0] > self.ttl_seconds
+            ):
+                self._memory.pop(key)
+                self.memory_bytes -= len(entry[1])
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            self.misses += 1
+        if self.disk_cache is None:
+            return None
+        try:
+            entry = self.disk_cache.get_entry(key)
+        except Exception as e:
+            logging.error(f"Failed to read from the LM response cache: {e}")
+            return None
+        if entry is None:
+            return None
+        response, created_at = entry
+        # Keeping the creation time of the disk entry makes the response expire at the same time in both tiers.
+        self._put_in_memory(key, json.dumps(response), created_at)
+        return response
+
+    def set(self, key: str, response: Dict[str, Any]):
+        # The cost is only incurred by the call that produced the response.
+        response = {k: v for k, v in response.items() if k != "_hidden_params"}
+        self._put_in_memory(key, json.dumps(response, default=str))
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.set(key, response)
+            except Exception as e:
+                logging.error(f"Failed to write to the LM response cache: {e}")
+
+    def _put_in_memory(
+        self, key: str, serialized: str, created_at: Optional[float] = None
+    ):
+        if len(serialized) > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= len(old[1])
+            self._memory[key] = (
+                time.time() if created_at is None else created_at,
+                serialized,
+            )
+            self.memory_bytes += len(serialized)
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.memory_bytes = 0
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Returns hit/miss counters and sizes of the in-memory tier and the SQLite tier.
+
+        Args:
+            reset (bool): If True, resets the counters after retrieval.
+        """
+        with self._lock:
+            memory_stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "bytes": self.memory_bytes,
+            }
+            if reset:
+                self.hits = self.misses = self.evictions = 0
+        stats = {"memory": memory_stats}
+        if self.disk_cache is not None:
+            stats["disk"] = self.disk_cache.get_stats(reset=reset)
+        return stats
+
+
+_lm_response_cache: Optional[LMResponseCache] = None
+_lm_response_cache_lock = threading.Lock()
+
+
+def get_lm_response_cache() -> LMResponseCache:
+    """Returns the process-wide LM response cache, creating the default one on first use."""
+    global _lm_response_cache
+    with _lm_response_cache_lock:
+        if _lm_response_cache is None:
+            _lm_response_cache = LMResponseCache()
+        return _lm_response_cache
+
+
+def set_lm_response_cache(cache: LMResponseCache):
+    """Replaces the process-wide LM response cache, e.g. to change its location, budget or TTL."""
+    global _lm_response_cache
+    with _lm_response_cache_lock:
+        _lm_response_cache = cache
+
+
+_lm_single_flight = None
+
+
+def get_lm_single_flight():
+    """Returns the process-wide `SingleFlight` that coalesces identical in-flight LM requests."""
+    global _lm_single_flight
+    with _lm_response_cache_lock:
+        if _lm_single_flight is None:
+            # Imported here because utils imports this module.
+            from .utils import SingleFlight
+
+            _lm_single_flight = SingleFlight()
+        return _lm_single_flight
+
+
+def _response_to_dict(response) -> Dict[str, Any]:
+    if isinstance(response, dict):
+        return response
+    response_dict = response.json()
+    response_dict["_hidden_params"] = {
+        "response_cost": getattr(response, "_hidden_params", {}).get("response_cost")
+    }
+    return response_dict
+
+
+# Default adaptive concurrency of the per-model rate limiters. See `RateLimiter`.
+LM_INITIAL_CONCURRENCY = 8
+LM_MAX_CONCURRENCY = 64
+
+# Rate limit headers of OpenAI-compatible APIs and of Anthropic. LiteLLM forwards them with an "llm_provider-" prefix.
+_RATE_LIMIT_HEADERS = {
+    "limit_requests": (
+        "x-ratelimit-limit-requests",
+        "anthropic-ratelimit-requests-limit",
+    ),
+    "limit_tokens": ("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"),
+    "remaining_requests": (
+        "x-ratelimit-remaining-requests",
+        "anthropic-ratelimit-requests-remaining",
+    ),
+    "remaining_tokens": (
+        "x-ratelimit-remaining-tokens",
+        "anthropic-ratelimit-tokens-remaining",
+    ),
+    "reset_requests": (
+        "x-ratelimit-reset-requests",
+        "anthropic-ratelimit-requests-reset",
+    ),
+    "reset_tokens": ("x-ratelimit-reset-tokens", "anthropic-ratelimit-tokens-reset"),
+    "retry_after": ("retry-after",),
+}
+
+
+def _parse_reset_seconds(value) -> Optional[float]:
+    """Parses a reset interval such as "20ms", "1.5s", "6m0s", a number of seconds or an RFC 3339 timestamp."""
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(reset_at.timestamp() - time.time(), 0.0)
+
+
+def parse_rate_limit_headers(headers) -> Dict[str, float]:
+    """Extracts the provider's rate limit state from response headers, skipping fields that are absent."""
+    if not headers:
+        return {}
+    normalized = {}
+    for name, value in dict(headers).items():
+        name = str(name).lower()
+        if name.startswith("llm_provider-"):
+            name = name[len("llm_provider-") :]
+        normalized[name] = value
+    state = {}
+    for field, names in _RATE_LIMIT_HEADERS.items():
+        value = next((normalized[n] for n in names if n in normalized), None)
+        if value is None:
+            continue
+        if field.startswith(("reset", "retry")):
+            value = _parse_reset_seconds(value)
+        else:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = None
+        if value is not None:
+            state[field] = value
+    return state
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an exception raised by an LM client means the provider rejected the request with HTTP 429."""
+    if type(error).__name__ in ("RateLimitError", "ResourceExhausted"):
+        return True
+    for status in (
+        getattr(error, "status_code", None),
+        getattr(error, "code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(status, int) and status == 429:
+            return True
+    return False
+
+
+def estimate_request_tokens(
+    prompt_or_messages, max_tokens: Optional[int] = None
+) -> int:
+    """Rough token cost of a request (4 characters per prompt token plus the completion budget)."""
+    if isinstance(prompt_or_messages, list):
+        text = " ".join(str(m.get("content", "")) for m in prompt_or_messages)
+    else:
+        text = str(prompt_or_messages or "")
+    return len(text) // 4 + (max_tokens or 0)
+
+
+class _TokenBucket:
+    """A bucket refilling `per_minute` units per minute. Not thread-safe; guarded by the owning limiter."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        deficit = min(amount, self.capacity) - self.level
+        return max(deficit, 0.0) * 60 / self.capacity
+
+
+class RateLimitSlot:
+    """Handle of a request admitted by `RateLimiter.limit`; the caller fills in what the response revealed."""
+
+    def __init__(self, reserved_tokens: int, queue_seconds: float = 0.0):
+        self.reserved_tokens = reserved_tokens
+        self.queue_seconds = queue_seconds
+        self.started = time.monotonic()
+        self.used_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.time_to_first_token: Optional[float] = None
+        self.headers = None
+        self.status_code: Optional[int] = None
+
+    def set_usage(self, usage: Optional[Dict[str, int]]):
+        """Sets the token counts from an OpenAI-style `usage` dict."""
+        if not usage:
+            return
+        self.completion_tokens = usage.get("completion_tokens")
+        self.used_tokens = usage.get("total_tokens")
+        if self.used_tokens is None:
+            self.used_tokens = usage.get("prompt_tokens", 0) + (
+                self.completion_tokens or 0
+            )
+
+    def mark_first_token(self):
+        """Records the time to first token of a streamed response."""
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started
+
+
+class LMCallTelemetry:
+    """
+    Latency and throughput of the calls one LM client sends to its provider.
+
+    Latencies are aggregated into a fixed set of histogram buckets, so memory stays constant however many calls are
+    made. Queueing delay is the time a call waited for the rate limiter before it was sent; cache hits are not
+    recorded since they never reach the provider.
+    """
+
+    # Upper bounds of the latency histogram buckets, in seconds.
+    BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, float("inf"))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.completion_tokens = 0
+        self.generation_seconds = 0.0
+        self.first_token_seconds = 0.0
+        self.first_token_calls = 0
+        self.histogram = [0] * len(self.BUCKETS)
+
+    def record(self, slot: RateLimitSlot, error: Optional[BaseException] = None):
+        latency = time.monotonic() - slot.started
+        with self._lock:
+            self.calls += 1
+            if error is not None:
+                self.errors += 1
+            self.latency_seconds += latency
+            self.max_latency_seconds = max(self.max_latency_seconds, latency)
+            self.queue_seconds += slot.queue_seconds
+            self.histogram[
+                next(i for i, bound in enumerate(self.BUCKETS) if latency <= bound)
+            ] += 1
+            if slot.completion_tokens:
+                self.completion_tokens += slot.completion_tokens
+                self.generation_seconds += latency
+            if slot.time_to_first_token is not None:
+                self.first_token_seconds += slot.time_to_first_token
+                self.first_token_calls += 1
+
+    def _percentile(self, q: float) -> Optional[float]:
+        # Upper bound of the bucket holding the q-th call; the maximum for the open-ended last bucket.
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max_latency_seconds)
+        return self.max_latency_seconds
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            if not self.calls:
+                stats = {"calls": 0}
+            else:
+                labels = [f"<={b:g}s" for b in self.BUCKETS[:-1]]
+                labels.append(f">{self.BUCKETS[-2]:g}s")
+                stats = {
+                    "calls": self.calls,
+                    "errors": self.errors,
+                    "total_latency_seconds": round(self.latency_seconds, 3),
+                    "mean_latency_seconds": round(self.latency_seconds / self.calls, 3),
+                    "p50_latency_seconds": round(self._percentile(0.5), 3),
+                    "p90_latency_seconds": round(self._percentile(0.9), 3),
+                    "p99_latency_seconds": round(self._percentile(0.99), 3),
+                    "max_latency_seconds": round(self.max_latency_seconds, 3),
+                    "total_queue_seconds": round(self.queue_seconds, 3),
+                    "completion_tokens_per_second": (
+                        round(self.completion_tokens / self.generation_seconds, 1)
+                        if self.generation_seconds
+                        else None
+                    ),
+                    "mean_time_to_first_token_seconds": (
+                        round(self.first_token_seconds / self.first_token_calls, 3)
+                        if self.first_token_calls
+                        else None
+                    ),
+                    "latency_histogram": {
+                        label: count
+                        for label, count in zip(labels, self.histogram)
+                        if count
+                    },
+                }
+            if reset:
+                self._reset()
+        return stats
+
+
+class RateLimiter:
+    """
+    Rate limiter shared by all threads that call the same model.
+
+    Requests-per-minute and tokens-per-minute budgets are enforced with token buckets. The budgets are either
+    configured or learned from the provider's rate limit headers, and the bucket levels are corrected with the
+    remaining quota the provider reports. The number of in-flight requests follows AIMD: it grows by one for every
+    window of successful requests (doubling per window until the first rate limit error) and halves when the provider
+    answers with HTTP 429, after which new requests wait out the retry-after interval instead of piling more failing
+    requests onto the provider.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        initial_concurrency: int = LM_INITIAL_CONCURRENCY,
+        max_concurrency: int = LM_MAX_CONCURRENCY,
+        min_concurrency: int = 1,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(initial_concurrency)
+        self.in_flight = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+        self._requests = _TokenBucket(rpm) if rpm else None
+        self._tokens = _TokenBucket(tpm) if tpm else None
+        # Budgets given by the user are never overridden by the limits that the provider advertises.
+        self._configured_rpm = bool(rpm)
+        self._configured_tpm = bool(tpm)
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        # Until the first 429 the limit doubles per round trip, as in TCP slow start.
+        self._slow_start = True
+        self._cond = threading.Condition()
+
+    def set_limits(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        with self._cond:
+            if rpm:
+                self._requests = _TokenBucket(rpm)
+                self._configured_rpm = True
+            if tpm:
+                self._tokens = _TokenBucket(tpm)
+                self._configured_tpm = True
+            self._cond.notify_all()
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = self._cooldown_until - now
+        for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        if self.in_flight >= int(self.concurrency):
+            # Woken up by `release`; the timeout only guards against a missed notification.
+            wait = max(wait, 1.0)
+        return wait
+
+    def _try_acquire(self, tokens: int, start: float) -> float:
+        """Admits the request and returns 0, or returns how long to wait. Must be called with the lock held."""
+        now = time.monotonic()
+        wait = self._wait_time(now, tokens)
+        if wait > 0:
+            return wait
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= min(tokens, self._tokens.capacity)
+        self.in_flight += 1
+        self.wait_seconds += now - start
+        return 0.0
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until a request estimated to cost `tokens` tokens may be sent."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens, start)
+                if wait <= 0:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """Like `acquire`, but waits without blocking the event loop."""
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens, start)
+            if wait <= 0:
+                return
+            # Poll, since slots released by other threads or tasks cannot wake up a coroutine.
+            await asyncio.sleep(min(wait, 0.05))
+
+    def release(self, slot: RateLimitSlot, error: Optional[BaseException] = None):
+        """Returns the slot of a finished request and adapts the limits to its outcome."""
+        headers = slot.headers
+        if headers is None and error is not None:
+            headers = getattr(getattr(error, "response", None), "headers", None)
+        state = parse_rate_limit_headers(headers)
+        rate_limited = slot.status_code == 429 or (
+            error is not None and is_rate_limit_error(error)
+        )
+        with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self._update_buckets(now, slot, state)
+            if rate_limited:
+                self.rate_limited += 1
+                retry_after = state.get("retry_after")
+                if retry_after is None:
+                    retry_after = max(
+                        state.get("reset_requests", 0), state.get("reset_tokens", 0)
+                    )
+                retry_after = retry_after or 1.0
+                self._cooldown_until = max(self._cooldown_until, now + retry_after)
+                # Requests sent before the first 429 fail together; count them as one congestion signal.
+                if now - self._last_decrease >= retry_after:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self._slow_start = False
+                    self._last_decrease = now
+            elif error is None:
+                self.successes += 1
+                # Only grow while the limit is actually in use.
+                if self.in_flight + 1 >= self.concurrency / 2:
+                    step = 1 if self._slow_start else 1 / self.concurrency
+                    self.concurrency = min(
+                        self.max_concurrency, self.concurrency + step
+                    )
+            self._cond.notify_all()
+
+    def _update_buckets(self, now: float, slot: RateLimitSlot, state: Dict[str, float]):
+        if not self._configured_rpm and state.get("limit_requests"):
+            if (
+                self._requests is None
+                or self._requests.capacity != state["limit_requests"]
+            ):
+                self._requests = _TokenBucket(state["limit_requests"])
+        if not self._configured_tpm and state.get("limit_tokens"):
+            if self._tokens is None or self._tokens.capacity != state["limit_tokens"]:
+                self._tokens = _TokenBucket(state["limit_tokens"])
+        if self._tokens is not None and slot.used_tokens is not None:
+            self._tokens.refill(now)
+            self._tokens.level = min(
+                self._tokens.capacity,
+                self._tokens.level
+                + min(slot.reserved_tokens, self._tokens.capacity)
+                - slot.used_tokens,
+            )
+        for bucket, remaining, reset in (
+            (self._requests, "remaining_requests", "reset_requests"),
+            (self._tokens, "remaining_tokens", "reset_tokens"),
+        ):
+            if remaining not in state:
+                continue
+            if bucket is not None:
+                bucket.refill(now)
+                bucket.level = min(bucket.level, state[remaining])
+            if state[remaining] <= 0 and state.get(reset):
+                self._cooldown_until = max(self._cooldown_until, now + state[reset])
+
+    @contextmanager
+    def limit(self, tokens: int = 0, telemetry: Optional[LMCallTelemetry] = None):
+        """
+        Admits one request for the duration of the block. Set the token usage, `headers` and `status_code` on the
+        yielded slot once they are known; an exception raised in the block is inspected for HTTP 429 and re-raised.
+        The timing of the call is recorded in `telemetry` if given.
+        """
+        start = time.monotonic()
+        self.acquire(tokens)
+        slot = RateLimitSlot(tokens, queue_seconds=time.monotonic() - start)
+        try:
+            yield slot
+        except BaseException as e:
+            self._finish(slot, telemetry, e)
+            raise
+        self._finish(slot, telemetry, None)
+
+    @asynccontextmanager
+    async def alimit(
+        self, tokens: int = 0, telemetry: Optional[LMCallTelemetry] = None
+    ):
+        """Async version of `limit`."""
+        start = time.monotonic()
+        await self.aacquire(tokens)
+        slot = RateLimitSlot(tokens, queue_seconds=time.monotonic() - start)
+        try:
+            yield slot
+        except BaseException as e:
+            self._finish(slot, telemetry, e)
+            raise
+        self._finish(slot, telemetry, None)
+
+    def _finish(self, slot, telemetry, error):
+        if telemetry is not None:
+            telemetry.record(slot, error)
+        self.release(slot, error=error)
+
+    def get_stats(self, reset: bool = False) -> Dict[str, float]:
+        with self._cond:
+            stats = {
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "rate_limited": self.rate_limited,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+            if reset:
+                self.successes = self.rate_limited = 0
+                self.wait_seconds = 0.0
+        return stats
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    key: str, rpm: Optional[float] = None, tpm: Optional[float] = None
+) -> RateLimiter:
+    """
+    Returns the process-wide rate limiter of `key` (e.g., "openai/gpt-4o"), creating it on first use.
+
+    LM instances that resolve to the same key share one limiter, so the budget holds across all threads and across
+    LM roles that use the same model. Passing `rpm` or `tpm` sets the budget of the shared limiter.
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = _rate_limiters[key] = RateLimiter(rpm=rpm, tpm=tpm)
+            return limiter
+    if rpm or tpm:
+        limiter.set_limits(rpm=rpm, tpm=tpm)
+    return limiter
+
+
+class MicroBatchDispatcher:
+    """
+    Dispatches the requests of concurrent callers to a self-hosted LM server in micro-batches.
+
+    Callers block in `submit` while a background thread collects the requests that arrive within a short window. With
+    `send_batch`, requests of the same group (i.e., with the same sampling parameters) are sent together as one
+    batched request. Without it, or for servers without a batch endpoint, requests are sent one by one with at most
+    `max_concurrency` in flight, which keeps servers with continuous batching saturated without unbounded threads.
+    Either way each caller receives its own result or exception. `close` stops the background threads.
+    """
+
+    def __init__(
+        self,
+        send_one: Callable[[Any], Any],
+        send_batch: Optional[Callable[[List[Any]], List[Any]]] = None,
+        max_batch_size: int = 16,
+        batch_window_seconds: float = 0.005,
+        max_concurrency: int = 32,
+        telemetry: Optional[LMCallTelemetry] = None,
+    ):
+        """
+        Args:
+            send_one: Sends one request payload and returns its result.
+            send_batch: Sends a list of payloads as one request and returns the results in the same order. If None,
+                requests are never batched.
+            max_batch_size: Maximum number of requests per batch.
+            batch_window_seconds: How long the oldest queued request waits for others to join its batch.
+            max_concurrency: Maximum number of requests (or batches) in flight.
+            telemetry: If given, the latency of each request and the time it was queued are recorded in it.
+        """
+        self.send_one = send_one
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size if send_batch is not None else 1
+        self.batch_window_seconds = batch_window_seconds
+        self.max_concurrency = max_concurrency
+        self.telemetry = telemetry
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(max_concurrency)
+        self._executor = None
+        self._thread = None
+        self._closed = False
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.queue_wait_seconds = 0.0
+
+    def submit(self, payload, group_key: str = ""):
+        """Queues `payload` and blocks until its result is available."""
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The micro-batch dispatcher is closed.")
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="lm-micro-batch",
+                )
+                self._thread = threading.Thread(
+                    target=self._dispatch_loop,
+                    name="lm-micro-batch-dispatcher",
+                    daemon=True,
+                )
+                self._thread.start()
+            self._pending.append((group_key, payload, future, time.monotonic()))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._cond.notify_all()
+        return future.result()
+
+    def _next_batch(self) -> Optional[List[tuple]]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][3] + self.batch_window_seconds
+            group_key = self._pending[0][0]
+            while self.max_batch_size > 1 and not self._closed:
+                group_size = sum(1 for item in self._pending if item[0] == group_key)
+                remaining = deadline - time.monotonic()
+                if group_size >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            batch, rest = [], []
+            for item in self._pending:
+                if item[0] == group_key and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._pending = rest
+            now = time.monotonic()
+            self.requests += len(batch)
+            self.batches += 1
+            self.queue_wait_seconds += sum(now - item[3] for item in batch)
+            return batch
+
+    def _dispatch_loop(self):
+        while True:
+            # Waiting for a free slot first keeps the queue (and its depth metric) in front of the server.
+            self._slots.acquire()
+            batch = self._next_batch()
+            if batch is None:
+                # Closed with nothing left to send.
+                self._slots.release()
+                return
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[tuple]):
+        # Every request of a batch is recorded as one call that waited in the queue since it was submitted.
+        start = time.monotonic()
+        slots = [RateLimitSlot(0, queue_seconds=start - item[3]) for item in batch]
+        try:
+            payloads = [item[1] for item in batch]
+            try:
+                if len(batch) == 1:
+                    results = [self.send_one(payloads[0])]
+                else:
+                    results = self.send_batch(payloads)
+            except BaseException as e:
+                for item, slot in zip(batch, slots):
+                    self._record(slot, e)
+                    item[2].set_exception(e)
+                return
+            for item, slot, result in zip(batch, slots, results):
+                self._record(slot, None)
+                item[2].set_result(result)
+        finally:
+            self._slots.release()
+
+    def _record(self, slot: RateLimitSlot, error: Optional[BaseException]):
+        if self.telemetry is not None:
+            self.telemetry.record(slot, error)
+
+    def close(self):
+        """
+        Sends the requests that are still queued, then stops the background threads. Later calls to `submit` raise
+        RuntimeError.
+        """
+        with self._cond:
+            self._closed = True
+            thread, executor = self._thread, self._executor
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Any]:
+        """Returns the current and maximum queue depth, the number of requests and batches, and queueing delays."""
+        with self._cond:
+            stats = {
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": (
+                    round(self.requests / self.batches, 2) if self.batches else None
+                ),
+                "mean_queue_wait_seconds": (
+                    round(self.queue_wait_seconds / self.requests, 4)
+                    if self.requests
+                    else None
+                ),
+            }
+            if reset:
+                self._reset_stats()
+        return stats
+
+
+def _litellm_response_headers(response):
+    headers = getattr(response, "_response_headers", None)
+    if headers:
+        return headers
+    return (getattr(response, "_hidden_params", None) or {}).get("additional_headers")
+
+
+# Set by `stream_lm_output`. Context variables are local to the thread or asyncio task that sets them, so concurrent
+# sections or utterances each stream to their own callback.
+_stream_callback: ContextVar[Optional[Callable[[str], None]]] = ContextVar(
+    "lm_stream_callback", default=None
+)
+
+
+@contextmanager
+def stream_lm_output(callback: Optional[Callable[[str], None]]):
+    """
+    Streams the output of `LM`/`LitellmModel` calls made in the block on the current thread (or asyncio task).
+
+    `callback` receives each text chunk as soon as the provider generates it. Responses that are not streamed (cache
+    hits, text completion models) are passed to `callback` in one chunk, so it always sees the whole output.
+    Passing None disables streaming in the block.
+    """
+    token = _stream_callback.set(callback)
+    try:
+        yield
+    finally:
+        _stream_callback.reset(token)
+
+
+def _on_chunk(slot: RateLimitSlot, callback: Callable[[str], None]):
+    def on_chunk(text: str):
+        slot.mark_first_token()
+        callback(text)
+
+    return on_chunk
+
+
+def _send_whole_response_to_stream(response: Dict[str, Any], callback):
+    choice = response["choices"][0] if response.get("choices") else {}
+    text = choice["message"]["content"] if "message" in choice else choice.get("text")
+    if text:
+        callback(text)
+
+
+def _chunk_text(chunk) -> Optional[str]:
+    if not chunk.choices:
+        return None
+    return getattr(chunk.choices[0].delta, "content", None)
+
+
+def litellm_stream_completion(
+    request, on_chunk, cache={"no-cache": True, "no-store": True}
+):
+    """Like `litellm_completion`, but streams the response and passes each text chunk to `on_chunk`."""
+    kwargs = ujson.loads(request)
+    chunks = []
+    for chunk in litellm.completion(cache=cache, stream=True, **kwargs):
+        chunks.append(chunk)
+        text = _chunk_text(chunk)
+        if text:
+            on_chunk(text)
+    return litellm.stream_chunk_builder(chunks, messages=kwargs["messages"])
+
+
+async def litellm_astream_completion(
+    request, on_chunk, cache={"no-cache": True, "no-store": True}
+):
+    kwargs = ujson.loads(request)
+    chunks = []
+    async for chunk in await litellm.acompletion(cache=cache, stream=True, **kwargs):
+        chunks.append(chunk)
+        text = _chunk_text(chunk)
+        if text:
+            on_chunk(text)
+    return litellm.stream_chunk_builder(chunks, messages=kwargs["messages"])
 
 
 def litellm_completion(request, cache={"no-cache": True, "no-store": True}):
@@ -122,14 +1181,22 @@ def litellm_completion(request, cache={"no-cache": True, "no-store": True}):
     return litellm.completion(cache=cache, **kwargs)
 
 
-@functools.lru_cache(maxsize=LM_LRU_CACHE_MAX_SIZE)
-def cached_litellm_text_completion(request):
-    return litellm_text_completion(
-        request, cache={"no-cache": False, "no-store": False}
+def litellm_text_completion(request, cache={"no-cache": True, "no-store": True}):
+    return litellm.text_completion(cache=cache, **_text_completion_kwargs(request))
+
+
+async def litellm_acompletion(request, cache={"no-cache": True, "no-store": True}):
+    kwargs = ujson.loads(request)
+    return await litellm.acompletion(cache=cache, **kwargs)
+
+
+async def litellm_atext_completion(request, cache={"no-cache": True, "no-store": True}):
+    return await litellm.atext_completion(
+        cache=cache, **_text_completion_kwargs(request)
     )
 
 
-def litellm_text_completion(request, cache={"no-cache": True, "no-store": True}):
+def _text_completion_kwargs(request) -> Dict[str, Any]:
     kwargs = ujson.loads(request)
 
     # Extract the provider and model from the model string.
@@ -145,8 +1212,7 @@ def litellm_text_completion(request, cache={"no-cache": True, "no-store": True})
         [x["content"] for x in kwargs.pop("messages")] + ["BEGIN RESPONSE:"]
     )
 
-    return litellm.text_completion(
-        cache=cache,
+    return dict(
         model=f"text-completion-openai/{model}",
         api_key=api_key,
         api_base=api_base,
@@ -236,22 +1302,28 @@ class LitellmModel(LM):
         messages = messages or [{"role": "user", "content": prompt}]
         kwargs = {**self.kwargs, **kwargs}
 
-        # Make the request and handle LRU & disk caching.
-        if self.model_type == "chat":
-            completion = cached_litellm_completion if cache else litellm_completion
-        else:
-            completion = (
-                cached_litellm_text_completion if cache else litellm_text_completion
-            )
+        response_dict = self._completion(messages, kwargs, cache)
+        return self._process_response(prompt, messages, kwargs, response_dict)
 
-        response = completion(
-            ujson.dumps(dict(model=self.model, messages=messages, **kwargs))
-        )
-        response_dict = response.json()
+    async def acall(self, prompt=None, messages=None, **kwargs):
+        """
+        Async version of `__call__` built on `litellm.acompletion`.
+
+        Shares the response cache, the rate limiter, the token usage and the history with the blocking path, so many
+        requests can be issued concurrently from one event loop without one thread per request.
+        """
+        cache = kwargs.pop("cache", self.cache)
+        messages = messages or [{"role": "user", "content": prompt}]
+        kwargs = {**self.kwargs, **kwargs}
+
+        response_dict = await self._acompletion(messages, kwargs, cache)
+        return self._process_response(prompt, messages, kwargs, response_dict)
+
+    def _process_response(self, prompt, messages, kwargs, response_dict):
         self.log_usage(response_dict)
         outputs = [
-            c.message.content if hasattr(c, "message") else c["text"]
-            for c in response["choices"]
+            c["message"]["content"] if "message" in c else c["text"]
+            for c in response_dict["choices"]
         ]
 
         # Logging, with removed api key & where `cost` is None on cache hit.
@@ -261,13 +1333,172 @@ class LitellmModel(LM):
         )
         entry = dict(**entry, outputs=outputs, usage=dict(response_dict["usage"]))
         entry = dict(
-            **entry, cost=response.get("_hidden_params", {}).get("response_cost")
+            **entry, cost=response_dict.get("_hidden_params", {}).get("response_cost")
         )
         self.history.append(entry)
 
         return outputs
 
 
+def _strip_secret_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in fields.items() if not _SECRET_FIELD_PATTERN.search(k)}
+
+
+def _lm_call_key(name: str, prompt, messages, kwargs: Dict[str, Any]) -> str:
+    kwargs = {k: v for k, v in _strip_secret_fields(kwargs).items() if k != "cache"}
+    payload = json.dumps([name, prompt, messages, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingLM:
+    """
+    Wraps an LM client and records every call, with its outputs and latency, to a `CallRecording`.
+
+    Replaying the recording with `ReplayLM` runs the pipeline offline and repeatably, e.g., to benchmark the
+    orchestration around the LM calls. Every attribute other than `__call__` and `acall` (kwargs, history, usage,
+    telemetry) is the wrapped client's own.
+    """
+
+    def __init__(self, lm, recording, name: Optional[str] = None):
+        """
+        Args:
+            lm: The LM client to wrap.
+            recording: The `CallRecording` to append the calls to.
+            name: Name of the LM in the recording. Defaults to its model name; pass distinct names to replay roles
+                that use the same model with different default kwargs.
+        """
+        self.lm = lm
+        self.recording = recording
+        self.name = name or getattr(lm, "model", None) or lm.kwargs.get("model")
+        recording.record_config(
+            "lm",
+            self.name,
+            {
+                "model_type": getattr(lm, "model_type", "chat"),
+                "kwargs": _strip_secret_fields(lm.kwargs),
+            },
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["lm"], name)
+
+    def __setattr__(self, name, value):
+        # E.g., `history` is reassigned when the history is collected or streamed to a sink.
+        if name in ("lm", "recording", "name"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.lm, name, value)
+
+    def _record(self, prompt, messages, kwargs, outputs, start: float):
+        self.recording.record(
+            "lm",
+            _lm_call_key(self.name, prompt, messages, kwargs),
+            dict(prompt=prompt, messages=messages, kwargs=_strip_secret_fields(kwargs)),
+            outputs,
+            time.monotonic() - start,
+        )
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        start = time.monotonic()
+        if messages is None:
+            # The deprecated clients only take the prompt.
+            outputs = self.lm(prompt, **kwargs)
+        else:
+            outputs = self.lm(prompt=prompt, messages=messages, **kwargs)
+        self._record(prompt, messages, kwargs, outputs, start)
+        return outputs
+
+    async def acall(self, prompt=None, messages=None, **kwargs):
+        start = time.monotonic()
+        outputs = await self.lm.acall(prompt=prompt, messages=messages, **kwargs)
+        self._record(prompt, messages, kwargs, outputs, start)
+        return outputs
+
+
+class ReplayLM(LM):
+    """
+    Serves the outputs of calls recorded by `RecordingLM`, without sending any request.
+
+    The default kwargs of the LM are those it was recorded with, so prompts built from them match the recording.
+    Replayed calls take no time unless a latency is injected: either the recorded latency scaled by
+    `latency_scale`, or a latency drawn from `latency_sampler` (e.g., `lambda: random.lognormvariate(0, 0.5)`).
+    Injected latencies show up in `telemetry` like those of a live provider.
+    """
+
+    def __init__(
+        self,
+        recording,
+        name: str,
+        latency_scale: float = 0.0,
+        latency_sampler: Optional[Callable[[], float]] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            recording: The `CallRecording` to replay.
+            name: Name of the LM in the recording (by default, the model name of the recorded client).
+            latency_scale: Factor applied to the recorded latency of each call. 0 replays calls without delay.
+            latency_sampler: Returns the latency of a replayed call in seconds; overrides `latency_scale`.
+            **kwargs: Default kwargs overriding the recorded ones.
+        """
+        config = recording.get_config("lm", name) or {}
+        super().__init__(
+            model=name, model_type=config.get("model_type", "chat"), cache=False
+        )
+        self.kwargs = {**config.get("kwargs", {}), **kwargs}
+        self.recording = recording
+        self.latency_scale = latency_scale
+        self.latency_sampler = latency_sampler
+
+    def _replay(self, prompt, messages, kwargs):
+        call = self.recording.lookup(
+            "lm", _lm_call_key(self.model, prompt, messages, kwargs)
+        )
+        if call is None:
+            raise KeyError(
+                f"No recorded call of {self.model} matches the prompt {str(prompt or messages)[:100]!r}."
+            )
+        return call["response"], self.recording.replay_delay(
+            call, self.latency_scale, self.latency_sampler
+        )
+
+    def _log(self, prompt, messages, kwargs, outputs, slot):
+        self.telemetry.record(slot)
+        self.history.append(
+            dict(
+                prompt=prompt,
+                messages=messages or [{"role": "user", "content": prompt}],
+                kwargs=_strip_secret_fields({**self.kwargs, **kwargs}),
+                response=None,
+                outputs=outputs,
+                usage={},
+                cost=None,
+            )
+        )
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        kwargs.pop("cache", None)
+        slot = RateLimitSlot(reserved_tokens=0)
+        outputs, delay = self._replay(prompt, messages, kwargs)
+        if delay:
+            time.sleep(delay)
+        self._log(prompt, messages, kwargs, outputs, slot)
+        return outputs
+
+    async def acall(self, prompt=None, messages=None, **kwargs):
+        kwargs.pop("cache", None)
+        slot = RateLimitSlot(reserved_tokens=0)
+        outputs, delay = self._replay(prompt, messages, kwargs)
+        if delay:
+            await asyncio.sleep(delay)
+        self._log(prompt, messages, kwargs, outputs, slot)
+        return outputs
+
+    def get_usage_and_reset(self):
+        """Replayed calls do not use any tokens."""
+        return {self.model: {"prompt_tokens": 0, "completion_tokens": 0}}
+
+
 # ========================================================================
 # The following language model classes were deprecated after v1.1.0.
 # They remain in this file for backward compatibility but will no longer be maintained.
@@ -281,12 +1512,18 @@ class OpenAIModel(dspy.OpenAI):
         model: str = "gpt-4o-mini",
         api_key: Optional[str] = None,
         model_type: Literal["chat", "text"] = None,
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         super().__init__(model=model, api_key=api_key, model_type=model_type, **kwargs)
         self._token_usage_lock = threading.Lock()
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self.rate_limiter = get_rate_limiter(
+            f"openai/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
 
     def log_usage(self, response):
         """Log the total tokens from the OpenAI API response."""
@@ -310,6 +1547,15 @@ class OpenAIModel(dspy.OpenAI):
 
         return usage
 
+    def basic_request(self, prompt: str, **kwargs):
+        max_tokens = kwargs.get("max_tokens", self.kwargs.get("max_tokens"))
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, max_tokens), telemetry=self.telemetry
+        ) as slot:
+            response = super().basic_request(prompt, **kwargs)
+            slot.set_usage(response.get("usage"))
+        return response
+
     def __call__(
         self,
         prompt: str,
@@ -371,12 +1617,18 @@ class DeepSeekModel(dspy.OpenAI):
         model: str = "deepseek-chat",
         api_key: Optional[str] = None,
         api_base: str = "https://api.deepseek.com",
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         super().__init__(model=model, api_key=api_key, api_base=api_base, **kwargs)
         self._token_usage_lock = threading.Lock()
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self.rate_limiter = get_rate_limiter(
+            f"deepseek/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
         self.model = model
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         self.api_base = api_base
@@ -423,11 +1675,18 @@ class DeepSeekModel(dspy.OpenAI):
             "messages": [{"role": "user", "content": prompt}],
             **kwargs,
         }
-        response = requests.post(
-            f"{self.api_base}/v1/chat/completions", headers=headers, json=data
-        )
-        response.raise_for_status()
-        return response.json()
+        max_tokens = kwargs.get("max_tokens", self.kwargs.get("max_tokens"))
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, max_tokens), telemetry=self.telemetry
+        ) as slot:
+            response = requests.post(
+                f"{self.api_base}/v1/chat/completions", headers=headers, json=data
+            )
+            slot.headers = response.headers
+            response.raise_for_status()
+            response = response.json()
+            slot.set_usage(response.get("usage"))
+        return response
 
     def __call__(
         self,
@@ -600,12 +1859,18 @@ class GroqModel(dspy.OpenAI):
         model: str = "llama3-70b-8192",
         api_key: Optional[str] = None,
         api_base: str = "https://api.groq.com/openai/v1",
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         super().__init__(model=model, api_key=api_key, api_base=api_base, **kwargs)
         self._token_usage_lock = threading.Lock()
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self.rate_limiter = get_rate_limiter(
+            f"groq/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
         self.model = model
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
         self.api_base = api_base
@@ -671,11 +1936,18 @@ class GroqModel(dspy.OpenAI):
         for message in data["messages"]:
             message.pop("name", None)
 
-        response = requests.post(
-            f"{self.api_base}/chat/completions", headers=headers, json=data
-        )
-        response.raise_for_status()
-        return response.json()
+        max_tokens = kwargs.get("max_tokens", self.kwargs.get("max_tokens"))
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, max_tokens), telemetry=self.telemetry
+        ) as slot:
+            response = requests.post(
+                f"{self.api_base}/chat/completions", headers=headers, json=data
+            )
+            slot.headers = response.headers
+            response.raise_for_status()
+            response = response.json()
+            slot.set_usage(response.get("usage"))
+        return response
 
     def __call__(
         self,
@@ -714,6 +1986,8 @@ class ClaudeModel(dspy.dsp.modules.lm.LM):
         model: str,
         api_key: Optional[str] = None,
         api_base: Optional[str] = None,
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         super().__init__(model)
@@ -741,6 +2015,10 @@ class ClaudeModel(dspy.dsp.modules.lm.LM):
         self.history: list[dict[str, Any]] = []
         self.client = Anthropic(api_key=api_key)
         self.model = model
+        self.rate_limiter = get_rate_limiter(
+            f"anthropic/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
 
         self._token_usage_lock = threading.Lock()
         self.prompt_tokens = 0
@@ -773,7 +2051,16 @@ class ClaudeModel(dspy.dsp.modules.lm.LM):
         # caching mechanism requires hashable kwargs
         kwargs["messages"] = [{"role": "user", "content": prompt}]
         kwargs.pop("n")
-        response = self.client.messages.create(**kwargs)
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, kwargs.get("max_tokens")),
+            telemetry=self.telemetry,
+        ) as slot:
+            # The raw response exposes the anthropic-ratelimit-* headers.
+            raw_response = self.client.messages.with_raw_response.create(**kwargs)
+            slot.headers = raw_response.headers
+            response = raw_response.parse()
+            slot.completion_tokens = response.usage.output_tokens
+            slot.used_tokens = response.usage.input_tokens + slot.completion_tokens
         # history = {
         #     "prompt": prompt,
         #     "response": response,
@@ -855,13 +2142,24 @@ class VLLMClient(dspy.dsp.LM):
         model_type: Literal["chat", "text"] = "text",
         url="http://localhost",
         api_key="null",
+        max_concurrency: int = 32,
+        max_batch_size: int = 1,
+        batch_window_ms: float = 5.0,
         **kwargs,
     ):
-        """Check out https://docs.vllm.ai/en/latest/serving/openai_compatible_server.html for more information."""
+        """
+        Check out https://docs.vllm.ai/en/latest/serving/openai_compatible_server.html for more information.
+
+        Concurrent calls are sent through a `MicroBatchDispatcher` with at most `max_concurrency` requests in flight.
+        With `model_type="text"`, prompts are sent to the completions endpoint, and with `max_batch_size > 1`, prompts
+        with the same sampling parameters that arrive within `batch_window_ms` are sent as one request, since the
+        endpoint accepts a list of prompts. With `model_type="chat"`, each prompt is sent to the chat endpoint.
+        """
         super().__init__(model=model)
         # Store additional kwargs for the generate method.
         self.kwargs = {**self.kwargs, **kwargs}
         self.model = model
+        self.model_type = model_type
         self.base_url = f"{url}:{port}/v1/"
         if model_type == "chat":
             self.base_url += "chat/"
@@ -869,13 +2167,65 @@ class VLLMClient(dspy.dsp.LM):
         self.prompt_tokens = 0
         self.completion_tokens = 0
         self._token_usage_lock = threading.Lock()
+        self.telemetry = LMCallTelemetry()
+        self.dispatcher = MicroBatchDispatcher(
+            send_one=self._send_one,
+            send_batch=(
+                self._send_batch
+                if model_type == "text" and max_batch_size > 1
+                else None
+            ),
+            max_batch_size=max_batch_size,
+            batch_window_seconds=batch_window_ms / 1000,
+            max_concurrency=max_concurrency,
+            telemetry=self.telemetry,
+        )
 
-    def basic_request(self, prompt, **kwargs):
-        completion = self.client.chat.completions.create(
+    def close(self):
+        """Stops the threads of the dispatcher once the queued requests are sent."""
+        self.dispatcher.close()
+
+    def _send_one(self, payload):
+        if self.model_type == "text":
+            # Lone prompts go to the same endpoint as batched ones, so the output does not depend on timing.
+            return self._send_batch([payload])[0]
+        prompt, kwargs = payload
+        return self.client.chat.completions.create(
             **kwargs,
             messages=[{"role": "user", "content": prompt}],
         )
-        return completion
+
+    def _send_batch(self, payloads):
+        kwargs = payloads[0][1]
+        completion = self.client.completions.create(
+            **kwargs, prompt=[prompt for prompt, _ in payloads]
+        )
+        # The server returns n choices per prompt, ordered by `index` across the whole batch.
+        n = kwargs.get("n", 1) or 1
+        choices_per_prompt = [[] for _ in payloads]
+        for choice in sorted(completion.choices, key=lambda c: c.index):
+            choices_per_prompt[choice.index // n].append(
+                SimpleNamespace(
+                    index=choice.index % n,
+                    message=SimpleNamespace(role="assistant", content=choice.text),
+                    finish_reason=choice.finish_reason,
+                )
+            )
+        # Usage is reported for the whole batch, so attribute it to the first response to keep the totals exact.
+        return [
+            SimpleNamespace(
+                id=completion.id,
+                model=completion.model,
+                choices=choices,
+                usage=completion.usage if i == 0 else None,
+            )
+            for i, choices in enumerate(choices_per_prompt)
+        ]
+
+    def basic_request(self, prompt, **kwargs):
+        return self.dispatcher.submit(
+            (prompt, kwargs), group_key=json.dumps(kwargs, sort_keys=True, default=str)
+        )
 
     @backoff.on_exception(
         backoff.expo,
@@ -935,7 +2285,9 @@ class VLLMClient(dspy.dsp.LM):
 class OllamaClient(dspy.OllamaLocal):
     """A wrapper class for dspy.OllamaClient."""
 
-    def __init__(self, model, port, url="http://localhost", **kwargs):
+    def __init__(
+        self, model, port, url="http://localhost", max_concurrency: int = 32, **kwargs
+    ):
         """Copied from dspy/dsp/modules/hf_client.py with the addition of storing additional kwargs."""
         # Check if the URL has 'http://' or 'https://'
         if not url.startswith("http://") and not url.startswith("https://"):
@@ -943,10 +2295,34 @@ class OllamaClient(dspy.OllamaLocal):
         super().__init__(model=model, base_url=f"{url}:{port}", **kwargs)
         # Store additional kwargs for the generate method.
         self.kwargs = {**self.kwargs, **kwargs}
+        # Ollama has no batch endpoint, so concurrent calls are only bounded; the server schedules them itself.
+        self.telemetry = LMCallTelemetry()
+        self.dispatcher = MicroBatchDispatcher(
+            send_one=lambda payload: super(OllamaClient, self).basic_request(
+                payload[0], **payload[1]
+            ),
+            max_concurrency=max_concurrency,
+            telemetry=self.telemetry,
+        )
+
+    def close(self):
+        """Stops the threads of the dispatcher once the queued requests are sent."""
+        self.dispatcher.close()
+
+    def basic_request(self, prompt: str, **kwargs):
+        return self.dispatcher.submit((prompt, kwargs))
 
 
 class TGIClient(dspy.HFClientTGI):
-    def __init__(self, model, port, url, http_request_kwargs=None, **kwargs):
+    def __init__(
+        self,
+        model,
+        port,
+        url,
+        http_request_kwargs=None,
+        max_concurrency: int = 32,
+        **kwargs,
+    ):
         super().__init__(
             model=model,
             port=port,
@@ -954,6 +2330,28 @@ class TGIClient(dspy.HFClientTGI):
             http_request_kwargs=http_request_kwargs,
             **kwargs,
         )
+        # TGI batches continuously on the server and its /generate endpoint takes one input, so concurrent calls are
+        # only bounded here.
+        self.telemetry = LMCallTelemetry()
+        self.dispatcher = MicroBatchDispatcher(
+            send_one=self._send_generate_request,
+            max_concurrency=max_concurrency,
+            telemetry=self.telemetry,
+        )
+
+    def close(self):
+        """Stops the threads of the dispatcher once the queued requests are sent."""
+        self.dispatcher.close()
+
+    def _send_generate_request(self, payload):
+        return send_hftgi_request_v01_wrapped(
+            f"{self.url}:{random.Random().choice(self.ports)}" + "/generate",
+            url=self.url,
+            ports=tuple(self.ports),
+            json=payload,
+            headers=self.headers,
+            **self.http_request_kwargs,
+        )
 
     def _generate(self, prompt, **kwargs):
         """Copied from dspy/dsp/modules/hf_client.py with the addition of removing hard-coded parameters."""
@@ -976,14 +2374,7 @@ class TGIClient(dspy.HFClientTGI):
         #     0.1, payload["parameters"]["temperature"],
         # )
 
-        response = send_hftgi_request_v01_wrapped(
-            f"{self.url}:{random.Random().choice(self.ports)}" + "/generate",
-            url=self.url,
-            ports=tuple(self.ports),
-            json=payload,
-            headers=self.headers,
-            **self.http_request_kwargs,
-        )
+        response = self.dispatcher.submit(payload)
 
         try:
             json_response = response.json()
@@ -1017,6 +2408,8 @@ class TogetherClient(dspy.HFModel):
         apply_tokenizer_chat_template=False,
         hf_tokenizer_name=None,
         model_type: Literal["chat", "text"] = "chat",
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         """Copied from dspy/dsp/modules/hf_client.py with the support of applying tokenizer chat template."""
@@ -1028,6 +2421,10 @@ class TogetherClient(dspy.HFModel):
         )
         self.model = model
         self.model_type = model_type
+        self.rate_limiter = get_rate_limiter(
+            f"together_ai/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
         if os.getenv("TOGETHER_API_BASE") is None:
             if self.model_type == "chat":
                 self.api_base = "https://api.together.xyz/v1/chat/completions"
@@ -1138,8 +2535,13 @@ class TogetherClient(dspy.HFModel):
 
         headers = {"Authorization": f"Bearer {self.api_key}"}
 
-        with self.session.post(self.api_base, headers=headers, json=body) as resp:
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, max_tokens), telemetry=self.telemetry
+        ) as slot, self.session.post(self.api_base, headers=headers, json=body) as resp:
+            slot.headers = resp.headers
+            slot.status_code = resp.status_code
             resp_json = resp.json()
+            slot.set_usage(resp_json.get("usage"))
             # Log the token usage from the Together API response.
             self.log_usage(resp_json)
             if self.model_type == "chat":
@@ -1163,6 +2565,8 @@ class GoogleModel(dspy.dsp.modules.lm.LM):
         self,
         model: str,
         api_key: Optional[str] = None,
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
         **kwargs,
     ):
         """You can use `genai.list_models()` to get a list of available models."""
@@ -1191,6 +2595,10 @@ class GoogleModel(dspy.dsp.modules.lm.LM):
         kwargs.pop("max_tokens", None)  # GenerationConfig cannot accept max_tokens
 
         self.model = model
+        self.rate_limiter = get_rate_limiter(
+            f"gemini/{model}", rpm=rpm_limit, tpm=tpm_limit
+        )
+        self.telemetry = LMCallTelemetry()
         self.config = genai.GenerationConfig(**kwargs)
         self.llm = genai.GenerativeModel(
             model_name=model, generation_config=self.config
@@ -1238,7 +2646,17 @@ class GoogleModel(dspy.dsp.modules.lm.LM):
         # Google disallows "n" arguments.
         n = kwargs.pop("n", None)
 
-        response = self.llm.generate_content(prompt, generation_config=kwargs)
+        with self.rate_limiter.limit(
+            estimate_request_tokens(prompt, kwargs.get("max_output_tokens")),
+            telemetry=self.telemetry,
+        ) as slot:
+            response = self.llm.generate_content(prompt, generation_config=kwargs)
+            slot.used_tokens = getattr(
+                response.usage_metadata, "total_token_count", None
+            )
+            slot.completion_tokens = getattr(
+                response.usage_metadata, "candidates_token_count", None
+            )
 
         history = {
             "prompt": prompt,
@@ -2,6 +2,9 @@ from contextlib import contextmanager
 import time
 import pytz
 from datetime import datetime
+from typing import Optional
+
+from .utils import LMHistorySink
 
 # Define California timezone
 CALIFORNIA_TZ = pytz.timezone("America/Los_Angeles")
@@ -53,9 +56,24 @@ class EventLog:
 
 
 class LoggingWrapper:
-    def __init__(self, lm_config):
+    def __init__(self, lm_config, lm_history_max_in_memory: Optional[int] = None):
+        """
+        Args:
+            lm_config: The LMConfigs whose usage and call history are logged per pipeline stage.
+            lm_history_max_in_memory: If not None and `lm_config` has no history sink yet, attach an `LMHistorySink`
+                with which each LM keeps this many recent calls in memory; the LM call history of each stage is then
+                read back from a temporary file in `dump_logging_and_reset`. If None (default), the history stays in
+                memory.
+        """
         self.logging_dict = {}
         self.lm_config = lm_config
+        if (
+            lm_history_max_in_memory is not None
+            and getattr(lm_config, "history_sink", None) is None
+        ):
+            lm_config.set_history_sink(
+                LMHistorySink(max_in_memory_entries=lm_history_max_in_memory)
+            )
         self.current_pipeline_stage = None
         self.event_stack = []
         self.pipeline_stage_active = False
@@ -70,6 +88,7 @@ class LoggingWrapper:
         self.logging_dict[pipeline_stage] = {
             "time_usage": {},
             "lm_usage": {},
+            "lm_telemetry": {},
             "lm_history": [],
             "query_count": 0,
         }
@@ -147,9 +166,13 @@ class LoggingWrapper:
         self.logging_dict[self.current_pipeline_stage][
             "lm_usage"
         ] = self.lm_config.collect_and_reset_lm_usage()
+        self.logging_dict[self.current_pipeline_stage][
+            "lm_telemetry"
+        ] = self.lm_config.collect_and_reset_lm_telemetry()
+        # Read lazily from the history sink (if any) when the log is dumped.
         self.logging_dict[self.current_pipeline_stage][
             "lm_history"
-        ] = self.lm_config.collect_and_reset_lm_history()
+        ] = self.lm_config.iter_and_reset_lm_history()
         self.pipeline_stage_active = False
 
     def add_query_count(self, count):
@@ -200,9 +223,11 @@ class LoggingWrapper:
                 }
                 for event_name, event in pipeline_log["time_usage"].items()
             }
+            pipeline_log["lm_history"] = list(pipeline_log["lm_history"])
             log_dump[pipeline_stage] = {
                 "time_usage": time_stamp_log,
                 "lm_usage": pipeline_log["lm_usage"],
+                "lm_telemetry": pipeline_log["lm_telemetry"],
                 "lm_history": pipeline_log["lm_history"],
                 "query_count": pipeline_log["query_count"],
                 "total_wall_time": pipeline_log["total_wall_time"],
@@ -1,13 +1,26 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
 import logging
 import os
-from typing import Callable, Union, List
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Union, List, Optional
 
 import backoff
 import dspy
-import requests
 from dsp import backoff_hdlr, giveup_hdlr
 
-from .utils import WebPageHelper
+from .utils import (
+    CallRecording,
+    SQLiteCache,
+    WebPageHelper,
+    get_async_http_client,
+    get_http_session_pool,
+    has_native_aforward,
+)
 
 
 class YouRM(dspy.Retrieve):
@@ -22,6 +35,7 @@ class YouRM(dspy.Retrieve):
         else:
             self.ydc_api_key = os.environ["YDC_API_KEY"]
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
         # If not None, is_valid_source shall be a function that takes a URL and returns a boolean.
         if is_valid_source:
@@ -30,9 +44,9 @@ class YouRM(dspy.Retrieve):
             self.is_valid_source = lambda x: True
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
-
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"YouRM": usage}
 
     def forward(
@@ -52,27 +66,61 @@ class YouRM(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
         collected_results = []
         for query in queries:
             try:
                 headers = {"X-API-Key": self.ydc_api_key}
-                results = requests.get(
-                    f"https://api.ydc-index.io/search?query={query}",
-                    headers=headers,
-                ).json()
-
-                authoritative_results = []
-                for r in results["hits"]:
-                    if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls:
-                        authoritative_results.append(r)
-                if "hits" in results:
-                    collected_results.extend(authoritative_results[: self.k])
+                results = (
+                    get_http_session_pool()
+                    .get(
+                        "https://api.ydc-index.io/search",
+                        params={"query": query},
+                        headers=headers,
+                    )
+                    .json()
+                )
+                collected_results.extend(self._parse_results(results, exclude_urls))
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
 
         return collected_results
 
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+
+        async def search(query):
+            try:
+                response = await get_async_http_client().get(
+                    "https://api.ydc-index.io/search",
+                    params={"query": query},
+                    headers={"X-API-Key": self.ydc_api_key},
+                )
+                return self._parse_results(response.json(), exclude_urls)
+            except Exception as e:
+                logging.error(f"Error occurs when searching query {query}: {e}")
+                return []
+
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
+
+    def _parse_results(self, results, exclude_urls: List[str]):
+        authoritative_results = []
+        for r in results["hits"]:
+            if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls:
+                authoritative_results.append(r)
+        return authoritative_results[: self.k]
+
 
 class BingSearch(dspy.Retrieve):
     def __init__(
@@ -112,6 +160,7 @@ class BingSearch(dspy.Retrieve):
             max_thread_num=webpage_helper_max_threads,
         )
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
         # If not None, is_valid_source shall be a function that takes a URL and returns a boolean.
         if is_valid_source:
@@ -120,9 +169,9 @@ class BingSearch(dspy.Retrieve):
             self.is_valid_source = lambda x: True
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
-
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"BingSearch": usage}
 
     def forward(
@@ -142,7 +191,8 @@ class BingSearch(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
 
         url_to_results = {}
 
@@ -150,29 +200,77 @@ class BingSearch(dspy.Retrieve):
 
         for query in queries:
             try:
-                results = requests.get(
-                    self.endpoint, headers=headers, params={**self.params, "q": query}
-                ).json()
-
-                for d in results["webPages"]["value"]:
-                    if self.is_valid_source(d["url"]) and d["url"] not in exclude_urls:
-                        url_to_results[d["url"]] = {
-                            "url": d["url"],
-                            "title": d["name"],
-                            "description": d["snippet"],
-                        }
+                results = (
+                    get_http_session_pool()
+                    .get(
+                        self.endpoint,
+                        headers=headers,
+                        params={**self.params, "q": query},
+                    )
+                    .json()
+                )
+                url_to_results.update(self._parse_results(results, exclude_urls))
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
 
         valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
             list(url_to_results.keys())
         )
+        return self._attach_snippets(url_to_results, valid_url_to_snippets)
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+
+        headers = {"Ocp-Apim-Subscription-Key": self.bing_api_key}
+
+        async def search(query):
+            try:
+                response = await get_async_http_client().get(
+                    self.endpoint, headers=headers, params={**self.params, "q": query}
+                )
+                return self._parse_results(response.json(), exclude_urls)
+            except Exception as e:
+                logging.error(f"Error occurs when searching query {query}: {e}")
+                return {}
+
+        url_to_results = {}
+        for query_results in await asyncio.gather(
+            *(search(query) for query in queries)
+        ):
+            url_to_results.update(query_results)
+
+        valid_url_to_snippets = await self.webpage_helper.aurls_to_snippets(
+            list(url_to_results.keys())
+        )
+        return self._attach_snippets(url_to_results, valid_url_to_snippets)
+
+    def _parse_results(self, results, exclude_urls: List[str]):
+        url_to_results = {}
+        for d in results["webPages"]["value"]:
+            if self.is_valid_source(d["url"]) and d["url"] not in exclude_urls:
+                url_to_results[d["url"]] = {
+                    "url": d["url"],
+                    "title": d["name"],
+                    "description": d["snippet"],
+                }
+        return url_to_results
+
+    @staticmethod
+    def _attach_snippets(url_to_results, valid_url_to_snippets):
         collected_results = []
         for url in valid_url_to_snippets:
             r = url_to_results[url]
             r["snippets"] = valid_url_to_snippets[url]["snippets"]
             collected_results.append(r)
-
         return collected_results
 
 
@@ -355,7 +453,7 @@ class StanfordOvalArxivRM(dspy.Retrieve):
     def _retrieve(self, query: str):
         payload = {"query": query, "num_blocks": self.k, "rerank": self.rerank}
 
-        response = requests.post(
+        response = get_http_session_pool().post(
             self.endpoint, json=payload, headers={"Content-Type": "application/json"}
         )
 
@@ -436,7 +534,7 @@ class SerperRM(dspy.Retrieve):
         """
         super().__init__(k=k)
         self.usage = 0
-        self.query_params = None
+        self._usage_lock = threading.Lock()
         self.ENABLE_EXTRA_SNIPPET_EXTRACTION = ENABLE_EXTRA_SNIPPET_EXTRACTION
         self.webpage_helper = WebPageHelper(
             min_char_count=min_char_count,
@@ -444,11 +542,11 @@ class SerperRM(dspy.Retrieve):
             max_thread_num=webpage_helper_max_threads,
         )
 
+        # The default parameters are never modified; every search builds its own copy (see `_search_params`).
         if query_params is None:
             self.query_params = {"num": k, "autocorrect": True, "page": 1}
         else:
-            self.query_params = query_params
-            self.query_params.update({"num": k})
+            self.query_params = {**query_params, "num": k}
         self.serper_search_api_key = serper_search_api_key
         if not self.serper_search_api_key and not os.environ.get("SERPER_API_KEY"):
             raise RuntimeError(
@@ -462,35 +560,89 @@ class SerperRM(dspy.Retrieve):
             self.serper_search_api_key = os.environ["SERPER_API_KEY"]
 
         self.base_url = "https://google.serper.dev"
-
-    def serper_runner(self, query_params):
         self.search_url = f"{self.base_url}/search"
 
-        headers = {
+    # Maximum number of query objects the Serper API accepts in one request.
+    MAX_BATCH_SIZE = 100
+
+    def _headers(self):
+        return {
             "X-API-KEY": self.serper_search_api_key,
             "Content-Type": "application/json",
         }
 
-        response = requests.request(
-            "POST", self.search_url, headers=headers, json=query_params
+    def serper_runner(self, query_params):
+        """Sends one search, or a batch of searches if `query_params` is a list, and returns the parsed response."""
+        response = get_http_session_pool().post(
+            self.search_url, headers=self._headers(), json=query_params
         )
 
         if response == None:
             raise RuntimeError(
-                f"Error had occurred while running the search process.\n Error is {response.reason}, had failed with status code {response.status_code}"
+                f"Error had occurred while running the search process.\n Error is {response.reason_phrase}, had failed with status code {response.status_code}"
             )
 
         return response.json()
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"SerperRM": usage}
 
+    def _search_params(self, queries: List[str]) -> List[List[dict]]:
+        """Builds the parameters of every query, split into batches accepted by the batch endpoint."""
+        # All available parameters can be found in the playground: https://serper.dev/playground
+        # The type can also be images, video, places, maps etc that Google provides.
+        query_params = [
+            {**self.query_params, "q": query, "type": "search"}
+            for query in queries
+            if query != "Queries:"
+        ]
+        return [
+            query_params[i : i + self.MAX_BATCH_SIZE]
+            for i in range(0, len(query_params), self.MAX_BATCH_SIZE)
+        ]
+
+    def _check_batch_results(self, batch, batch_results):
+        if isinstance(batch_results, list) and len(batch_results) == len(batch):
+            return batch_results
+        logging.error(
+            f"Unexpected response to a batch of {len(batch)} queries; searching them one by one."
+        )
+        return None
+
+    def _search_one(self, query_params):
+        try:
+            return self.serper_runner(query_params)
+        except Exception as e:
+            logging.error(f"Error occurs when searching query {query_params['q']}: {e}")
+            return None
+
+    def _search_batch(self, batch):
+        if len(batch) > 1:
+            try:
+                batch_results = self._check_batch_results(
+                    batch, self.serper_runner(batch)
+                )
+                if batch_results is not None:
+                    return batch_results
+            except Exception as e:
+                logging.error(
+                    f"Error occurs when searching a batch of {len(batch)} queries: {e}"
+                )
+        # A batch holds up to MAX_BATCH_SIZE queries, so the single searches share the webpage helper's thread limit.
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(batch), self.webpage_helper.max_thread_num)
+        ) as executor:
+            return [r for r in executor.map(self._search_one, batch) if r is not None]
+
     def forward(self, query_or_queries: Union[str, List[str]], exclude_urls: List[str]):
         """
         Calls the API and searches for the query passed in.
 
+        The queries are sent in one request to the batch endpoint, falling back to concurrent single searches if the
+        batch fails. No state is shared between calls, so one instance can serve several threads.
 
         Args:
             query_or_queries (Union[str, List[str]]): The query or queries to search for.
@@ -505,40 +657,90 @@ class SerperRM(dspy.Retrieve):
             else query_or_queries
         )
 
-        self.usage += len(queries)
-        self.results = []
-        collected_results = []
-        for query in queries:
-            if query == "Queries:":
-                continue
-            query_params = self.query_params
+        with self._usage_lock:
+            self.usage += len(queries)
+        results = []
+        for batch in self._search_params(queries):
+            results.extend(self._search_batch(batch))
 
-            # All available parameters can be found in the playground: https://serper.dev/playground
-            # Sets the json value for query to be the query that is being parsed.
-            query_params["q"] = query
+        if self.ENABLE_EXTRA_SNIPPET_EXTRACTION:
+            valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
+                self._organic_urls(results)
+            )
+        else:
+            valid_url_to_snippets = {}
+
+        return self._build_results(results, valid_url_to_snippets)
 
-            # Sets the type to be search, can be images, video, places, maps etc that Google provides.
-            query_params["type"] = "search"
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that sends all batches concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
 
-            self.result = self.serper_runner(query_params)
-            self.results.append(self.result)
+        async def search(query_params):
+            try:
+                response = await get_async_http_client().post(
+                    self.search_url, headers=self._headers(), json=query_params
+                )
+                return response.json()
+            except Exception as e:
+                logging.error(
+                    f"Error occurs when searching query {query_params['q']}: {e}"
+                )
+                return None
 
-        # Array of dictionaries that will be used by Storm to create the jsons
-        collected_results = []
+        async def search_batch(batch):
+            if len(batch) > 1:
+                try:
+                    response = await get_async_http_client().post(
+                        self.search_url, headers=self._headers(), json=batch
+                    )
+                    batch_results = self._check_batch_results(batch, response.json())
+                    if batch_results is not None:
+                        return batch_results
+                except Exception as e:
+                    logging.error(
+                        f"Error occurs when searching a batch of {len(batch)} queries: {e}"
+                    )
+            results = await asyncio.gather(*(search(params) for params in batch))
+            return [result for result in results if result is not None]
+
+        batch_results = await asyncio.gather(
+            *(search_batch(batch) for batch in self._search_params(queries))
+        )
+        results = [result for results in batch_results for result in results]
 
         if self.ENABLE_EXTRA_SNIPPET_EXTRACTION:
-            urls = []
-            for result in self.results:
-                organic_results = result.get("organic", [])
-                for organic in organic_results:
-                    url = organic.get("link")
-                    if url:
-                        urls.append(url)
-            valid_url_to_snippets = self.webpage_helper.urls_to_snippets(urls)
+            valid_url_to_snippets = await self.webpage_helper.aurls_to_snippets(
+                self._organic_urls(results)
+            )
         else:
             valid_url_to_snippets = {}
 
-        for result in self.results:
+        return self._build_results(results, valid_url_to_snippets)
+
+    @staticmethod
+    def _organic_urls(results):
+        urls = []
+        for result in results:
+            organic_results = result.get("organic", [])
+            for organic in organic_results:
+                url = organic.get("link")
+                if url:
+                    urls.append(url)
+        return urls
+
+    def _build_results(self, results, valid_url_to_snippets):
+        # Array of dictionaries that will be used by Storm to create the jsons
+        collected_results = []
+        for result in results:
             try:
                 # An array of dictionaries that contains the snippets, title of the document and url that will be used.
                 organic_results = result.get("organic")
@@ -547,7 +749,9 @@ class SerperRM(dspy.Retrieve):
                     snippets = [organic.get("snippet")]
                     if self.ENABLE_EXTRA_SNIPPET_EXTRACTION:
                         snippets.extend(
-                            valid_url_to_snippets.get(url, {}).get("snippets", [])
+                            valid_url_to_snippets.get(organic.get("link"), {}).get(
+                                "snippets", []
+                            )
                         )
                     collected_results.append(
                         {
@@ -581,6 +785,7 @@ class BraveRM(dspy.Retrieve):
         else:
             self.brave_search_api_key = os.environ["BRAVE_API_KEY"]
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
         # If not None, is_valid_source shall be a function that takes a URL and returns a boolean.
         if is_valid_source:
@@ -589,9 +794,9 @@ class BraveRM(dspy.Retrieve):
             self.is_valid_source = lambda x: True
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
-
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"BraveRM": usage}
 
     def forward(
@@ -611,7 +816,8 @@ class BraveRM(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
         collected_results = []
         for query in queries:
             try:
@@ -620,26 +826,67 @@ class BraveRM(dspy.Retrieve):
                     "Accept-Encoding": "gzip",
                     "X-Subscription-Token": self.brave_search_api_key,
                 }
-                response = requests.get(
-                    f"https://api.search.brave.com/res/v1/web/search?result_filter=web&q={query}",
-                    headers=headers,
-                ).json()
-                results = response.get("web", {}).get("results", [])
-
-                for result in results:
-                    collected_results.append(
-                        {
-                            "snippets": result.get("extra_snippets", []),
-                            "title": result.get("title"),
-                            "url": result.get("url"),
-                            "description": result.get("description"),
-                        }
+                response = (
+                    get_http_session_pool()
+                    .get(
+                        "https://api.search.brave.com/res/v1/web/search",
+                        params={"result_filter": "web", "q": query},
+                        headers=headers,
                     )
+                    .json()
+                )
+                collected_results.extend(self._parse_results(response))
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
 
         return collected_results
 
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            "X-Subscription-Token": self.brave_search_api_key,
+        }
+
+        async def search(query):
+            try:
+                response = await get_async_http_client().get(
+                    "https://api.search.brave.com/res/v1/web/search",
+                    params={"result_filter": "web", "q": query},
+                    headers=headers,
+                )
+                return self._parse_results(response.json())
+            except Exception as e:
+                logging.error(f"Error occurs when searching query {query}: {e}")
+                return []
+
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
+
+    @staticmethod
+    def _parse_results(response):
+        collected_results = []
+        for result in response.get("web", {}).get("results", []):
+            collected_results.append(
+                {
+                    "snippets": result.get("extra_snippets", []),
+                    "title": result.get("title"),
+                    "url": result.get("url"),
+                    "description": result.get("description"),
+                }
+            )
+        return collected_results
+
 
 class SearXNG(dspy.Retrieve):
     def __init__(
@@ -665,6 +912,7 @@ class SearXNG(dspy.Retrieve):
         self.searxng_api_url = searxng_api_url
         self.searxng_api_key = searxng_api_key
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
         if is_valid_source:
             self.is_valid_source = is_valid_source
@@ -672,8 +920,9 @@ class SearXNG(dspy.Retrieve):
             self.is_valid_source = lambda x: True
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"SearXNG": usage}
 
     def forward(
@@ -693,7 +942,8 @@ class SearXNG(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
         collected_results = []
         headers = (
             {"Authorization": f"Bearer {self.searxng_api_key}"}
@@ -704,24 +954,61 @@ class SearXNG(dspy.Retrieve):
         for query in queries:
             try:
                 params = {"q": query, "format": "json"}
-                response = requests.get(
+                response = get_http_session_pool().get(
                     self.searxng_api_url, headers=headers, params=params
                 )
-                results = response.json()
-
-                for r in results["results"]:
-                    if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls:
-                        collected_results.append(
-                            {
-                                "description": r.get("content", ""),
-                                "snippets": [r.get("content", "")],
-                                "title": r.get("title", ""),
-                                "url": r["url"],
-                            }
-                        )
+                collected_results.extend(
+                    self._parse_results(response.json(), exclude_urls)
+                )
+            except Exception as e:
+                logging.error(f"Error occurs when searching query {query}: {e}")
+
+        return collected_results
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+        headers = (
+            {"Authorization": f"Bearer {self.searxng_api_key}"}
+            if self.searxng_api_key
+            else {}
+        )
+
+        async def search(query):
+            try:
+                response = await get_async_http_client().get(
+                    self.searxng_api_url,
+                    headers=headers,
+                    params={"q": query, "format": "json"},
+                )
+                return self._parse_results(response.json(), exclude_urls)
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                return []
 
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
+
+    def _parse_results(self, results, exclude_urls: List[str]):
+        collected_results = []
+        for r in results["results"]:
+            if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls:
+                collected_results.append(
+                    {
+                        "description": r.get("content", ""),
+                        "snippets": [r.get("content", "")],
+                        "title": r.get("title", ""),
+                        "url": r["url"],
+                    }
+                )
         return collected_results
 
 
@@ -899,6 +1186,7 @@ class TavilySearchRM(dspy.Retrieve):
         )
 
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
         # Creates client instance that will use search. Full search params are here:
         # https://docs.tavily.com/docs/python-sdk/tavily-search/examples
@@ -913,8 +1201,9 @@ class TavilySearchRM(dspy.Retrieve):
             self.is_valid_source = lambda x: True
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"TavilySearchRM": usage}
 
     def forward(
@@ -932,51 +1221,78 @@ class TavilySearchRM(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
 
         collected_results = []
 
         for query in queries:
-            args = {
-                "max_results": self.k,
-                "include_raw_contents": self.include_raw_content,
-            }
             #  list of dicts that will be parsed to return
             responseData = self.tavily_client.search(query)
-            results = responseData.get("results")
-            for d in results:
-                # assert d is dict
-                if not isinstance(d, dict):
-                    print(f"Invalid result: {d}\n")
-                    continue
+            collected_results.extend(
+                self._parse_results(responseData, query, exclude_urls)
+            )
 
-                try:
-                    # ensure keys are present
-                    url = d.get("url", None)
-                    title = d.get("title", None)
-                    description = d.get("content", None)
-                    snippets = []
-                    if d.get("raw_body_content"):
-                        snippets.append(d.get("raw_body_content"))
-                    else:
-                        snippets.append(d.get("content"))
+        return collected_results
 
-                    # raise exception of missing key(s)
-                    if not all([url, title, description, snippets]):
-                        raise ValueError(f"Missing key(s) in result: {d}")
-                    if self.is_valid_source(url) and url not in exclude_urls:
-                        result = {
-                            "url": url,
-                            "title": title,
-                            "description": description,
-                            "snippets": snippets,
-                        }
-                        collected_results.append(result)
-                    else:
-                        print(f"invalid source {url} or url in exclude_urls")
-                except Exception as e:
-                    print(f"Error occurs when processing {result=}: {e}\n")
-                    print(f"Error occurs when searching query {query}: {e}")
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently.
+
+        The Tavily client is synchronous, so each query runs in a worker thread.
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+
+        async def search(query):
+            responseData = await asyncio.to_thread(self.tavily_client.search, query)
+            return self._parse_results(responseData, query, exclude_urls)
+
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
+
+    def _parse_results(self, responseData, query: str, exclude_urls: List[str]):
+        collected_results = []
+        results = responseData.get("results")
+        for d in results:
+            # assert d is dict
+            if not isinstance(d, dict):
+                print(f"Invalid result: {d}\n")
+                continue
+
+            try:
+                # ensure keys are present
+                url = d.get("url", None)
+                title = d.get("title", None)
+                description = d.get("content", None)
+                snippets = []
+                if d.get("raw_body_content"):
+                    snippets.append(d.get("raw_body_content"))
+                else:
+                    snippets.append(d.get("content"))
+
+                # raise exception of missing key(s)
+                if not all([url, title, description, snippets]):
+                    raise ValueError(f"Missing key(s) in result: {d}")
+                if self.is_valid_source(url) and url not in exclude_urls:
+                    result = {
+                        "url": url,
+                        "title": title,
+                        "description": description,
+                        "snippets": snippets,
+                    }
+                    collected_results.append(result)
+                else:
+                    print(f"invalid source {url} or url in exclude_urls")
+            except Exception as e:
+                print(f"Error occurs when processing {result=}: {e}\n")
+                print(f"Error occurs when searching query {query}: {e}")
 
         return collected_results
 
@@ -1039,10 +1355,12 @@ class GoogleSearch(dspy.Retrieve):
             max_thread_num=webpage_helper_max_threads,
         )
         self.usage = 0
+        self._usage_lock = threading.Lock()
 
     def get_usage_and_reset(self):
-        usage = self.usage
-        self.usage = 0
+        with self._usage_lock:
+            usage = self.usage
+            self.usage = 0
         return {"GoogleSearch": usage}
 
     def forward(
@@ -1062,7 +1380,8 @@ class GoogleSearch(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-        self.usage += len(queries)
+        with self._usage_lock:
+            self.usage += len(queries)
 
         url_to_results = {}
 
@@ -1077,18 +1396,7 @@ class GoogleSearch(dspy.Retrieve):
                     )
                     .execute()
                 )
-
-                for item in response.get("items", []):
-                    if (
-                        self.is_valid_source(item["link"])
-                        and item["link"] not in exclude_urls
-                    ):
-                        url_to_results[item["link"]] = {
-                            "title": item["title"],
-                            "url": item["link"],
-                            # "snippet": item.get("snippet", ""),  # Google search snippet is very short.
-                            "description": item.get("snippet", ""),
-                        }
+                url_to_results.update(self._parse_results(response, exclude_urls))
 
             except Exception as e:
                 logging.error(f"Error occurred while searching query {query}: {e}")
@@ -1096,12 +1404,70 @@ class GoogleSearch(dspy.Retrieve):
         valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
             list(url_to_results.keys())
         )
+        return self._attach_snippets(url_to_results, valid_url_to_snippets)
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all queries concurrently.
+
+        Calls the Custom Search JSON API directly, which returns the same response as the client library.
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        with self._usage_lock:
+            self.usage += len(queries)
+
+        async def search(query):
+            try:
+                response = await get_async_http_client().get(
+                    "https://www.googleapis.com/customsearch/v1",
+                    params={
+                        "key": self.google_search_api_key,
+                        "cx": self.google_cse_id,
+                        "q": query,
+                        "num": self.k,
+                    },
+                )
+                response.raise_for_status()
+                return self._parse_results(response.json(), exclude_urls)
+            except Exception as e:
+                logging.error(f"Error occurred while searching query {query}: {e}")
+                return {}
+
+        url_to_results = {}
+        for query_results in await asyncio.gather(
+            *(search(query) for query in queries)
+        ):
+            url_to_results.update(query_results)
+
+        valid_url_to_snippets = await self.webpage_helper.aurls_to_snippets(
+            list(url_to_results.keys())
+        )
+        return self._attach_snippets(url_to_results, valid_url_to_snippets)
+
+    def _parse_results(self, response, exclude_urls: List[str]):
+        url_to_results = {}
+        for item in response.get("items", []):
+            if self.is_valid_source(item["link"]) and item["link"] not in exclude_urls:
+                url_to_results[item["link"]] = {
+                    "title": item["title"],
+                    "url": item["link"],
+                    # "snippet": item.get("snippet", ""),  # Google search snippet is very short.
+                    "description": item.get("snippet", ""),
+                }
+        return url_to_results
+
+    @staticmethod
+    def _attach_snippets(url_to_results, valid_url_to_snippets):
         collected_results = []
         for url in valid_url_to_snippets:
             r = url_to_results[url]
             r["snippets"] = valid_url_to_snippets[url]["snippets"]
             collected_results.append(r)
-
         return collected_results
 
 
@@ -1236,3 +1602,281 @@ class AzureAISearch(dspy.Retrieve):
                 logging.error(f"Error occurs when searching query {query}: {e}")
 
         return collected_results
+
+
+class CachedRM(dspy.Retrieve):
+    """Wrap any retrieval module with a persistent search-result cache.
+
+    Results are cached per query in a SQLite file, keyed by the backend, the normalized query, k and exclude_urls,
+    so re-running a topic or running topics that share sub-queries does not pay for identical searches again.
+    Only cache misses reach the wrapped module, so its own usage counter keeps counting billed requests; cache
+    hits are reported under a separate key by `get_usage_and_reset`.
+    """
+
+    def __init__(
+        self,
+        rm: dspy.Retrieve,
+        cache_path: Optional[str] = None,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        namespace: Optional[str] = None,
+    ):
+        """
+        Params:
+            rm: The retrieval module to wrap.
+            cache_path: Path of the SQLite cache file. Defaults to ~/.storm_local_cache/search_results.db.
+            ttl_seconds: Maximum age of a cached result. None keeps results until they are evicted.
+            max_bytes: Maximum size of the cached results; least recently used results are evicted beyond it.
+            namespace: Name used for the backend in cache keys and usage reports. Defaults to the class name of
+                `rm`. Set it to tell apart instances of the same backend with different settings (e.g., market).
+        """
+        super().__init__(k=rm.k)
+        self.rm = rm
+        self.backend_name = namespace or type(rm).__name__
+        self.cache = SQLiteCache(
+            cache_path
+            or os.path.join(Path.home(), ".storm_local_cache", "search_results.db"),
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+        )
+        self.hits = 0
+        self._usage_lock = threading.Lock()
+
+    def get_usage_and_reset(self):
+        usage = {}
+        if hasattr(self.rm, "get_usage_and_reset"):
+            usage.update(self.rm.get_usage_and_reset())
+        with self._usage_lock:
+            usage[f"{self.backend_name} (cache hit)"] = self.hits
+            self.hits = 0
+        return usage
+
+    def _cache_key(self, query: str, exclude_urls: List[str]) -> str:
+        normalized_query = " ".join(query.split()).casefold()
+        key = json.dumps(
+            [self.backend_name, normalized_query, self.rm.k, sorted(set(exclude_urls))]
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str):
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._usage_lock:
+                self.hits += 1
+        return cached
+
+    def _store(self, key: str, results):
+        # Empty results usually mean the search failed, so they are not cached.
+        if results:
+            try:
+                self.cache.set(key, results)
+            except Exception as e:
+                logging.error(f"Failed to cache search results: {e}")
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Search with the wrapped module, serving repeated queries from the cache.
+
+        Args:
+            query_or_queries (Union[str, List[str]]): The query or queries to search for.
+            exclude_urls (List[str]): A list of urls to exclude from the search results.
+
+        Returns:
+            a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        collected_results = []
+        for query in queries:
+            key = self._cache_key(query, exclude_urls)
+            results = self._lookup(key)
+            if results is None:
+                results = self.rm(query_or_queries=[query], exclude_urls=exclude_urls)
+                self._store(key, results)
+            collected_results.extend(results)
+        return collected_results
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that searches all uncached queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+
+        async def search(query):
+            key = self._cache_key(query, exclude_urls)
+            # SQLite calls may wait for the file lock, so they must not block the event loop.
+            results = await asyncio.to_thread(self._lookup, key)
+            if results is None:
+                if has_native_aforward(self.rm):
+                    results = await self.rm.aforward(
+                        query_or_queries=[query], exclude_urls=exclude_urls
+                    )
+                else:
+                    results = await asyncio.to_thread(
+                        self.rm, query_or_queries=[query], exclude_urls=exclude_urls
+                    )
+                await asyncio.to_thread(self._store, key, results)
+            return results
+
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
+
+
+class RecordingRM(dspy.Retrieve):
+    """Wrap any retrieval module and record the results of every query to a `CallRecording` for `ReplayRM`.
+
+    Queries are forwarded and recorded one at a time, so a replay matches them however the pipeline batches them.
+    """
+
+    def __init__(self, rm: dspy.Retrieve, recording: CallRecording):
+        """
+        Params:
+            rm: The retrieval module to wrap.
+            recording: The `CallRecording` to append the searches to.
+        """
+        super().__init__(k=rm.k)
+        self.rm = rm
+        self.recording = recording
+
+    def get_usage_and_reset(self):
+        if hasattr(self.rm, "get_usage_and_reset"):
+            return self.rm.get_usage_and_reset()
+        return {}
+
+    def _record(self, query: str, exclude_urls: List[str], results, start: float):
+        self.recording.record(
+            "rm",
+            CallRecording.make_key(query, sorted(set(exclude_urls))),
+            {"query": query, "exclude_urls": exclude_urls},
+            results,
+            time.monotonic() - start,
+        )
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Search with the wrapped module and record the results of each query.
+
+        Args:
+            query_or_queries (Union[str, List[str]]): The query or queries to search for.
+            exclude_urls (List[str]): A list of urls to exclude from the search results.
+
+        Returns:
+            a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        collected_results = []
+        for query in queries:
+            start = time.monotonic()
+            results = self.rm(query_or_queries=[query], exclude_urls=exclude_urls)
+            self._record(query, exclude_urls, results, start)
+            collected_results.extend(results)
+        return collected_results
+
+
+class ReplayRM(dspy.Retrieve):
+    """Serve the search results recorded by `RecordingRM`, without sending any request.
+
+    Queries that were not recorded return no results, as a failed search does. Replayed searches take no time unless
+    a latency is injected, either the recorded one scaled by `latency_scale` or one drawn from `latency_sampler`.
+    """
+
+    def __init__(
+        self,
+        recording: CallRecording,
+        k: int = 3,
+        latency_scale: float = 0.0,
+        latency_sampler: Optional[Callable[[], float]] = None,
+    ):
+        """
+        Params:
+            recording: The `CallRecording` to replay.
+            k: Number of results per query, as reported to callers; the recorded results are returned as they are.
+            latency_scale: Factor applied to the recorded latency of each search. 0 replays searches without delay.
+            latency_sampler: Returns the latency of a replayed search in seconds; overrides `latency_scale`.
+        """
+        super().__init__(k=k)
+        self.recording = recording
+        self.latency_scale = latency_scale
+        self.latency_sampler = latency_sampler
+        self.usage = 0
+        self.misses = 0
+        self._usage_lock = threading.Lock()
+
+    def get_usage_and_reset(self):
+        with self._usage_lock:
+            usage = {"ReplayRM": self.usage, "ReplayRM (not recorded)": self.misses}
+            self.usage = 0
+            self.misses = 0
+        return usage
+
+    def _replay(self, query: str, exclude_urls: List[str]):
+        call = self.recording.lookup(
+            "rm", CallRecording.make_key(query, sorted(set(exclude_urls)))
+        )
+        with self._usage_lock:
+            self.usage += 1
+            if call is None:
+                self.misses += 1
+        if call is None:
+            logging.error(f"No recorded search results for query {query}.")
+            return [], 0.0
+        return call["response"], self.recording.replay_delay(
+            call, self.latency_scale, self.latency_sampler
+        )
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Serve the recorded results of each query.
+
+        Args:
+            query_or_queries (Union[str, List[str]]): The query or queries to search for.
+            exclude_urls (List[str]): A list of urls to exclude from the search results.
+
+        Returns:
+            a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        collected_results = []
+        for query in queries:
+            results, delay = self._replay(query, exclude_urls)
+            if delay:
+                time.sleep(delay)
+            collected_results.extend(results)
+        return collected_results
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that waits out the injected latencies of all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+
+        async def search(query):
+            results, delay = self._replay(query, exclude_urls)
+            if delay:
+                await asyncio.sleep(delay)
+            return results
+
+        results = await asyncio.gather(*(search(query) for query in queries))
+        return [r for query_results in results for r in query_results]
@@ -15,7 +15,7 @@ from .modules.persona_generator import StormPersonaGenerator
 from .modules.storm_dataclass import StormInformationTable, StormArticle
 from ..interface import Engine, LMConfigs, Retriever
 from ..lm import LitellmModel
-from ..utils import FileIOHelper, makeStringRed, truncate_filename
+from ..utils import FileIOHelper, LMHistorySink, makeStringRed, truncate_filename
 
 
 class STORMWikiLMConfigs(LMConfigs):
@@ -166,6 +166,60 @@ class STORMWikiRunnerArguments:
             "Consider reducing it if keep getting 'Exceed rate limit' error when calling LM API."
         },
     )
+    encoder_model_name: str = field(
+        default="paraphrase-MiniLM-L6-v2",
+        metadata={
+            "help": "SentenceTransformer model used to retrieve collected references for each section. "
+            "The model is loaded once per process and shared across topics."
+        },
+    )
+    encoder_device: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Device to run the SentenceTransformer model on, e.g. 'cpu', 'cuda', 'mps'. "
+            "If None, pick automatically."
+        },
+    )
+    vector_index_backend: str = field(
+        default="exact",
+        metadata={
+            "help": "Index used to retrieve collected references for each section: 'exact' or 'hnsw' "
+            "(approximate, requires hnswlib; useful when research collects tens of thousands of snippets)."
+        },
+    )
+    question_asker_max_conv_tokens: int = field(
+        default=3300,
+        metadata={
+            "help": "Maximum number of tokens of the conversation history shown to question_asker_lm when it asks "
+            "the next question."
+        },
+    )
+    conv_simulator_max_info_tokens: int = field(
+        default=1300,
+        metadata={
+            "help": "Maximum number of tokens of search results conv_simulator_lm answers each question from."
+        },
+    )
+    outline_gen_max_conv_tokens: int = field(
+        default=6500,
+        metadata={
+            "help": "Maximum number of tokens of the collected conversations outline_gen_lm writes the outline from."
+        },
+    )
+    article_gen_max_info_tokens: int = field(
+        default=2000,
+        metadata={
+            "help": "Maximum number of tokens of collected references article_gen_lm writes each section from."
+        },
+    )
+    lm_history_max_in_memory: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If set, each LM keeps only this many recent calls in memory, and the whole call history is "
+            "streamed to a compressed temporary file until post_run() writes llm_call_history.jsonl. Useful for long "
+            "runs. If None (default), keep the whole history in memory."
+        },
+    )
 
 
 class STORMWikiRunner(Engine):
@@ -191,20 +245,32 @@ class STORMWikiRunner(Engine):
             search_top_k=self.args.search_top_k,
             max_conv_turn=self.args.max_conv_turn,
             max_thread_num=self.args.max_thread_num,
+            question_asker_max_conv_tokens=self.args.question_asker_max_conv_tokens,
+            conv_simulator_max_info_tokens=self.args.conv_simulator_max_info_tokens,
         )
         self.storm_outline_generation_module = StormOutlineGenerationModule(
-            outline_gen_lm=self.lm_configs.outline_gen_lm
+            outline_gen_lm=self.lm_configs.outline_gen_lm,
+            max_conv_tokens=self.args.outline_gen_max_conv_tokens,
         )
         self.storm_article_generation = StormArticleGenerationModule(
             article_gen_lm=self.lm_configs.article_gen_lm,
             retrieve_top_k=self.args.retrieve_top_k,
             max_thread_num=self.args.max_thread_num,
+            encoder_model_name=self.args.encoder_model_name,
+            encoder_device=self.args.encoder_device,
+            vector_index_backend=self.args.vector_index_backend,
+            max_info_tokens=self.args.article_gen_max_info_tokens,
         )
         self.storm_article_polishing_module = StormArticlePolishingModule(
             article_gen_lm=self.lm_configs.article_gen_lm,
             article_polish_lm=self.lm_configs.article_polish_lm,
         )
 
+        if self.args.lm_history_max_in_memory is not None:
+            self.lm_configs.set_history_sink(
+                LMHistorySink(max_in_memory_entries=self.args.lm_history_max_in_memory)
+            )
+
         self.lm_configs.init_check()
         self.apply_decorators()
 
@@ -264,6 +330,7 @@ class STORMWikiRunner(Engine):
             information_table=information_table,
             article_with_outline=outline,
             callback_handler=callback_handler,
+            embeddings_dir=self.article_output_dir,
         )
         draft_article.dump_article_as_plain_text(
             os.path.join(self.article_output_dir, "storm_gen_article.txt")
@@ -274,12 +341,16 @@ class STORMWikiRunner(Engine):
         return draft_article
 
     def run_article_polishing_module(
-        self, draft_article: StormArticle, remove_duplicate: bool = False
+        self,
+        draft_article: StormArticle,
+        remove_duplicate: bool = False,
+        callback_handler: BaseCallbackHandler = None,
     ) -> StormArticle:
         polished_article = self.storm_article_polishing_module.polish_article(
             topic=self.topic,
             draft_article=draft_article,
             remove_duplicate=remove_duplicate,
+            callback_handler=callback_handler,
         )
         FileIOHelper.write_str(
             polished_article.to_string(),
@@ -290,15 +361,16 @@ class STORMWikiRunner(Engine):
     def post_run(self):
         """
         Post-run operations, including:
-        1. Dumping the run configuration.
+        1. Dumping the run configuration and the latency of LM calls per stage and role.
         2. Dumping the LLM call history.
         """
         config_log = self.lm_configs.log()
+        config_log["lm_call_telemetry"] = self.lm_telemetry
         FileIOHelper.dump_json(
             config_log, os.path.join(self.article_output_dir, "run_config.json")
         )
 
-        llm_call_history = self.lm_configs.collect_and_reset_lm_history()
+        llm_call_history = self.lm_configs.iter_and_reset_lm_history()
         with open(
             os.path.join(self.article_output_dir, "llm_call_history.jsonl"), "w"
         ) as f:
@@ -437,5 +509,7 @@ class STORMWikiRunner(Engine):
                     url_to_info_path=url_to_info_path,
                 )
             self.run_article_polishing_module(
-                draft_article=draft_article, remove_duplicate=remove_duplicate
+                draft_article=draft_article,
+                remove_duplicate=remove_duplicate,
+                callback_handler=callback_handler,
             )
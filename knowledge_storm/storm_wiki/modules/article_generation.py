@@ -2,14 +2,15 @@ import concurrent.futures
 import copy
 import logging
 from concurrent.futures import as_completed
-from typing import List, Union
+from typing import List, Optional, Union
 
 import dspy
 
 from .callback import BaseCallbackHandler
 from .storm_dataclass import StormInformationTable, StormArticle
 from ...interface import ArticleGenerationModule, Information
-from ...utils import ArticleTextProcessing
+from ...lm import stream_lm_output
+from ...utils import ArticleTextProcessing, TokenCounter
 
 
 class StormArticleGenerationModule(ArticleGenerationModule):
@@ -23,27 +24,53 @@ class StormArticleGenerationModule(ArticleGenerationModule):
         article_gen_lm=Union[dspy.dsp.LM, dspy.dsp.HFModel],
         retrieve_top_k: int = 5,
         max_thread_num: int = 10,
+        encoder_model_name: str = "paraphrase-MiniLM-L6-v2",
+        encoder_device: Optional[str] = None,
+        vector_index_backend: str = "exact",
+        max_info_tokens: int = 2000,
     ):
         super().__init__()
         self.retrieve_top_k = retrieve_top_k
+        self.encoder_model_name = encoder_model_name
+        self.encoder_device = encoder_device
+        self.vector_index_backend = vector_index_backend
         self.article_gen_lm = article_gen_lm
         self.max_thread_num = max_thread_num
-        self.section_gen = ConvToSection(engine=self.article_gen_lm)
+        self.section_gen = ConvToSection(
+            engine=self.article_gen_lm, max_info_tokens=max_info_tokens
+        )
 
     def generate_section(
-        self, topic, section_name, information_table, section_outline, section_query
+        self,
+        topic,
+        section_name,
+        information_table,
+        section_outline,
+        section_query,
+        callback_handler: Optional[BaseCallbackHandler] = None,
     ):
         collected_info: List[Information] = []
         if information_table is not None:
             collected_info = information_table.retrieve_information(
                 queries=section_query, search_top_k=self.retrieve_top_k
             )
-        output = self.section_gen(
-            topic=topic,
-            outline=section_outline,
-            section=section_name,
-            collected_info=collected_info,
-        )
+        stream_callback = None
+        if callback_handler is not None and callback_handler.streams(
+            "on_section_generation_chunk"
+        ):
+
+            def stream_callback(chunk):
+                callback_handler.on_section_generation_chunk(
+                    section_name=section_name, chunk=chunk
+                )
+
+        with stream_lm_output(stream_callback):
+            output = self.section_gen(
+                topic=topic,
+                outline=section_outline,
+                section=section_name,
+                collected_info=collected_info,
+            )
         return {
             "section_name": section_name,
             "section_content": output.section,
@@ -56,6 +83,7 @@ class StormArticleGenerationModule(ArticleGenerationModule):
         information_table: StormInformationTable,
         article_with_outline: StormArticle,
         callback_handler: BaseCallbackHandler = None,
+        embeddings_dir: Optional[str] = None,
     ) -> StormArticle:
         """
         Generate article for the topic based on the information table and article outline.
@@ -66,8 +94,15 @@ class StormArticleGenerationModule(ArticleGenerationModule):
             article_with_outline (StormArticle): The article with specified outline.
             callback_handler (BaseCallbackHandler): An optional callback handler that can be used to trigger
                 custom callbacks at various stages of the article generation process. Defaults to None.
+            embeddings_dir (Optional[str]): Directory to persist the snippet embeddings in so that later runs
+                over the same collected information skip encoding. Defaults to None (no persistence).
         """
-        information_table.prepare_table_for_retrieval()
+        information_table.prepare_table_for_retrieval(
+            encoder_model_name=self.encoder_model_name,
+            encoder_device=self.encoder_device,
+            embeddings_dir=embeddings_dir,
+            vector_index_backend=self.vector_index_backend,
+        )
 
         if article_with_outline is None:
             article_with_outline = StormArticle(topic_name=topic)
@@ -85,6 +120,7 @@ class StormArticleGenerationModule(ArticleGenerationModule):
                 information_table=information_table,
                 section_outline="",
                 section_query=[topic],
+                callback_handler=callback_handler,
             )
             section_output_dict_collection = [section_output_dict]
         else:
@@ -116,6 +152,7 @@ class StormArticleGenerationModule(ArticleGenerationModule):
                             information_table,
                             section_outline,
                             section_query,
+                            callback_handler,
                         )
                     ] = section_title
 
@@ -136,10 +173,15 @@ class StormArticleGenerationModule(ArticleGenerationModule):
 class ConvToSection(dspy.Module):
     """Use the information collected from the information-seeking conversation to write a section."""
 
-    def __init__(self, engine: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_info_tokens: int = 2000,
+    ):
         super().__init__()
         self.write_section = dspy.Predict(WriteSection)
         self.engine = engine
+        self.max_info_tokens = max_info_tokens
 
     def forward(
         self, topic: str, outline: str, section: str, collected_info: List[Information]
@@ -149,7 +191,9 @@ class ConvToSection(dspy.Module):
             info += f"[{idx + 1}]\n" + "\n".join(storm_info.snippets)
             info += "\n\n"
 
-        info = ArticleTextProcessing.limit_word_count_preserve_newline(info, 1500)
+        info = ArticleTextProcessing.limit_token_count_preserve_newline(
+            info, self.max_info_tokens, TokenCounter.for_lm(self.engine)
+        )
 
         with dspy.settings.context(lm=self.engine):
             section = ArticleTextProcessing.clean_up_section(
@@ -1,10 +1,12 @@
 import copy
-from typing import Union
+from typing import Optional, Union
 
 import dspy
 
+from .callback import BaseCallbackHandler
 from .storm_dataclass import StormArticle
 from ...interface import ArticlePolishingModule
+from ...lm import stream_lm_output
 from ...utils import ArticleTextProcessing
 
 
@@ -27,7 +29,11 @@ class StormArticlePolishingModule(ArticlePolishingModule):
         )
 
     def polish_article(
-        self, topic: str, draft_article: StormArticle, remove_duplicate: bool = False
+        self,
+        topic: str,
+        draft_article: StormArticle,
+        remove_duplicate: bool = False,
+        callback_handler: Optional[BaseCallbackHandler] = None,
     ) -> StormArticle:
         """
         Polish article.
@@ -36,12 +42,20 @@ class StormArticlePolishingModule(ArticlePolishingModule):
             topic (str): The topic of the article.
             draft_article (StormArticle): The draft article.
             remove_duplicate (bool): Whether to use one additional LM call to remove duplicates from the article.
+            callback_handler (BaseCallbackHandler): An optional callback handler that receives the polished text
+                as it is generated. Defaults to None.
         """
 
         article_text = draft_article.to_string()
-        polish_result = self.polish_page(
-            topic=topic, draft_page=article_text, polish_whole_page=remove_duplicate
-        )
+        stream_callback = None
+        if callback_handler is not None and callback_handler.streams(
+            "on_article_polishing_chunk"
+        ):
+            stream_callback = callback_handler.on_article_polishing_chunk
+        with stream_lm_output(stream_callback):
+            polish_result = self.polish_page(
+                topic=topic, draft_page=article_text, polish_whole_page=remove_duplicate
+            )
         lead_section = f"# summary\n{polish_result.lead_section}"
         polished_article = "\n\n".join([lead_section, polish_result.page])
         polished_article_dict = ArticleTextProcessing.parse_article_into_dict(
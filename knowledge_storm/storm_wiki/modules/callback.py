@@ -32,3 +32,16 @@ class BaseCallbackHandler:
     def on_outline_refinement_end(self, outline: str, **kwargs):
         """Run when the outline refinement finishes."""
         pass
+
+    def on_section_generation_chunk(self, section_name: str, chunk: str, **kwargs):
+        """Run when the next chunk of a section's text is generated. Sections are written concurrently, so this is
+        called from worker threads and chunks of different sections interleave."""
+        pass
+
+    def on_article_polishing_chunk(self, chunk: str, **kwargs):
+        """Run when the next chunk of the polished article (the lead section, then the deduplicated page) is generated."""
+        pass
+
+    def streams(self, hook: str) -> bool:
+        """Whether the chunk hook `hook` is implemented, i.e., whether LM output should be streamed to it."""
+        return getattr(type(self), hook) is not getattr(BaseCallbackHandler, hook)
@@ -10,7 +10,7 @@ from .callback import BaseCallbackHandler
 from .persona_generator import StormPersonaGenerator
 from .storm_dataclass import DialogueTurn, StormInformationTable
 from ...interface import KnowledgeCurationModule, Retriever, Information
-from ...utils import ArticleTextProcessing
+from ...utils import ArticleTextProcessing, TokenCounter
 
 try:
     from streamlit.runtime.scriptrunner import add_script_run_ctx
@@ -33,14 +33,19 @@ class ConvSimulator(dspy.Module):
         max_search_queries_per_turn: int,
         search_top_k: int,
         max_turn: int,
+        max_conv_tokens: int = 3300,
+        max_info_tokens: int = 1300,
     ):
         super().__init__()
-        self.wiki_writer = WikiWriter(engine=question_asker_engine)
+        self.wiki_writer = WikiWriter(
+            engine=question_asker_engine, max_conv_tokens=max_conv_tokens
+        )
         self.topic_expert = TopicExpert(
             engine=topic_expert_engine,
             max_search_queries=max_search_queries_per_turn,
             search_top_k=search_top_k,
             retriever=retriever,
+            max_info_tokens=max_info_tokens,
         )
         self.max_turn = max_turn
 
@@ -86,11 +91,16 @@ class WikiWriter(dspy.Module):
 
     The asked question will be used to start a next round of information seeking."""
 
-    def __init__(self, engine: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_conv_tokens: int = 3300,
+    ):
         super().__init__()
         self.ask_question_with_persona = dspy.ChainOfThought(AskQuestionWithPersona)
         self.ask_question = dspy.ChainOfThought(AskQuestion)
         self.engine = engine
+        self.max_conv_tokens = max_conv_tokens
 
     def forward(
         self,
@@ -110,7 +120,9 @@ class WikiWriter(dspy.Module):
             )
         conv = "\n".join(conv)
         conv = conv.strip() or "N/A"
-        conv = ArticleTextProcessing.limit_word_count_preserve_newline(conv, 2500)
+        conv = ArticleTextProcessing.limit_token_count_preserve_newline(
+            conv, self.max_conv_tokens, TokenCounter.for_lm(self.engine)
+        )
 
         with dspy.settings.context(lm=self.engine):
             if persona is not None and len(persona.strip()) > 0:
@@ -192,6 +204,7 @@ class TopicExpert(dspy.Module):
         max_search_queries: int,
         search_top_k: int,
         retriever: Retriever,
+        max_info_tokens: int = 1300,
     ):
         super().__init__()
         self.generate_queries = dspy.Predict(QuestionToQuery)
@@ -200,6 +213,7 @@ class TopicExpert(dspy.Module):
         self.engine = engine
         self.max_search_queries = max_search_queries
         self.search_top_k = search_top_k
+        self.max_info_tokens = max_info_tokens
 
     def forward(self, topic: str, question: str, ground_truth_url: str):
         with dspy.settings.context(lm=self.engine, show_guidelines=False):
@@ -221,8 +235,8 @@ class TopicExpert(dspy.Module):
                     info += "\n".join(f"[{n + 1}]: {s}" for s in r.snippets[:1])
                     info += "\n\n"
 
-                info = ArticleTextProcessing.limit_word_count_preserve_newline(
-                    info, 1000
+                info = ArticleTextProcessing.limit_token_count_preserve_newline(
+                    info, self.max_info_tokens, TokenCounter.for_lm(self.engine)
                 )
 
                 try:
@@ -259,6 +273,8 @@ class StormKnowledgeCurationModule(KnowledgeCurationModule):
         search_top_k: int,
         max_conv_turn: int,
         max_thread_num: int,
+        question_asker_max_conv_tokens: int = 3300,
+        conv_simulator_max_info_tokens: int = 1300,
     ):
         """
         Store args and finish initialization.
@@ -276,6 +292,8 @@ class StormKnowledgeCurationModule(KnowledgeCurationModule):
             max_search_queries_per_turn=max_search_queries_per_turn,
             search_top_k=search_top_k,
             max_turn=max_conv_turn,
+            max_conv_tokens=question_asker_max_conv_tokens,
+            max_info_tokens=conv_simulator_max_info_tokens,
         )
 
     def _get_considered_personas(self, topic: str, max_num_persona) -> List[str]:
@@ -5,7 +5,7 @@ import dspy
 from .callback import BaseCallbackHandler
 from .storm_dataclass import StormInformationTable, StormArticle
 from ...interface import OutlineGenerationModule
-from ...utils import ArticleTextProcessing
+from ...utils import ArticleTextProcessing, TokenCounter
 
 
 class StormOutlineGenerationModule(OutlineGenerationModule):
@@ -14,10 +14,16 @@ class StormOutlineGenerationModule(OutlineGenerationModule):
     curation stage, generate outline for the article.
     """
 
-    def __init__(self, outline_gen_lm: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        outline_gen_lm: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_conv_tokens: int = 6500,
+    ):
         super().__init__()
         self.outline_gen_lm = outline_gen_lm
-        self.write_outline = WriteOutline(engine=self.outline_gen_lm)
+        self.write_outline = WriteOutline(
+            engine=self.outline_gen_lm, max_conv_tokens=max_conv_tokens
+        )
 
     def generate_outline(
            
@@ -76,11 +82,16 @@ class StormOutlineGenerationModule(OutlineGenerationModule):
 class WriteOutline(dspy.Module):
     """Generate the outline for the Wikipedia page."""
 
-    def __init__(self, engine: Union[dspy.dsp.LM, dspy.dsp.HFModel]):
+    def __init__(
+        self,
+        engine: Union[dspy.dsp.LM, dspy.dsp.HFModel],
+        max_conv_tokens: int = 6500,
+    ):
         super().__init__()
         self.draft_page_outline = dspy.Predict(WritePageOutline)
         self.write_page_outline = dspy.Predict(WritePageOutlineFromConv)
         self.engine = engine
+        self.max_conv_tokens = max_conv_tokens
 
     def forward(
         self,
@@ -104,7 +115,9 @@ class WriteOutline(dspy.Module):
             ]
         )
         conv = ArticleTextProcessing.remove_citations(conv)
-        conv = ArticleTextProcessing.limit_word_count_preserve_newline(conv, 5000)
+        conv = ArticleTextProcessing.limit_token_count_preserve_newline(
+            conv, self.max_conv_tokens, TokenCounter.for_lm(self.engine)
+        )
 
         with dspy.settings.context(lm=self.engine):
             if old_outline is None:
@@ -3,14 +3,15 @@ import re
 from typing import Union, List
 
 import dspy
-import requests
 from bs4 import BeautifulSoup
 
+from ...utils import get_http_session_pool
+
 
 def get_wiki_page_title_and_toc(url):
     """Get the main title and table of contents from an url of a Wikipedia page."""
 
-    response = requests.get(url)
+    response = get_http_session_pool().get(url)
     soup = BeautifulSoup(response.content, "html.parser")
 
     # Get the main title from the first h1 tag
@@ -1,12 +1,20 @@
 import copy
+import hashlib
+import logging
+import os
 import re
 from collections import OrderedDict
 from typing import Union, Optional, Any, List, Tuple, Dict
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from ...encoder import (
+    ExactVectorIndex,
+    create_vector_index,
+    get_sentence_transformer,
+    l2_normalize,
+    recall_at_k,
+)
 from ...interface import Information, InformationTable, Article, ArticleSectionNode
 from ...utils import ArticleTextProcessing, FileIOHelper
 
@@ -76,7 +84,8 @@ class StormInformationTable(InformationTable):
                     else:
                         url_to_info[storm_info.url] = storm_info
         for url in url_to_info:
-            url_to_info[url].snippets = list(set(url_to_info[url].snippets))
+            # Deduplicate in order of appearance, so the result does not depend on string hashing.
+            url_to_info[url].snippets = list(dict.fromkeys(url_to_info[url].snippets))
         return url_to_info
 
     @staticmethod
@@ -106,15 +115,148 @@ class StormInformationTable(InformationTable):
             conversations.append((persona, dialogue_turns))
         return cls(conversations)
 
-    def prepare_table_for_retrieval(self):
-        self.encoder = SentenceTransformer("paraphrase-MiniLM-L6-v2")
+    def prepare_table_for_retrieval(
+        self,
+        encoder_model_name: str = "paraphrase-MiniLM-L6-v2",
+        encoder_device: Optional[str] = None,
+        embeddings_dir: Optional[str] = None,
+        vector_index_backend: str = "exact",
+        vector_index_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Encode all collected snippets for retrieval.
+
+        Args:
+            encoder_model_name: Name of the SentenceTransformer model used to encode snippets and queries.
+                The model is loaded once per process and shared across information tables.
+            encoder_device: Device to run the encoder on, e.g. "cpu", "cuda", "mps". If None, pick automatically.
+            embeddings_dir: If set, the normalized snippet embedding matrix is saved to
+                `snippet_embeddings.npy` (with its index in `snippet_embeddings.json`) under this directory and
+                memory-mapped on later calls whose model and snippets hash to the same value.
+            vector_index_backend: "exact" to score every snippet, or "hnsw" to search an approximate HNSW index
+                (requires `hnswlib`), which keeps retrieval fast for tables with tens of thousands of snippets.
+                For approximate backends, recall@k against exact search is logged once the index is built.
+            vector_index_kwargs: Extra arguments for the vector index, e.g. {"ef_search": 128} for "hnsw".
+        """
+        self.encoder = get_sentence_transformer(encoder_model_name, encoder_device)
         self.collected_urls = []
         self.collected_snippets = []
         for url, information in self.url_to_info.items():
-            for snippet in information.snippets:
+            # Sorted so that the rows, and with them the content hash of persisted embeddings, do not depend on
+            # the order in which snippets were collected.
+            for snippet in sorted(information.snippets):
                 self.collected_urls.append(url)
                 self.collected_snippets.append(snippet)
-        self.encoded_snippets = self.encoder.encode(self.collected_snippets)
+
+        content_hash = self._snippets_content_hash(encoder_model_name)
+        cached = None
+        if embeddings_dir is not None:
+            cached = self._load_snippet_embeddings(embeddings_dir, content_hash)
+        if cached is not None:
+            # Persisted rows are already unit-normalized.
+            self.encoded_snippets = cached
+            self.normalized_snippets = cached
+        else:
+            self.encoded_snippets = self.encoder.encode(self.collected_snippets)
+            self.normalized_snippets = l2_normalize(self.encoded_snippets)
+            if embeddings_dir is not None:
+                self._dump_snippet_embeddings(
+                    embeddings_dir, content_hash, encoder_model_name
+                )
+
+        self.vector_index = None
+        if len(self.collected_snippets) > 0:
+            self.vector_index = create_vector_index(
+                vector_index_backend,
+                dim=self.normalized_snippets.shape[1],
+                **(vector_index_kwargs or {}),
+            )
+            self.vector_index.add(self.normalized_snippets, normalized=True)
+            if not isinstance(self.vector_index, ExactVectorIndex):
+                sample_size = min(100, len(self.collected_snippets))
+                sample_rows = np.random.default_rng(0).choice(
+                    len(self.collected_snippets), size=sample_size, replace=False
+                )
+                recall = self.evaluate_index_recall(
+                    self.normalized_snippets[np.sort(sample_rows)], k=10
+                )
+                logging.info(
+                    f"{vector_index_backend} index over {len(self.collected_snippets)} snippets: "
+                    f"recall@10={recall:.3f} on {sample_size} sampled snippets"
+                )
+
+    def evaluate_index_recall(self, queries, k: int = 10) -> float:
+        """
+        Returns recall@k of the table's vector index against exact search over the same snippets.
+
+        Args:
+            queries: Query strings, or query embeddings as a 2D array.
+            k: Number of neighbours to compare per query.
+        """
+        if self.vector_index is None:
+            return 1.0
+        if isinstance(queries, str) or (
+            isinstance(queries, list) and queries and isinstance(queries[0], str)
+        ):
+            queries = self.encoder.encode(queries)
+        exact_index = ExactVectorIndex(self.normalized_snippets.shape[1])
+        exact_index.add(self.normalized_snippets, normalized=True)
+        return recall_at_k(self.vector_index, exact_index, queries, k)
+
+    def _snippets_content_hash(self, encoder_model_name: str) -> str:
+        hasher = hashlib.sha256(encoder_model_name.encode("utf-8"))
+        for url, snippet in zip(self.collected_urls, self.collected_snippets):
+            hasher.update(b"\0" + url.encode("utf-8"))
+            hasher.update(b"\0" + snippet.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _load_snippet_embeddings(
+        self, embeddings_dir: str, content_hash: str
+    ) -> Optional[np.ndarray]:
+        matrix_path = os.path.join(embeddings_dir, "snippet_embeddings.npy")
+        index_path = os.path.join(embeddings_dir, "snippet_embeddings.json")
+        if not (os.path.exists(matrix_path) and os.path.exists(index_path)):
+            return None
+        try:
+            index = FileIOHelper.load_json(index_path)
+            if index.get("content_hash") != content_hash:
+                logging.info(
+                    f"Snippet embeddings in {embeddings_dir} are stale; re-encoding."
+                )
+                return None
+            matrix = np.load(matrix_path, mmap_mode="r")
+        except Exception as e:
+            logging.warning(
+                f"Failed to load snippet embeddings from {matrix_path}: {e}"
+            )
+            return None
+        if matrix.shape[0] != len(self.collected_snippets):
+            return None
+        return matrix
+
+    def _dump_snippet_embeddings(
+        self, embeddings_dir: str, content_hash: str, encoder_model_name: str
+    ):
+        matrix_path = os.path.join(embeddings_dir, "snippet_embeddings.npy")
+        index_path = os.path.join(embeddings_dir, "snippet_embeddings.json")
+        try:
+            os.makedirs(embeddings_dir, exist_ok=True)
+            # Write to a temporary file first so that an interrupted run never leaves a truncated matrix behind.
+            tmp_path = matrix_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, self.normalized_snippets)
+            os.replace(tmp_path, matrix_path)
+            FileIOHelper.dump_json(
+                {
+                    "content_hash": content_hash,
+                    "encoder_model_name": encoder_model_name,
+                    "shape": list(self.normalized_snippets.shape),
+                    "urls": self.collected_urls,
+                },
+                index_path,
+            )
+        except Exception as e:
+            logging.warning(f"Failed to save snippet embeddings to {matrix_path}: {e}")
 
     def retrieve_information(
         self, queries: Union[List[str], str], search_top_k
@@ -123,11 +265,15 @@ class StormInformationTable(InformationTable):
         selected_snippets = []
         if type(queries) is str:
             queries = [queries]
-        for query in queries:
-            encoded_query = self.encoder.encode(query)
-            sim = cosine_similarity([encoded_query], self.encoded_snippets)[0]
-            sorted_indices = np.argsort(sim)
-            for i in sorted_indices[-search_top_k:][::-1]:
+        if not queries or self.vector_index is None or search_top_k <= 0:
+            return []
+
+        # Encode all queries in one forward pass and search the index with all of them at once.
+        _, top_k_indices = self.vector_index.search(
+            self.encoder.encode(queries), search_top_k
+        )
+        for indices in top_k_indices:
+            for i in indices:
                 selected_urls.append(self.collected_urls[i])
                 selected_snippets.append(self.collected_snippets[i])
 
@@ -137,12 +283,21 @@ class StormInformationTable(InformationTable):
                 url_to_snippets[url] = set()
             url_to_snippets[url].add(snippet)
 
-        selected_url_to_info = {}
-        for url in url_to_snippets:
-            selected_url_to_info[url] = copy.deepcopy(self.url_to_info[url])
-            selected_url_to_info[url].snippets = list(url_to_snippets[url])
+        selected_info = []
+        for url, snippets in url_to_snippets.items():
+            # Only the snippets differ from the stored information, so a shallow copy is enough.
+            info = self.url_to_info[url]
+            selected = Information(
+                url=info.url,
+                description=info.description,
+                snippets=list(snippets),
+                title=info.title,
+                meta=dict(info.meta),
+            )
+            selected.citation_uuid = info.citation_uuid
+            selected_info.append(selected)
 
-        return list(selected_url_to_info.values())
+        return selected_info
 
 
 class StormArticle(Article):
@@ -1,17 +1,32 @@
+import asyncio
 import concurrent.futures
 import dspy
+import functools
+import gzip
+import hashlib
 import httpx
+import importlib.util
 import json
 import logging
+import multiprocessing
 import os
 import pickle
 import re
+import sqlite3
+import time
+import zlib
+from collections import deque
 from langchain_huggingface import HuggingFaceEmbeddings
 from qdrant_client import QdrantClient
 import regex
 import sys
+import tempfile
+import threading
 import toml
-from typing import List, Dict
+import weakref
+from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Coroutine, List, Dict, Optional, Set, Tuple
 from tqdm import tqdm
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -60,6 +75,93 @@ def makeStringRed(message):
     return f"\033[91m {message}\033[00m"
 
 
+class TokenCounter:
+    """Counts and truncates text in tokens of a model, to fill prompts up to a token budget.
+
+    Uses the model's tiktoken encoding when it is known, and a close encoding for other models. Without tiktoken (or
+    its encoding files), falls back to a fast approximation of four characters per token. Counts are cached, since
+    the same snippets and turns are counted again for every prompt they are part of.
+    """
+
+    CHARS_PER_TOKEN = 4
+    # Shared counters by model name; see `for_lm`.
+    _counters: Dict[Optional[str], "TokenCounter"] = {}
+    _counters_lock = threading.Lock()
+    # Models whose fallback to a close encoding was logged, so it is logged once per model.
+    _fallback_models: Set[str] = set()
+    _fallback_models_lock = threading.Lock()
+
+    def __init__(self, model: Optional[str] = None, max_cached_texts: int = 8192):
+        """
+        Args:
+            model: Model name, with or without a provider prefix (e.g., "openai/gpt-4o"). None uses the approximation.
+            max_cached_texts: Number of texts whose token counts are cached.
+        """
+        self.model = model
+        self.encoding = self._load_encoding(model) if model else None
+        self.count = functools.lru_cache(maxsize=max_cached_texts)(self._count)
+
+    @classmethod
+    def _load_encoding(cls, model: str):
+        try:
+            import tiktoken
+        except ImportError:
+            logging.warning(
+                "tiktoken is not installed; token counts are approximated. Run `pip install tiktoken` for exact counts."
+            )
+            return None
+        try:
+            return tiktoken.encoding_for_model(model.split("/")[-1])
+        except KeyError:
+            with cls._fallback_models_lock:
+                first_fallback = model not in cls._fallback_models
+                cls._fallback_models.add(model)
+            if first_fallback:
+                logging.warning(
+                    f"tiktoken does not know the tokenizer of {model}; counting its tokens with o200k_base, "
+                    "which may differ from the model's own tokenizer."
+                )
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # E.g., the encoding files cannot be downloaded.
+            logging.warning(
+                f"Failed to load the tokenizer for {model}, approximating token counts: {e}"
+            )
+            return None
+
+    @classmethod
+    def for_lm(cls, lm) -> "TokenCounter":
+        """Returns the shared counter for the model of an LM client."""
+        model = getattr(lm, "model", None) or getattr(lm, "kwargs", {}).get("model")
+        if not isinstance(model, str):
+            model = None
+        with cls._counters_lock:
+            if model not in cls._counters:
+                cls._counters[model] = cls(model)
+            return cls._counters[model]
+
+    def _count(self, text: str) -> int:
+        if self.encoding is None:
+            return -(-len(text) // self.CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Returns the longest prefix of `text` within `max_tokens` tokens that does not end in a partial word."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            prefix = text[: max_tokens * self.CHARS_PER_TOKEN]
+        else:
+            prefix = self.encoding.decode(
+                self.encoding.encode(text, disallowed_special=())[:max_tokens]
+            )
+        if len(prefix) < len(text) and not text[len(prefix)].isspace():
+            prefix = prefix[: max(prefix.rfind(" "), 0)]
+        return prefix.rstrip()
+
+
 class QdrantVectorStoreManager:
     """
     Helper class for managing the Qdrant vector store, can be used with `VectorRM` in rm.py.
@@ -354,6 +456,45 @@ class ArticleTextProcessing:
 
         return limited_string.strip()
 
+    @staticmethod
+    def limit_token_count_preserve_newline(
+        input_string: str,
+        max_token_count: int,
+        token_counter: Optional[TokenCounter] = None,
+    ) -> str:
+        """
+        Limit the token count of an input string to a specified maximum, keeping complete lines while they fit.
+
+        Lines are kept verbatim as long as they fit into the budget; the first line that does not fit is truncated at a
+        word boundary and the rest is dropped.
+
+        Args:
+            input_string (str): The string to be truncated. This string may contain multiple lines.
+            max_token_count (int): The maximum number of tokens allowed in the truncated string.
+            token_counter (TokenCounter): Counts tokens for the model the string is sent to. Defaults to the
+                approximate counter.
+
+        Returns:
+            str: The truncated string with at most `max_token_count` tokens.
+        """
+        token_counter = token_counter or TokenCounter.for_lm(None)
+        if token_counter.count(input_string) <= max_token_count:
+            return input_string.strip()
+
+        lines = []
+        token_count = 0
+        for line in input_string.split("\n"):
+            # Every line after the first also costs its newline.
+            line_token_count = token_counter.count(line) + (1 if lines else 0)
+            if token_count + line_token_count > max_token_count:
+                remaining = max_token_count - token_count - (1 if lines else 0)
+                lines.append(token_counter.truncate(line, remaining))
+                break
+            lines.append(line)
+            token_count += line_token_count
+
+        return "\n".join(lines).strip()
+
     @staticmethod
     def remove_citations(s):
         """
@@ -651,85 +792,1145 @@ class FileIOHelper:
             return pickle.load(f)
 
 
+class SQLiteCache:
+    """A persistent key-value cache stored in a SQLite file.
+
+    Values are JSON-serialized and zlib-compressed. Entries older than `ttl_seconds` are treated as missing, and
+    once the stored values exceed `max_bytes` the least recently used entries are evicted. The total size of the
+    values is kept up to date by triggers, so checking the budget on every write does not scan the table. The file
+    can be shared by several threads and processes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Args:
+            path: Path of the SQLite file. Parent directories are created if needed.
+            ttl_seconds: Maximum age of an entry in seconds. None keeps entries until they are evicted.
+            max_bytes: Maximum total size of the compressed values. None disables size-based eviction.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+            )
+            for name, event, delta in [
+                ("insert", "INSERT", "new.size"),
+                ("delete", "DELETE", "-old.size"),
+                ("update", "UPDATE OF size", "new.size - old.size"),
+            ]:
+                self._conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS cache_size_{name} AFTER {event} ON cache "
+                    f"BEGIN UPDATE cache_size SET total = total + {delta} WHERE id = 0; END"
+                )
+            # The triggers exist before the total is initialized, so writes of other processes are never missed.
+            # Files written before the total was tracked are summed once.
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM cache"
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Like `get`, but returns the value together with the time it was stored."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and (
+                self.ttl_seconds is not None and now - row[1] > self.ttl_seconds
+            ):
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0])), row[1]
+
+    def set(self, key: str, value: Any, keep_created_at: bool = False):
+        """
+        Stores `value` under `key`. With `keep_created_at`, replacing an existing entry keeps its creation time, so
+        its age (and expiry after `ttl_seconds`) still counts from when it was first stored.
+        """
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        now = time.time()
+        created_at = "cache.created_at" if keep_created_at else "excluded.created_at"
+        with self._lock, self._conn:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the size trigger.
+            self._conn.execute(
+                "INSERT INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                f"created_at = {created_at}, accessed_at = excluded.accessed_at",
+                (key, blob, len(blob), now, now),
+            )
+            if self.max_bytes is not None:
+                self._evict()
+
+    def _evict(self):
+        total = self._total_size()
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% of the budget so that the next few writes do not trigger another eviction.
+        target = int(self.max_bytes * 0.9)
+        to_delete = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed_at"
+        ):
+            if total <= target:
+                break
+            to_delete.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def _total_size(self) -> int:
+        return self._conn.execute(
+            "SELECT total FROM cache_size WHERE id = 0"
+        ).fetchone()[0]
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get_stats(self, reset: bool = False) -> Dict[str, int]:
+        """
+        Returns hit/miss/expiration/eviction counters of this process and the current size of the cache.
+
+        Args:
+            reset: If True, resets the counters after retrieval.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            size = self._total_size()
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
+            if reset:
+                self.hits = self.misses = self.expirations = self.evictions = 0
+        return stats
+
+
+class LMHistorySink:
+    """Streams the call history of LM clients to a gzip-compressed JSONL file, so it does not pile up in memory.
+
+    Every LM client gets its own `LMHistoryBuffer` from `buffer`, a list-like replacement for its `history` list that
+    keeps only the client's most recent calls for `inspect_history` and appends every call to the shared file. Calls
+    are numbered in the order they were appended, which `read` uses to return any range of calls from disk.
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, max_in_memory_entries: Optional[int] = 100
+    ):
+        """
+        Args:
+            path: Path of the compressed JSONL file. Defaults to a temporary file that is removed by `close` or when
+                the sink is garbage collected.
+            max_in_memory_entries: Number of recent calls each LM client keeps in memory. None keeps all of them.
+        """
+        self._remove_file = None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="lm_history_", suffix=".jsonl.gz")
+            os.close(fd)
+            self._remove_file = weakref.finalize(self, os.remove, path)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_in_memory_entries = max_in_memory_entries
+        self._file = None
+        self._count = 0
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def buffer(self) -> "LMHistoryBuffer":
+        """Returns a new in-memory buffer of one LM client that streams its calls to this sink."""
+        return LMHistoryBuffer(self, self.max_in_memory_entries)
+
+    def append(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                # Every reopen starts a new gzip member; gzip readers concatenate them transparently.
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+            self._file.write(line)
+            self._count += 1
+
+    def mark(self) -> int:
+        """Returns the number of calls appended so far, i.e., the start of the calls appended from now on."""
+        with self._lock:
+            return self._count
+
+    def read(self, start: int = 0, end: Optional[int] = None):
+        """Yields the calls numbered `start` (inclusive) to `end` (exclusive) from disk, without loading all of them."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            end = self._count if end is None else min(end, self._count)
+        if start >= end:
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                if index >= end:
+                    break
+                if index >= start:
+                    yield json.loads(line)
+
+    def read_and_reset(self):
+        """Yields the calls appended since the previous `read_and_reset`."""
+        with self._lock:
+            start = self._cursor
+            end = self._cursor = self._count
+        return self.read(start, end)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._remove_file is not None:
+            self._remove_file()
+
+
+class LMHistoryBuffer:
+    """The `history` of one LM client while its calls are streamed to an `LMHistorySink`.
+
+    Keeps the client's most recent calls in a ring buffer, so `inspect_history` and code that indexes the history only
+    see the calls of this client, and appends every call to the shared sink.
+    """
+
+    def __init__(self, sink: LMHistorySink, max_entries: Optional[int] = 100):
+        self.sink = sink
+        self._recent = deque(maxlen=max_entries)
+
+    def append(self, entry: Dict[str, Any]):
+        self.sink.append(entry)
+        self._recent.append(entry)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self._recent)
+
+    def __iter__(self):
+        return iter(list(self._recent))
+
+    def __getitem__(self, index):
+        return list(self._recent)[index]
+
+
+class CallRecording:
+    """Recorded LM and retrieval calls, for replaying a pipeline run without live backends.
+
+    `RecordingLM` and `RecordingRM` append every call they forward, with its response and latency, to a JSONL file;
+    `ReplayLM` and `ReplayRM` serve the responses from it. Calls are matched by a key derived from the request, not by
+    their order, so a replay does not depend on how threads interleave. When the same request was recorded several
+    times, replays return the recorded responses in order and then keep returning the last one.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Path of the JSONL file. Calls recorded in an existing file are loaded for replay, and newly recorded
+                calls are appended to it.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._calls: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._replayed: Dict[Tuple[str, str], int] = {}
+        self._configs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._file = None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._load(json.loads(line))
+
+    def _load(self, record: Dict[str, Any]):
+        if record.get("kind") == "config":
+            self._configs[(record["backend"], record["name"])] = record["config"]
+        else:
+            self._calls.setdefault((record["kind"], record["key"]), []).append(record)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def _write(self, record: Dict[str, Any]):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self._load(record)
+
+    def record_config(self, backend: str, name: str, config: Dict[str, Any]):
+        """Records the configuration of a backend (e.g., the default kwargs of an LM) for its replay."""
+        self._write(dict(kind="config", backend=backend, name=name, config=config))
+
+    def get_config(self, backend: str, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._configs.get((backend, name))
+
+    def record(
+        self,
+        kind: str,
+        key: str,
+        request: Dict[str, Any],
+        response: Any,
+        latency_seconds: float,
+    ):
+        self._write(
+            dict(
+                kind=kind,
+                key=key,
+                request=request,
+                response=response,
+                latency_seconds=latency_seconds,
+            )
+        )
+
+    def lookup(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the next recorded call (with "response" and "latency_seconds") for the key, or None."""
+        with self._lock:
+            calls = self._calls.get((kind, key))
+            if not calls:
+                return None
+            index = self._replayed.get((kind, key), 0)
+            self._replayed[(kind, key)] = index + 1
+            return calls[min(index, len(calls) - 1)]
+
+    @staticmethod
+    def replay_delay(
+        call: Dict[str, Any],
+        latency_scale: float = 0.0,
+        latency_sampler: Optional[Callable[[], float]] = None,
+    ) -> float:
+        """Returns how long to wait before serving a replayed call, in seconds."""
+        if latency_sampler is not None:
+            return max(latency_sampler(), 0.0)
+        return call.get("latency_seconds", 0.0) * latency_scale
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _ConnectionStats:
+    """Counts the requests and the newly opened connections per host, from which connection reuse is derived."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, host: str, field: str):
+        with self._lock:
+            host_stats = self._stats.setdefault(
+                host, {"requests": 0, "new_connections": 0}
+            )
+            host_stats[field] += 1
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            stats = {
+                host: {
+                    **host_stats,
+                    "reused_connections": max(
+                        host_stats["requests"] - host_stats["new_connections"], 0
+                    ),
+                }
+                for host, host_stats in self._stats.items()
+            }
+            if reset:
+                for host_stats in self._stats.values():
+                    host_stats["requests"] = 0
+                    host_stats["new_connections"] = 0
+        return stats
+
+
+class AsyncHTTPClient:
+    """Asynchronous HTTP client with connection pooling and per-host concurrency limits.
+
+    `httpx.AsyncClient` connections and asyncio semaphores are bound to the event loop they are used in, so one
+    pooled client (and one semaphore per host) is kept for every event loop that uses this object. `get_stats` reports
+    per host how many requests reused a pooled connection.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        timeout: float = 10.0,
+        verify: bool = True,
+    ):
+        """
+        Args:
+            max_connections: Maximum number of open connections across all hosts.
+            max_connections_per_host: Maximum number of concurrent requests to the same host.
+            timeout: Default timeout in seconds for every request.
+            verify: Whether to verify TLS certificates.
+        """
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.verify = verify
+        # Maps each event loop to its pooled client and per-host semaphores.
+        self._loop_states = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._connection_stats = _ConnectionStats()
+
+    def _get_loop_state(
+        self,
+    ) -> Tuple[httpx.AsyncClient, Dict[str, asyncio.Semaphore]]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loop_states.get(loop)
+            if state is None:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    timeout=self.timeout,
+                    follow_redirects=True,
+                    verify=self.verify,
+                )
+                state = (client, {})
+                self._loop_states[loop] = state
+        return state
+
+    def _get_client_and_semaphore(
+        self, host: str
+    ) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        client, host_semaphores = self._get_loop_state()
+        if host not in host_semaphores:
+            host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return client, host_semaphores[host]
+
+    def _trace(self, host: str):
+        self._connection_stats.count(host, "requests")
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._connection_stats.count(host, "new_connections")
+
+        return trace
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = httpx.URL(url).host
+        client, host_semaphore = self._get_client_and_semaphore(host)
+        async with host_semaphore:
+            return await client.request(
+                method, url, extensions={"trace": self._trace(host)}, **kwargs
+            )
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Sends a request and yields the response before its body is read, holding the host's slot until exit."""
+        host = httpx.URL(url).host
+        client, host_semaphore = self._get_client_and_semaphore(host)
+        async with host_semaphore:
+            async with client.stream(
+                method, url, extensions={"trace": self._trace(host)}, **kwargs
+            ) as response:
+                yield response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        """Returns the number of requests, new connections and reused connections per host."""
+        return self._connection_stats.get_stats(reset=reset)
+
+    async def aclose(self):
+        """Closes the pooled connections of the running event loop."""
+        with self._lock:
+            state = self._loop_states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+
+
+_async_http_client: Optional[AsyncHTTPClient] = None
+_async_http_client_lock = threading.Lock()
+
+
+def get_async_http_client() -> AsyncHTTPClient:
+    """Returns the process-wide `AsyncHTTPClient` shared by all retrieval modules."""
+    global _async_http_client
+    with _async_http_client_lock:
+        if _async_http_client is None:
+            _async_http_client = AsyncHTTPClient()
+        return _async_http_client
+
+
+class HTTPSessionPool:
+    """Thread-safe pool of keep-alive HTTP sessions, one per host, shared by the blocking retrieval modules.
+
+    Search APIs are called with many small requests to the same host, so reusing connections saves a TCP and TLS
+    handshake per query. HTTP/2 additionally multiplexes concurrent requests over one connection; it is used when the
+    `h2` package is installed. `get_stats` reports per host how many requests reused a pooled connection.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        http2: Optional[bool] = None,
+    ):
+        """
+        Args:
+            max_connections_per_host: Maximum number of open (and kept alive) connections to the same host.
+            connect_timeout: Timeout in seconds for establishing a connection.
+            read_timeout: Timeout in seconds for reading, writing or waiting for a pooled connection.
+            http2: Whether to use HTTP/2 where the server supports it. Defaults to True if `h2` is installed.
+        """
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http2 = http2
+        self._clients: Dict[str, httpx.Client] = {}
+        self._lock = threading.Lock()
+        self._connection_stats = _ConnectionStats()
+
+    def _get_client(self, host: str) -> httpx.Client:
+        with self._lock:
+            client = self._clients.get(host)
+            if client is None:
+                client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections_per_host,
+                        max_keepalive_connections=self.max_connections_per_host,
+                    ),
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    follow_redirects=True,
+                )
+                self._clients[host] = client
+            return client
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = httpx.URL(url).host
+        client = self._get_client(host)
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._connection_stats.count(host, "new_connections")
+
+        self._connection_stats.count(host, "requests")
+        return client.request(method, url, extensions={"trace": trace}, **kwargs)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Dict[str, int]]:
+        """Returns the number of requests, new connections and reused connections per host."""
+        return self._connection_stats.get_stats(reset=reset)
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+_http_session_pool: Optional[HTTPSessionPool] = None
+_http_session_pool_lock = threading.Lock()
+
+
+def get_http_session_pool() -> HTTPSessionPool:
+    """Returns the process-wide `HTTPSessionPool` shared by all retrieval modules."""
+    global _http_session_pool
+    with _http_session_pool_lock:
+        if _http_session_pool is None:
+            _http_session_pool = HTTPSessionPool()
+        return _http_session_pool
+
+
+def has_native_aforward(rm) -> bool:
+    """Returns True if the retrieval module's class implements `aforward` alongside its `forward`.
+
+    `aforward` must be defined at least as far down the class hierarchy as `forward`, so that subclasses that only
+    override `forward` keep their behavior.
+    """
+    for klass in type(rm).__mro__:
+        if "aforward" in vars(klass):
+            return True
+        if "forward" in vars(klass):
+            return False
+    return False
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls.
+
+    While a call for a key is in flight, other callers with the same key wait for its result (or exception) instead of
+    making their own call. Nothing is kept once the call completes; caching finished results is left to the caches.
+    Synchronous and asynchronous callers of the same key share one call.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: str, future: concurrent.futures.Future, result, error):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn, *args, **kwargs):
+        """Calls `fn(*args, **kwargs)` unless a call for `key` is in flight, and returns its result."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, None, e)
+            raise
+        self._finish(key, future, result, None)
+        return result
+
+    async def ado(self, key: str, fn, *args, **kwargs):
+        """Async version of `do`; `fn` returns an awaitable."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, None, e)
+            raise
+        self._finish(key, future, result, None)
+        return result
+
+    def get_coalesced_and_reset(self) -> int:
+        """Get the number of calls that were served by another in-flight call and reset the counter."""
+        with self._lock:
+            coalesced = self.coalesced
+            self.coalesced = 0
+        return coalesced
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def run_coroutine_sync(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Runs a coroutine from synchronous code and returns its result.
+
+    All coroutines run on one background event loop, so synchronous callers on any thread share the pooled
+    connections of `get_async_http_client()` instead of opening new ones for every call.
+    """
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever,
+                name="knowledge-storm-async",
+                daemon=True,
+            ).start()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is _background_loop:
+        coroutine.close()
+        raise RuntimeError(
+            "run_coroutine_sync() cannot be called from a coroutine; await it directly instead."
+        )
+    return asyncio.run_coroutine_threadsafe(coroutine, _background_loop).result()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_text_splitter(snippet_chunk_size: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=snippet_chunk_size,
+        chunk_overlap=0,
+        length_function=len,
+        is_separator_regex=False,
+        separators=[
+            "\n\n",
+            "\n",
+            ".",
+            "\uff0e",  # Fullwidth full stop
+            "\u3002",  # Ideographic full stop
+            ",",
+            "\uff0c",  # Fullwidth comma
+            "\u3001",  # Ideographic comma
+            " ",
+            "\u200B",  # Zero-width space
+            "",
+        ],
+    )
+
+
+def _extract_article(
+    html: bytes, min_char_count: int, snippet_chunk_size: int, split: bool
+) -> Optional[Dict]:
+    """Extracts the article text (and its snippets) from a webpage; module-level so that worker processes can run it."""
+    article_text = extract(
+        html,
+        include_tables=False,
+        include_comments=False,
+        output_format="txt",
+    )
+    if article_text is None or len(article_text) <= min_char_count:
+        return None
+    article = {"text": article_text}
+    if split:
+        article["snippets"] = _get_text_splitter(snippet_chunk_size).split_text(
+            article_text
+        )
+    return article
+
+
+_extraction_pools: Dict[int, concurrent.futures.ProcessPoolExecutor] = {}
+_extraction_pools_lock = threading.Lock()
+
+
+def _get_extraction_pool(processes: int) -> concurrent.futures.ProcessPoolExecutor:
+    """Returns the process pool with `processes` workers shared by all `WebPageHelper`s that ask for that many."""
+    with _extraction_pools_lock:
+        pool = _extraction_pools.get(processes)
+        if pool is None:
+            # Forking a process that runs the background event loop and HTTP threads is unsafe, so workers are spawned.
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+            )
+            _extraction_pools[processes] = pool
+        return pool
+
+
+class ExtractedPageCache:
+    """Cache of the text and snippets extracted from webpages, shared by the `WebPageHelper`s of all retrievers.
+
+    Entries are keyed by the URL and the extraction settings, and keep the ETag and Last-Modified validators of the
+    page. Within `revalidate_after_seconds` of fetching, an entry is served without any request. After that, the page
+    is requested conditionally, and a 304 response serves the entry again without downloading or extracting the page.
+    If the page cannot be fetched, the stale entry is served as it is. Revalidation does not extend the lifetime of an
+    entry: it expires `ttl_seconds` after the page was downloaded. The cache file is opened on first use.
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        revalidate_after_seconds: float = 24 * 3600,
+        ttl_seconds: Optional[float] = 30 * 24 * 3600,
+        max_bytes: Optional[int] = 1024 * 1024 * 1024,
+    ):
+        """
+        Args:
+            cache_path: Path of the SQLite cache file. Defaults to ~/.storm_local_cache/extracted_pages.db.
+            revalidate_after_seconds: Age after which an entry is revalidated with a conditional request.
+            ttl_seconds: Maximum age of an entry, after which the page is downloaded again. None keeps entries until
+                they are evicted.
+            max_bytes: Maximum size of the cache; least recently used entries are evicted beyond it.
+        """
+        self.cache_path = cache_path or os.path.join(
+            Path.home(), ".storm_local_cache", "extracted_pages.db"
+        )
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.revalidate_after_seconds = revalidate_after_seconds
+        self._cache: Optional[SQLiteCache] = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    @property
+    def cache(self) -> SQLiteCache:
+        # Opened on first use, so creating web page helpers that never fetch a page does not touch the file.
+        with self._lock:
+            if self._cache is None:
+                self._cache = SQLiteCache(
+                    self.cache_path,
+                    ttl_seconds=self.ttl_seconds,
+                    max_bytes=self.max_bytes,
+                )
+            return self._cache
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.revalidated = 0
+        self.stale = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def make_key(url: str, **extraction_settings) -> str:
+        key = json.dumps([url, extraction_settings], sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(key)
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["fetched_at"] < self.revalidate_after_seconds
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(
+        self,
+        key: str,
+        article: Optional[Dict[str, Any]],
+        headers,
+        downloaded_bytes: int,
+    ):
+        """Stores the article extracted from a downloaded page (None if the page had no usable text)."""
+        try:
+            self.cache.set(
+                key,
+                {
+                    "article": article,
+                    "etag": headers.get("etag"),
+                    "last_modified": headers.get("last-modified"),
+                    "fetched_at": time.time(),
+                    "bytes": downloaded_bytes,
+                },
+            )
+        except Exception as e:
+            logging.error(f"Failed to cache extracted page: {e}")
+        with self._lock:
+            self.misses += 1
+
+    def serve(
+        self, key: str, entry: Dict[str, Any], revalidated: bool, stale: bool = False
+    ):
+        """
+        Counts a served entry. A revalidated entry is fresh again for `revalidate_after_seconds`; a `stale` entry,
+        served because its page could not be fetched, is left as it is.
+        """
+        if revalidated:
+            try:
+                self.cache.set(
+                    key, {**entry, "fetched_at": time.time()}, keep_created_at=True
+                )
+            except Exception as e:
+                logging.error(f"Failed to cache extracted page: {e}")
+        with self._lock:
+            if revalidated:
+                self.revalidated += 1
+            elif stale:
+                self.stale += 1
+            else:
+                self.hits += 1
+            self.bytes_saved += entry.get("bytes", 0)
+        return entry["article"]
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Any]:
+        """
+        Returns the hits (with and without revalidation, and stale entries served when a page could not be fetched),
+        misses, hit rate and downloaded bytes saved.
+        """
+        with self._lock:
+            served = self.hits + self.revalidated + self.stale
+            requested = served + self.misses
+            stats = {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "stale": self.stale,
+                "misses": self.misses,
+                "hit_rate": round(served / requested, 4) if requested else None,
+                "bytes_saved": self.bytes_saved,
+            }
+            if reset:
+                self._reset_stats()
+        return stats
+
+
+_extracted_page_cache: Optional[ExtractedPageCache] = None
+_extracted_page_cache_lock = threading.Lock()
+
+
+def get_extracted_page_cache() -> ExtractedPageCache:
+    """Returns the process-wide extracted-page cache, creating the default one on first use."""
+    global _extracted_page_cache
+    with _extracted_page_cache_lock:
+        if _extracted_page_cache is None:
+            _extracted_page_cache = ExtractedPageCache()
+        return _extracted_page_cache
+
+
+def set_extracted_page_cache(cache: Optional[ExtractedPageCache]):
+    """Replaces the process-wide extracted-page cache, e.g. to change its location or revalidation interval."""
+    global _extracted_page_cache
+    with _extracted_page_cache_lock:
+        _extracted_page_cache = cache
+
+
 class WebPageHelper:
     """Helper class to process web pages.
 
+    Pages are downloaded concurrently with a per-host connection limit, a deadline per URL and a cap on the bytes read
+    from each page, and only content types that text can be extracted from are read. Each page is extracted as soon as
+    it arrives, so one slow or huge page only delays its own result.
+
     Acknowledgement: Part of the code is adapted from https://github.com/stanford-oval/WikiChat project.
     """
 
+    # Content types that text can be extracted from; other pages (e.g., PDFs, images, archives) are skipped.
+    DEFAULT_CONTENT_TYPES = (
+        "text/html",
+        "application/xhtml+xml",
+        "text/plain",
+        "text/xml",
+        "application/xml",
+    )
+
     def __init__(
         self,
         min_char_count: int = 150,
         snippet_chunk_size: int = 1000,
         max_thread_num: int = 10,
+        max_bytes: int = 5 * 1024 * 1024,
+        url_timeout: float = 10.0,
+        max_connections_per_host: int = 4,
+        allowed_content_types: Optional[List[str]] = None,
+        extraction_processes: int = 0,
+        use_page_cache: bool = True,
     ):
         """
         Args:
             min_char_count: Minimum character count for the article to be considered valid.
             snippet_chunk_size: Maximum character count for each snippet.
-            max_thread_num: Maximum number of threads to use for concurrent requests (e.g., downloading webpages).
+            max_thread_num: Maximum number of webpages downloaded concurrently by one call.
+            max_bytes: Maximum number of bytes read from each webpage; longer pages are cut off there.
+            url_timeout: Deadline in seconds for downloading each webpage, including waiting for a connection.
+            max_connections_per_host: Maximum number of concurrent downloads from the same host.
+            allowed_content_types: Content types to download. Defaults to `DEFAULT_CONTENT_TYPES`; add, e.g.,
+                "application/pdf" to download PDFs as well. Pages without a content type are always downloaded.
+            extraction_processes: Number of worker processes extracting the text of downloaded pages, shared by all
+                helpers with the same setting. 0 extracts in threads of this process, where extraction is serialized
+                by the GIL.
+            use_page_cache: Whether to serve pages from the process-wide `ExtractedPageCache` (see
+                `get_extracted_page_cache`), revalidating them with conditional requests once they are stale.
         """
-        self.httpx_client = httpx.Client(verify=False)
+        self.http_client = AsyncHTTPClient(
+            max_connections_per_host=max_connections_per_host,
+            timeout=url_timeout,
+            verify=False,
+        )
         self.min_char_count = min_char_count
         self.max_thread_num = max_thread_num
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=snippet_chunk_size,
-            chunk_overlap=0,
-            length_function=len,
-            is_separator_regex=False,
-            separators=[
-                "\n\n",
-                "\n",
-                ".",
-                "\uff0e",  # Fullwidth full stop
-                "\u3002",  # Ideographic full stop
-                ",",
-                "\uff0c",  # Fullwidth comma
-                "\u3001",  # Ideographic comma
-                " ",
-                "\u200B",  # Zero-width space
-                "",
-            ],
+        self.max_bytes = max_bytes
+        self.url_timeout = url_timeout
+        self.allowed_content_types = set(
+            allowed_content_types or self.DEFAULT_CONTENT_TYPES
         )
+        self.snippet_chunk_size = snippet_chunk_size
+        self.text_splitter = _get_text_splitter(snippet_chunk_size)
+        self.extraction_processes = extraction_processes
+        self.page_cache = get_extracted_page_cache() if use_page_cache else None
+
+    async def _afetch_webpage(self, url: str, headers: Optional[Dict[str, str]]):
+        async with self.http_client.stream("GET", url, headers=headers) as res:
+            if res.status_code == 304:
+                return res.status_code, res.headers, None
+            if res.status_code >= 400:
+                logging.warning(f"Error while requesting {url!r} - {res.status_code}")
+                return None
+            content_type = res.headers.get("content-type", "")
+            content_type = content_type.split(";")[0].strip().lower()
+            if content_type and content_type not in self.allowed_content_types:
+                logging.info(f"Skipping {url!r} with content type {content_type}.")
+                return None
+            body = bytearray()
+            async for chunk in res.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= self.max_bytes:
+                    # Leaving the stream early closes the connection without reading the rest.
+                    logging.info(f"Cutting off {url!r} at {self.max_bytes} bytes.")
+                    del body[self.max_bytes :]
+                    break
+            return res.status_code, res.headers, bytes(body)
 
-    def download_webpage(self, url: str):
+    async def afetch_webpage(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Optional[Tuple[int, httpx.Headers, Optional[bytes]]]:
+        """
+        Returns the status code, headers and content of the webpage, or None if it fails, is skipped or misses its
+        deadline. The content is None for a 304 response to a conditional request.
+        """
         try:
-            res = self.httpx_client.get(url, timeout=4)
-            if res.status_code >= 400:
-                res.raise_for_status()
-            return res.content
-        except httpx.HTTPError as exc:
-            print(f"Error while requesting {exc.request.url!r} - {exc!r}")
-            return None
+            return await asyncio.wait_for(
+                self._afetch_webpage(url, headers), timeout=self.url_timeout
+            )
+        except asyncio.TimeoutError:
+            logging.warning(f"Timed out after {self.url_timeout}s requesting {url!r}")
+        except Exception as exc:
+            logging.warning(f"Error while requesting {url!r} - {exc!r}")
+        return None
 
-    def urls_to_articles(self, urls: List[str]) -> Dict:
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_thread_num
-        ) as executor:
-            htmls = list(executor.map(self.download_webpage, urls))
+    async def adownload_webpage(self, url: str) -> Optional[bytes]:
+        """Returns the content of the webpage, or None if it fails, is skipped or misses its deadline."""
+        fetched = await self.afetch_webpage(url)
+        return fetched[2] if fetched is not None else None
 
-        articles = {}
+    def download_webpage(self, url: str):
+        return run_coroutine_sync(self.adownload_webpage(url))
 
-        for h, u in zip(htmls, urls):
-            if h is None:
-                continue
-            article_text = extract(
-                h,
-                include_tables=False,
-                include_comments=False,
-                output_format="txt",
+    async def _aextract_article(self, html: bytes, split: bool) -> Optional[Dict]:
+        args = (html, self.min_char_count, self.snippet_chunk_size, split)
+        if self.extraction_processes:
+            try:
+                return await asyncio.wrap_future(
+                    _get_extraction_pool(self.extraction_processes).submit(
+                        _extract_article, *args
+                    )
+                )
+            except concurrent.futures.process.BrokenProcessPool as e:
+                logging.error(
+                    f"Extraction process pool failed, extracting in-process: {e}"
+                )
+                with _extraction_pools_lock:
+                    _extraction_pools.pop(self.extraction_processes, None)
+        return await asyncio.to_thread(_extract_article, *args)
+
+    async def _acached_article(self, url: str) -> Optional[Dict]:
+        key = self.page_cache.make_key(
+            url,
+            min_char_count=self.min_char_count,
+            snippet_chunk_size=self.snippet_chunk_size,
+            max_bytes=self.max_bytes,
+        )
+        # The cache reads and writes a SQLite file, so it is used from a worker thread to keep the event loop free.
+        entry = await asyncio.to_thread(self.page_cache.lookup, key)
+        if entry is not None and self.page_cache.is_fresh(entry):
+            return self.page_cache.serve(key, entry, revalidated=False)
+        headers = None
+        if entry is not None:
+            headers = self.page_cache.conditional_headers(entry)
+        fetched = await self.afetch_webpage(url, headers=headers)
+        if fetched is None:
+            if entry is None:
+                return None
+            # A stale page is better than none; it is requested again the next time.
+            return self.page_cache.serve(key, entry, revalidated=False, stale=True)
+        status_code, headers, html = fetched
+        if html is None:
+            if entry is None:
+                return None
+            return await asyncio.to_thread(
+                self.page_cache.serve, key, entry, revalidated=True
             )
-            if article_text is not None and len(article_text) > self.min_char_count:
-                articles[u] = {"text": article_text}
+        # Cached articles always include their snippets, so they serve both `urls_to_articles` and `urls_to_snippets`.
+        article = await self._aextract_article(html, split=True)
+        await asyncio.to_thread(self.page_cache.store, key, article, headers, len(html))
+        return article
+
+    async def _aurls_to_articles(self, urls: List[str], split: bool) -> Dict:
+        # A page holds its slot until it is extracted, so at most `max_thread_num` pages are in memory at once while
+        # the extraction of downloaded pages overlaps with the download of others.
+        slots = asyncio.Semaphore(self.max_thread_num)
+
+        async def process(url):
+            async with slots:
+                if self.page_cache is not None:
+                    article = await self._acached_article(url)
+                    if article is not None and not split:
+                        article = {"text": article["text"]}
+                    return article
+                html = await self.adownload_webpage(url)
+                if html is None:
+                    return None
+                return await self._aextract_article(html, split)
+
+        articles = await asyncio.gather(*(process(url) for url in urls))
+        # Dicts keep insertion order, so the articles follow the order of `urls`.
+        return {
+            url: article for url, article in zip(urls, articles) if article is not None
+        }
+
+    async def aurls_to_articles(self, urls: List[str]) -> Dict:
+        return await self._aurls_to_articles(urls, split=False)
+
+    async def aurls_to_snippets(self, urls: List[str]) -> Dict:
+        return await self._aurls_to_articles(urls, split=True)
 
-        return articles
+    def urls_to_articles(self, urls: List[str]) -> Dict:
+        return run_coroutine_sync(self.aurls_to_articles(urls))
 
     def urls_to_snippets(self, urls: List[str]) -> Dict:
-        articles = self.urls_to_articles(urls)
-        for u in articles:
-            articles[u]["snippets"] = self.text_splitter.split_text(articles[u]["text"])
-
-        return articles
+        return run_coroutine_sync(self.aurls_to_snippets(urls))
 
 
 def user_input_appropriateness_check(user_input):
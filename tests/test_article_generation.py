@@ -0,0 +1,114 @@
+import json
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+import knowledge_storm.lm as lm_module
+from knowledge_storm.collaborative_storm.modules.callback import (
+    BaseCallbackHandler as CoStormCallbackHandler,
+)
+from knowledge_storm.lm import LitellmModel, LMResponseCache
+from knowledge_storm.storm_wiki.modules.article_generation import (
+    StormArticleGenerationModule,
+)
+from knowledge_storm.storm_wiki.modules.callback import BaseCallbackHandler
+from knowledge_storm.storm_wiki.modules.storm_dataclass import StormArticle
+
+
+class ChunkRecorder(BaseCallbackHandler):
+    def __init__(self):
+        self.chunks = defaultdict(list)
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def on_section_generation_chunk(self, section_name, chunk, **kwargs):
+        with self.lock:
+            self.chunks[section_name].append(chunk)
+            self.threads.add(threading.current_thread())
+
+
+class ExpertChunkRecorder(CoStormCallbackHandler):
+    def on_expert_utterance_generation_chunk(self, chunk, **kwargs):
+        pass
+
+
+def test_handlers_stream_only_to_implemented_chunk_hooks():
+    assert not BaseCallbackHandler().streams("on_section_generation_chunk")
+    assert ChunkRecorder().streams("on_section_generation_chunk")
+    assert not ChunkRecorder().streams("on_article_polishing_chunk")
+    assert not CoStormCallbackHandler().streams("on_expert_utterance_generation_chunk")
+    assert ExpertChunkRecorder().streams("on_expert_utterance_generation_chunk")
+
+
+class FakeInformationTable:
+    def prepare_table_for_retrieval(self, **kwargs):
+        pass
+
+    def retrieve_information(self, queries, search_top_k):
+        return []
+
+
+class SectionWriter:
+    """Writes each section with one call to the LM, like `ConvToSection`."""
+
+    def __init__(self, lm):
+        self.lm = lm
+
+    def __call__(self, topic, outline, section, collected_info):
+        return SimpleNamespace(section=self.lm(f"# {section}")[0])
+
+
+@pytest.fixture
+def streaming_lm(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        lm_module,
+        "_lm_response_cache",
+        LMResponseCache(cache_path=str(tmp_path / "lm.db")),
+    )
+
+    def stream_completion(request, on_chunk):
+        text = f"{json.loads(request)['messages'][-1]['content']} text"
+        for word in text.split(" "):
+            on_chunk(word + " ")
+        return {
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+        }
+
+    monkeypatch.setattr(lm_module, "litellm_stream_completion", stream_completion)
+    return LitellmModel(model="test/model")
+
+
+def test_section_chunks_are_streamed_with_their_section_name(streaming_lm):
+    module = StormArticleGenerationModule(article_gen_lm=streaming_lm)
+    module.section_gen = SectionWriter(streaming_lm)
+    handler = ChunkRecorder()
+    outline = StormArticle.from_outline_str("topic", "# topic\n## Alpha\n## Beta")
+
+    module.generate_article(
+        topic="topic",
+        information_table=FakeInformationTable(),
+        article_with_outline=outline,
+        callback_handler=handler,
+    )
+
+    assert dict(handler.chunks) == {
+        "Alpha": ["# ", "Alpha ", "text "],
+        "Beta": ["# ", "Beta ", "text "],
+    }
+    assert threading.main_thread() not in handler.threads
+
+
+def test_cached_sections_are_streamed_in_one_chunk(streaming_lm):
+    module = StormArticleGenerationModule(article_gen_lm=streaming_lm)
+    module.section_gen = SectionWriter(streaming_lm)
+    handler = ChunkRecorder()
+
+    for _ in range(2):
+        module.generate_section(
+            "topic", "Alpha", None, "", ["Alpha"], callback_handler=handler
+        )
+
+    assert handler.chunks["Alpha"] == ["# ", "Alpha ", "text ", "# Alpha text"]
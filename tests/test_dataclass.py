@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from knowledge_storm.dataclass import KnowledgeBase
+
+
+class FakeLM:
+    def __init__(self):
+        self.model = "fake-model"
+        self.kwargs = {}
+        self.history = []
+
+
+class FakeEncoder:
+    """Encodes every outline to a fixed random vector."""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.vectors = {}
+        self.rng = np.random.default_rng(0)
+
+    def encode(self, texts):
+        for text in texts:
+            if text not in self.vectors:
+                self.vectors[text] = self.rng.normal(size=self.dim)
+        return np.array([self.vectors[text] for text in texts])
+
+
+@pytest.fixture
+def knowledge_base():
+    return KnowledgeBase(
+        topic="topic",
+        knowledge_base_lm=FakeLM(),
+        node_expansion_trigger_count=10,
+        encoder=FakeEncoder(),
+    )
+
+
+def update(knowledge_base, outlines):
+    knowledge_base._update_structure_index(
+        outlines, knowledge_base.encoder.encode(outlines)
+    )
+
+
+def brute_force_ranking(encoder, query, outlines):
+    def similarity(outline):
+        vector = encoder.vectors[outline]
+        return vector @ query / np.linalg.norm(vector)
+
+    return sorted(outlines, key=similarity, reverse=True)
+
+
+def test_structure_ranking_skips_stale_outlines(knowledge_base):
+    encoder = knowledge_base.encoder
+    update(knowledge_base, [f"old {idx}" for idx in range(20)])
+    outlines = [f"new {idx}" for idx in range(8)]
+    update(knowledge_base, outlines)
+    # The query is closest to outlines that no longer exist.
+    query = encoder.vectors["old 0"] + encoder.vectors["old 1"]
+    query = query + 0.1 * encoder.vectors["new 3"]
+
+    ranked = knowledge_base.rank_knowledge_base_structure(
+        query[None, :], outlines, top_k=5
+    )
+
+    assert ranked == brute_force_ranking(encoder, query, outlines)[:5]
+    assert len(knowledge_base._structure_index) == 28
+
+
+def test_structure_ranking_is_limited_to_the_given_outlines(knowledge_base):
+    outlines = [f"outline {idx}" for idx in range(10)]
+    update(knowledge_base, outlines)
+    query = knowledge_base.encoder.vectors["outline 0"]
+
+    ranked = knowledge_base.rank_knowledge_base_structure(
+        query[None, :], outlines[5:], top_k=10
+    )
+
+    assert sorted(ranked) == outlines[5:]
+    assert knowledge_base.rank_knowledge_base_structure(query, [], top_k=3) == []
+
+
+def test_structure_index_is_rebuilt_once_stale_outlines_dominate(knowledge_base):
+    outlines = ["a", "b"]
+    sizes = []
+    for idx in range(100):
+        update(knowledge_base, outlines + [f"renamed {idx}"])
+        sizes.append(len(knowledge_base._structure_index))
+
+    # The index is rebuilt when it holds more than 2 * 3 + 64 vectors.
+    assert max(sizes) == 71
+    assert sizes[sizes.index(71) + 1] == 3
+    assert set(knowledge_base._structure_index_ids) >= {"a", "b", "renamed 99"}
+    assert len(knowledge_base._structure_index_strings) == sizes[-1]
@@ -0,0 +1,270 @@
+import threading
+
+import numpy as np
+import pytest
+
+import knowledge_storm.encoder as encoder_module
+from knowledge_storm.encoder import (
+    EmbeddingStore,
+    Encoder,
+    ExactVectorIndex,
+    HNSWVectorIndex,
+    recall_at_k,
+)
+from knowledge_storm.utils import TokenCounter
+
+
+class FakeEmbeddingResponse(dict):
+    def __init__(self, data, total_tokens):
+        super().__init__(usage={"total_tokens": total_tokens})
+        self.data = data
+
+
+class FakeEmbeddingAPI:
+    """Stands in for `litellm.embedding`; texts containing "FAIL" make the whole request fail."""
+
+    def __init__(self, dim=3, max_input_tokens=8191):
+        self.dim = dim
+        self.max_input_tokens = max_input_tokens
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def vector(self, text):
+        return [float(len(text)), 1.0] + [0.0] * (self.dim - 2)
+
+    def embedding(self, model, input, **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.requests.append(inputs)
+        if any("FAIL" in text for text in inputs):
+            raise ValueError("invalid input")
+        # Items are returned in reverse order to check that they are reordered by index.
+        data = [
+            {"index": idx, "embedding": self.vector(text)}
+            for idx, text in reversed(list(enumerate(inputs)))
+        ]
+        return FakeEmbeddingResponse(data, total_tokens=len(inputs))
+
+    def get_model_info(self, model):
+        return {
+            "max_input_tokens": self.max_input_tokens,
+            "output_vector_size": self.dim,
+        }
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeEmbeddingAPI()
+    monkeypatch.setattr(encoder_module, "litellm", api)
+    monkeypatch.setattr(encoder_module.time, "sleep", lambda seconds: None)
+    return api
+
+
+def make_encoder(**kwargs):
+    kwargs.setdefault("cache_max_bytes", 0)
+    return Encoder(encoder_type="openai", api_key="test", **kwargs)
+
+
+def test_batches_are_bounded_and_rows_follow_inputs(fake_api):
+    texts = [f"text {'x' * idx}" for idx in range(10)]
+    encoder = make_encoder(batch_size=4)
+
+    embeddings = encoder.encode(texts)
+
+    assert [len(batch) for batch in fake_api.requests] == [4, 4, 2]
+    np.testing.assert_array_equal(
+        embeddings, np.array([fake_api.vector(text) for text in texts])
+    )
+    assert encoder.get_total_token_usage() == 10
+
+
+def test_batches_are_bounded_by_tokens(fake_api):
+    encoder = make_encoder(batch_size=64, max_batch_tokens=30)
+
+    encoder.encode(["x" * 40] * 1 + ["y" * 40, "z" * 40])
+
+    assert [len(batch) for batch in fake_api.requests] == [2, 1]
+
+
+def test_duplicates_are_embedded_once(fake_api):
+    encoder = make_encoder(batch_size=8)
+
+    embeddings = encoder.encode(["a", "bb", "a", "bb", "a"])
+
+    assert fake_api.requests == [["a", "bb"]]
+    assert embeddings.shape == (5, 3)
+    np.testing.assert_array_equal(embeddings[0], embeddings[2])
+    np.testing.assert_array_equal(embeddings[1], embeddings[3])
+
+
+def test_failing_batch_is_bisected_down_to_the_failing_text(fake_api):
+    texts = ["a", "FAIL1", "q", "dd", "eee", "ffff", "ggggg", "hhhhhh"]
+    encoder = make_encoder(batch_size=64, max_retries=1)
+
+    embeddings = encoder.encode(texts)
+
+    np.testing.assert_array_equal(embeddings[1], np.zeros(3))
+    for row, text in enumerate(texts):
+        if text != "FAIL1":
+            np.testing.assert_array_equal(embeddings[row], fake_api.vector(text))
+    # Only the failing text is retried on its own; its siblings are sent in the halves.
+    assert fake_api.requests.count(["FAIL1"]) == 2
+    assert ["q"] not in fake_api.requests
+
+
+def test_failed_texts_follow_the_failure_policy(fake_api):
+    with pytest.raises(RuntimeError):
+        make_encoder(max_retries=0, on_failure="raise").encode(["a", "FAIL"])
+
+    embeddings = make_encoder(max_retries=0, on_failure="nan").encode(["a", "FAIL"])
+    assert np.isnan(embeddings[1]).all()
+    assert not np.isnan(embeddings[0]).any()
+
+
+def test_all_failed_texts_are_zero_filled(fake_api):
+    embeddings = make_encoder(max_retries=0).encode(["FAIL1", "FAIL2", "FAIL1"])
+
+    np.testing.assert_array_equal(embeddings, np.zeros((3, 3)))
+
+
+def test_all_failed_texts_use_the_dimension_of_earlier_embeddings(fake_api):
+    fake_api.get_model_info = lambda model: {}
+    encoder = make_encoder(max_retries=0)
+    with pytest.raises(RuntimeError):
+        encoder.encode(["FAIL1"])
+
+    encoder.encode(["a"])
+    embeddings = encoder.encode(["FAIL1", "FAIL2"])
+
+    np.testing.assert_array_equal(embeddings, np.zeros((2, 3)))
+
+
+def test_long_inputs_are_truncated_to_the_model_limit(fake_api):
+    fake_api.max_input_tokens = 50
+    encoder = make_encoder()
+    long_text = "word " * 1000
+
+    embeddings = encoder.encode([long_text, "short"])
+
+    sent_long, sent_short = fake_api.requests[0]
+    assert sent_short == "short"
+    assert long_text.startswith(sent_long)
+    assert 0 < TokenCounter(encoder.embedding_model_name).count(sent_long) <= 50
+    # Rows are still looked up by the original text.
+    assert embeddings.shape == (2, 3)
+
+
+def test_cache_serves_repeated_texts(fake_api):
+    encoder = make_encoder(cache_max_bytes=1024 * 1024)
+
+    first = encoder.encode(["a", "bb"])
+    second = encoder.encode(["bb", "a"])
+
+    assert len(fake_api.requests) == 1
+    np.testing.assert_array_equal(second, first[::-1])
+    assert encoder.get_cache_stats()["memory"]["hits"] == 2
+
+
+def test_embedding_store_is_shared_through_the_directory(tmp_path):
+    writer = EmbeddingStore(str(tmp_path), model_name="test/model")
+    writer.put(["a", "b"], np.array([[1, 0], [0, 1]], dtype=np.float32))
+    reader = EmbeddingStore(str(tmp_path), model_name="test/model")
+
+    a, missing, b = reader.get(["a", "c", "b"])
+
+    np.testing.assert_array_equal(a, [1, 0])
+    np.testing.assert_array_equal(b, [0, 1])
+    assert missing is None
+    # Rows appended by another instance are picked up without reopening the store.
+    writer.put(["c"], np.array([[1, 1]], dtype=np.float32))
+    np.testing.assert_array_equal(reader.get(["c"])[0], [1, 1])
+    assert len(reader) == 3
+
+
+def test_embedding_store_rejects_other_dimensions(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="model")
+    store.put(["a"], np.zeros((1, 2)))
+
+    with pytest.raises(ValueError):
+        store.put(["b"], np.zeros((1, 3)))
+
+
+def test_embedding_store_compaction_keeps_recent_rows(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="model")
+    other = EmbeddingStore(str(tmp_path), model_name="model")
+    for idx in range(10):
+        store.put([f"text {idx}"], np.full((1, 4), idx, dtype=np.float32))
+    assert len(other) == 10
+
+    stats = store.compact(max_bytes=3 * 4 * 4)
+
+    assert stats["entries_before"] == 10 and stats["entries_after"] == 3
+    assert stats["bytes_after"] == 3 * 4 * 4
+    # The other instance notices the rewrite once it misses a key, and maps the compacted rows.
+    store.put(["new"], np.full((1, 4), -1, dtype=np.float32))
+    vectors = other.get([f"text {idx}" for idx in range(10)] + ["new"])
+    assert all(vector is None for vector in vectors[:7])
+    for idx in range(7, 10):
+        np.testing.assert_array_equal(vectors[idx], np.full(4, idx))
+    np.testing.assert_array_equal(vectors[10], np.full(4, -1))
+
+
+def test_embedding_store_compacts_itself_beyond_max_bytes(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="model", max_bytes=10 * 4 * 2)
+    for idx in range(12):
+        store.put([f"text {idx}"], np.full((1, 2), idx, dtype=np.float32))
+
+    assert store.get_stats()["bytes"] <= 10 * 4 * 2
+    np.testing.assert_array_equal(store.get(["text 11"])[0], [11, 11])
+    assert store.get(["text 0"])[0] is None
+
+
+def brute_force_ranking(vectors, query):
+    sims = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    return np.argsort(-sims, kind="stable"), np.sort(sims)[::-1]
+
+
+def test_exact_index_matches_brute_force_cosine_ranking():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16))
+    queries = rng.normal(size=(5, 16))
+    index = ExactVectorIndex(dim=16)
+    # Vectors added in several calls keep ids that continue from the previous calls.
+    index.add(vectors[:50])
+    index.add(vectors[50:])
+
+    scores, ids = index.search(queries, k=10)
+
+    assert ids.shape == scores.shape == (5, 10)
+    for query, query_scores, query_ids in zip(queries, scores, ids):
+        expected_ids, expected_scores = brute_force_ranking(vectors, query)
+        assert query_ids.tolist() == expected_ids[:10].tolist()
+        np.testing.assert_allclose(query_scores, expected_scores[:10], rtol=1e-5)
+    assert index.search(queries[0], k=500)[1].shape == (1, 200)
+
+
+def test_recall_of_the_exact_index_is_perfect():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(100, 8))
+    index = ExactVectorIndex(dim=8)
+    index.add(vectors)
+    other_index = ExactVectorIndex(dim=8)
+    other_index.add(vectors)
+
+    assert recall_at_k(other_index, index, rng.normal(size=(10, 8)), k=5) == 1.0
+    assert recall_at_k(ExactVectorIndex(8), ExactVectorIndex(8), vectors, k=5) == 1.0
+
+
+def test_hnsw_index_recalls_the_exact_neighbours():
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(500, 16))
+    exact_index = ExactVectorIndex(dim=16)
+    exact_index.add(vectors)
+    # A small initial capacity makes the graph grow while vectors are added.
+    index = HNSWVectorIndex(dim=16, initial_capacity=64)
+    for start in range(0, 500, 100):
+        index.add(vectors[start : start + 100])
+
+    assert len(index) == 500
+    assert recall_at_k(index, exact_index, rng.normal(size=(20, 16)), k=10) >= 0.9
@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+import types
+
+import knowledge_storm.interface as interface_module
+from knowledge_storm.interface import Engine, LMConfigs, Retriever
+from knowledge_storm.lm import LMCallTelemetry, MicroBatchDispatcher
+from knowledge_storm.utils import LMHistorySink
+
+
+class FakeLM:
+    def __init__(self, name):
+        self.name = name
+        self.history = []
+
+    def __call__(self, prompt):
+        self.history.append({"lm": self.name, "prompt": prompt})
+        return [f"{self.name}: {prompt}"]
+
+
+class FakeLMConfigs(LMConfigs):
+    def __init__(self):
+        super().__init__()
+        self.question_lm = FakeLM("question")
+        self.answer_lm = FakeLM("answer")
+
+
+def test_history_sink_is_opt_in():
+    lm_configs = FakeLMConfigs()
+    lm_configs.question_lm("q")
+
+    assert lm_configs.question_lm.history == [{"lm": "question", "prompt": "q"}]
+    assert lm_configs.collect_and_reset_lm_history() == [
+        {"lm": "question", "prompt": "q"}
+    ]
+    assert lm_configs.question_lm.history == []
+
+
+def test_history_sink_keeps_the_history_of_each_lm_separate(tmp_path):
+    lm_configs = FakeLMConfigs()
+    lm_configs.question_lm("before")
+    lm_configs.set_history_sink(
+        LMHistorySink(str(tmp_path / "history.jsonl.gz"), max_in_memory_entries=1)
+    )
+
+    lm_configs.question_lm("q1")
+    lm_configs.answer_lm("a1")
+    lm_configs.question_lm("q2")
+
+    # inspect_history of an LM shows only its own calls.
+    assert list(lm_configs.question_lm.history) == [{"lm": "question", "prompt": "q2"}]
+    assert list(lm_configs.answer_lm.history) == [{"lm": "answer", "prompt": "a1"}]
+    assert [entry["prompt"] for entry in lm_configs.iter_and_reset_lm_history()] == [
+        "before",
+        "q1",
+        "a1",
+        "q2",
+    ]
+    assert lm_configs.collect_and_reset_lm_history() == []
+
+
+def test_history_sink_attaches_lms_set_later_and_can_be_removed(tmp_path):
+    lm_configs = FakeLMConfigs()
+    lm_configs.set_history_sink(LMHistorySink(str(tmp_path / "history.jsonl.gz")))
+    lm_configs.answer_lm = FakeLM("new answer")
+    lm_configs.answer_lm("a")
+
+    assert lm_configs.collect_and_reset_lm_history() == [
+        {"lm": "new answer", "prompt": "a"}
+    ]
+
+    lm_configs.set_history_sink(None)
+    assert lm_configs.question_lm.history == []
+
+
+class DispatchedLM:
+    """Sends its calls through a micro-batch dispatcher, optionally without telemetry of its own."""
+
+    def __init__(self, telemetry=None):
+        self.dispatcher = MicroBatchDispatcher(
+            send_one=lambda prompt: [prompt], telemetry=telemetry
+        )
+        if telemetry is not None:
+            self.telemetry = telemetry
+
+    def __call__(self, prompt):
+        return self.dispatcher.submit(prompt)
+
+
+class FakeEngine(Engine):
+    def __init__(self, lm_configs):
+        super().__init__(lm_configs)
+        self.apply_decorators()
+
+    def run_knowledge_curation_module(self):
+        self.lm_configs.question_lm("q")
+        self.lm_configs.answer_lm("a")
+
+    def run_outline_generation_module(self):
+        pass
+
+    def run_article_generation_module(self):
+        pass
+
+    def run_article_polishing_module(self):
+        pass
+
+    def run(self):
+        self.run_knowledge_curation_module()
+
+
+def test_summary_reports_the_telemetry_of_each_role(capsys):
+    lm_configs = FakeLMConfigs()
+    lm_configs.question_lm = DispatchedLM(telemetry=LMCallTelemetry())
+    lm_configs.answer_lm = DispatchedLM()
+    engine = FakeEngine(lm_configs)
+
+    try:
+        engine.run()
+    finally:
+        lm_configs.question_lm.dispatcher.close()
+        lm_configs.answer_lm.dispatcher.close()
+    engine.summary()
+
+    telemetry = engine.lm_telemetry["run_knowledge_curation_module"]
+    assert telemetry["question_lm"]["calls"] == 1
+    assert telemetry["question_lm"]["queue"]["requests"] == 1
+    # A role without telemetry of its own only reports its queue.
+    assert list(telemetry["answer_lm"]) == ["queue"]
+    assert telemetry["answer_lm"]["queue"]["requests"] == 1
+    output = capsys.readouterr().out
+    assert "question_lm: 1 calls" in output
+    assert "answer_lm" not in output
+
+
+class CountingRM:
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+
+    def get_usage_and_reset(self):
+        usage = {self.name: self.queries}
+        self.queries = 0
+        return usage
+
+
+class FakeHTTPClient:
+    def __init__(self, requests, reused_connections):
+        self.requests = requests
+        self.reused_connections = reused_connections
+
+    def get_stats(self, reset=False):
+        stats = {
+            "example.com": {
+                "requests": self.requests,
+                "reused_connections": self.reused_connections,
+            }
+        }
+        if reset:
+            self.requests = self.reused_connections = 0
+        return stats
+
+
+def test_shared_http_stats_are_reported_once_per_stage(monkeypatch):
+    pool = FakeHTTPClient(requests=4, reused_connections=3)
+    async_client = FakeHTTPClient(requests=10, reused_connections=8)
+    monkeypatch.setattr(interface_module, "get_http_session_pool", lambda: pool)
+    monkeypatch.setattr(interface_module, "get_async_http_client", lambda: async_client)
+    other_retriever = Retriever(rm=CountingRM("OtherRM"))
+    engine = FakeEngine(FakeLMConfigs())
+    engine.retriever = Retriever(rm=CountingRM("EngineRM"))
+    engine.retriever.rm.queries = 2
+    engine.retriever.rm.webpage_helper = types.SimpleNamespace(
+        http_client=FakeHTTPClient(requests=5, reused_connections=1),
+        page_cache=None,
+    )
+
+    # Collecting the usage of a retriever leaves the statistics shared with other retrievers untouched.
+    assert other_retriever.collect_and_reset_rm_usage() == {"OtherRM": 0}
+    assert pool.reused_connections == 3
+    engine.run()
+
+    assert engine.rm_cost["run_knowledge_curation_module"] == {"EngineRM": 2}
+    assert engine.rm_http_stats["run_knowledge_curation_module"] == {
+        "HTTP requests": 19,
+        "reused HTTP connections": 12,
+    }
+    # The counters were reset, so the next stage reports nothing.
+    engine.run_outline_generation_module()
+    assert engine.rm_http_stats["run_outline_generation_module"] == {}
+
+
+class AsyncRM:
+    """Returns one result per query and records which path served it and how many searches overlapped."""
+
+    def __init__(self):
+        self.paths = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, query_or_queries, exclude_urls=[]):
+        return self.forward(query_or_queries, exclude_urls)
+
+    def _result(self, query, path):
+        self.paths.append(path)
+        return [
+            {
+                "url": f"https://example.com/{query}",
+                "title": query,
+                "description": "",
+                "snippets": [f"about {query} [1]"],
+            }
+        ]
+
+    def forward(self, query_or_queries, exclude_urls=[]):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        return self._result(query_or_queries[0], "forward")
+
+    async def aforward(self, query_or_queries, exclude_urls=[]):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        return self._result(query_or_queries[0], "aforward")
+
+
+class ThreadedRM(AsyncRM):
+    """Overrides only `forward`, so the inherited `aforward` must not bypass it."""
+
+    def forward(self, query_or_queries, exclude_urls=[]):
+        return super().forward(query_or_queries, exclude_urls)
+
+
+QUERIES = [f"query {idx}" for idx in range(6)]
+
+
+def test_retrieve_awaits_native_aforward_with_bounded_concurrency():
+    rm = AsyncRM()
+
+    results = Retriever(rm=rm, max_thread=2).retrieve(QUERIES)
+
+    assert rm.paths == ["aforward"] * 6
+    assert rm.max_in_flight == 2
+    assert [info.title for info in results] == QUERIES
+    assert [info.meta["query"] for info in results] == QUERIES
+    assert "[1]" not in results[0].snippets[0]
+
+
+def test_retrieve_keeps_the_threaded_path_of_forward_overrides():
+    rm = ThreadedRM()
+
+    results = Retriever(rm=rm, max_thread=2).retrieve(QUERIES)
+    async_results = asyncio.run(Retriever(rm=rm, max_thread=3).aretrieve(QUERIES))
+
+    assert rm.paths == ["forward"] * 12
+    assert rm.max_in_flight == 3
+    assert [info.title for info in results] == QUERIES
+    assert [info.title for info in async_results] == QUERIES
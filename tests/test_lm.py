@@ -0,0 +1,573 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import knowledge_storm.lm as lm_module
+from knowledge_storm.lm import (
+    LM,
+    LMCallTelemetry,
+    LMResponseCache,
+    LitellmModel,
+    MicroBatchDispatcher,
+    RateLimiter,
+    RecordingLM,
+    ReplayLM,
+    VLLMClient,
+    is_rate_limit_error,
+    parse_rate_limit_headers,
+    stream_lm_output,
+)
+from knowledge_storm.utils import CallRecording
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(lm_module.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(lm_module.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_parse_rate_limit_headers():
+    state = parse_rate_limit_headers(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "llm_provider-x-ratelimit-remaining-tokens": "1200",
+            "x-ratelimit-reset-requests": "1m30s",
+            "x-ratelimit-reset-tokens": "250ms",
+            "retry-after": "2",
+            "x-unrelated": "1",
+        }
+    )
+
+    assert state == {
+        "limit_requests": 500.0,
+        "remaining_tokens": 1200.0,
+        "reset_requests": 90.0,
+        "reset_tokens": 0.25,
+        "retry_after": 2.0,
+    }
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimitError())
+    assert not is_rate_limit_error(ValueError())
+
+
+def test_requests_per_minute_budget(clock):
+    limiter = RateLimiter(rpm=2)
+
+    async def send_three():
+        for _ in range(3):
+            async with limiter.alimit():
+                pass
+
+    asyncio.run(send_three())
+
+    # The third request waits until the bucket refilled one request (30 seconds at 2 per minute).
+    assert clock.now == pytest.approx(1030.0, abs=0.1)
+
+
+def test_tokens_per_minute_budget(clock):
+    limiter = RateLimiter(tpm=1000)
+
+    async def send(tokens):
+        async with limiter.alimit(tokens):
+            pass
+
+    asyncio.run(send(900))
+    asyncio.run(send(400))
+
+    assert clock.now == pytest.approx(1018.0, abs=0.1)
+
+
+def test_rate_limit_error_halves_concurrency_and_cools_down(clock):
+    limiter = RateLimiter(initial_concurrency=8)
+    error = RateLimitError()
+    error.response = type("Response", (), {"headers": {"retry-after": "5"}})()
+
+    with pytest.raises(RateLimitError):
+        with limiter.limit():
+            raise error
+
+    stats = limiter.get_stats()
+    assert stats["concurrency"] == 4 and stats["rate_limited"] == 1
+    asyncio.run(limiter.aacquire())
+    assert clock.now == pytest.approx(1005.0, abs=0.1)
+
+
+def test_successes_grow_concurrency_up_to_the_maximum(clock):
+    limiter = RateLimiter(initial_concurrency=1, max_concurrency=3)
+
+    for _ in range(10):
+        with limiter.limit():
+            pass
+
+    assert limiter.get_stats()["concurrency"] == 3
+
+
+def test_provider_limits_are_learned_from_headers(clock):
+    limiter = RateLimiter()
+
+    with limiter.limit() as slot:
+        slot.headers = {
+            "x-ratelimit-limit-requests": "60",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "10s",
+        }
+    asyncio.run(limiter.aacquire())
+
+    assert clock.now == pytest.approx(1010.0, abs=0.1)
+
+
+def test_in_flight_requests_are_bounded():
+    limiter = RateLimiter(initial_concurrency=2, max_concurrency=2)
+    in_flight, max_in_flight = [0], [0]
+    lock = threading.Lock()
+
+    def call():
+        with limiter.limit():
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_in_flight[0] == 2
+    assert limiter.get_stats()["successes"] == 8
+
+
+class CompletionsHandler(BaseHTTPRequestHandler):
+    """
+    Answers OpenAI-style completion requests, which may carry a list of prompts, and chat completion requests by
+    echoing each prompt.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.paths.append(self.path)
+        if self.path.endswith("/chat/completions"):
+            prompts = [body["messages"][-1]["content"]]
+            choices = [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"chat {prompts[0]}"},
+                    "finish_reason": "stop",
+                }
+            ]
+        else:
+            prompts = (
+                body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+            )
+            choices = [
+                {"index": idx, "text": f"echo {prompt}", "finish_reason": "stop"}
+                for idx, prompt in enumerate(prompts)
+            ]
+        self.server.prompt_batches.append(prompts)
+        response = {
+            "id": "cmpl-test",
+            "object": "text_completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": len(prompts),
+                "completion_tokens": len(prompts),
+                "total_tokens": 2 * len(prompts),
+            },
+        }
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def completions_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionsHandler)
+    server.prompt_batches = []
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run_concurrently(func, args):
+    results = [None] * len(args)
+    barrier = threading.Barrier(len(args))
+
+    def call(idx):
+        barrier.wait()
+        results[idx] = func(args[idx])
+
+    threads = [threading.Thread(target=call, args=(idx,)) for idx in range(len(args))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_vllm_client_batches_concurrent_prompts(completions_server):
+    client = VLLMClient(
+        model="test-model",
+        port=completions_server.server_address[1],
+        url="http://127.0.0.1",
+        max_batch_size=8,
+        # A full batch is sent as soon as it is complete, so the long window only holds it until all prompts queue.
+        batch_window_ms=60_000,
+    )
+    prompts = [f"prompt {idx}" for idx in range(8)]
+
+    try:
+        results = run_concurrently(client, prompts)
+    finally:
+        client.close()
+
+    assert results == [[f"echo {prompt}"] for prompt in prompts]
+    assert len(completions_server.prompt_batches) == 1
+    assert sorted(completions_server.prompt_batches[0]) == prompts
+    assert completions_server.paths == ["/v1/completions"]
+    queue_stats = client.dispatcher.get_stats()
+    assert queue_stats["requests"] == 8
+    assert queue_stats["batches"] == 1
+    assert queue_stats["max_queue_depth"] == 8
+    assert client.telemetry.get_stats()["calls"] == 8
+    assert client.get_usage_and_reset()["test-model"] == {
+        "prompt_tokens": 8,
+        "completion_tokens": 8,
+    }
+
+
+def test_vllm_client_sends_lone_prompts_to_the_batch_endpoint(completions_server):
+    client = VLLMClient(
+        model="test-model",
+        port=completions_server.server_address[1],
+        url="http://127.0.0.1",
+        max_batch_size=8,
+        batch_window_ms=1,
+    )
+
+    try:
+        assert client("alone") == ["echo alone"]
+    finally:
+        client.close()
+
+    assert completions_server.paths == ["/v1/completions"]
+    assert client.dispatcher.get_stats()["batches"] == 1
+    assert client.get_usage_and_reset()["test-model"] == {
+        "prompt_tokens": 1,
+        "completion_tokens": 1,
+    }
+
+
+def test_dispatcher_without_batching_bounds_concurrency():
+    in_flight, max_in_flight = [0], [0]
+    lock = threading.Lock()
+
+    def send_one(payload):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        if payload == "bad":
+            raise ValueError(payload)
+        return payload * 2
+
+    telemetry = LMCallTelemetry()
+    dispatcher = MicroBatchDispatcher(
+        send_one=send_one, max_concurrency=2, telemetry=telemetry
+    )
+
+    def submit(payload):
+        try:
+            return dispatcher.submit(payload)
+        except ValueError as e:
+            return e
+
+    results = run_concurrently(submit, ["a", "b", "bad", "c", "d", "e"])
+    dispatcher.close()
+
+    assert results[:2] == ["aa", "bb"] and results[3:] == ["cc", "dd", "ee"]
+    assert isinstance(results[2], ValueError)
+    assert max_in_flight[0] == 2
+    assert dispatcher.get_stats()["batches"] == 6
+    stats = telemetry.get_stats()
+    assert stats["calls"] == 6 and stats["errors"] == 1
+
+
+def test_closed_dispatcher_stops_its_threads():
+    dispatcher = MicroBatchDispatcher(send_one=lambda payload: payload)
+    assert dispatcher.submit("a") == "a"
+
+    dispatcher.close()
+
+    assert not any(
+        thread.name.startswith("lm-micro-batch") for thread in threading.enumerate()
+    )
+    with pytest.raises(RuntimeError):
+        dispatcher.submit("b")
+
+
+class EchoLM:
+    """Answers with the prompt and the temperature it was called with."""
+
+    def __init__(self):
+        self.model = "echo-model"
+        self.kwargs = {"model": "echo-model", "temperature": 1.0, "api_key": "secret"}
+        self.history = []
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        kwargs = {**self.kwargs, **kwargs}
+        return [f"{prompt or messages[-1]['content']} @ {kwargs['temperature']}"]
+
+    async def acall(self, prompt=None, messages=None, **kwargs):
+        return self(prompt=prompt, messages=messages, **kwargs)
+
+
+def test_replay_lm_serves_recorded_outputs(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    recording = CallRecording(path)
+    recording_lm = RecordingLM(EchoLM(), recording)
+    assert recording_lm("hello") == ["hello @ 1.0"]
+    assert recording_lm("hello", temperature=0.0) == ["hello @ 0.0"]
+    messages = [{"role": "user", "content": "hi"}]
+    assert asyncio.run(recording_lm.acall(messages=messages)) == ["hi @ 1.0"]
+    recording.close()
+    assert "secret" not in open(path).read()
+
+    replay_lm = ReplayLM(CallRecording(path), name="echo-model")
+
+    assert replay_lm.kwargs == {"model": "echo-model", "temperature": 1.0}
+    assert replay_lm("hello", temperature=0.0) == ["hello @ 0.0"]
+    assert replay_lm("hello") == ["hello @ 1.0"]
+    assert asyncio.run(replay_lm.acall(messages=messages)) == ["hi @ 1.0"]
+    assert len(replay_lm.history) == 3
+    assert replay_lm.telemetry.get_stats()["calls"] == 3
+    with pytest.raises(KeyError):
+        replay_lm("not recorded")
+
+
+def test_replay_lm_injects_latencies(tmp_path, monkeypatch):
+    recording = CallRecording(str(tmp_path / "calls.jsonl"))
+    RecordingLM(EchoLM(), recording, name="role")("hello")
+    sleeps = []
+    monkeypatch.setattr(lm_module.time, "sleep", sleeps.append)
+
+    ReplayLM(recording, name="role")("hello")
+    ReplayLM(recording, name="role", latency_sampler=lambda: 0.25)("hello")
+
+    assert sleeps == [0.25]
+
+
+class WallClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def wall_clock(monkeypatch):
+    clock = WallClock()
+    monkeypatch.setattr(lm_module.time, "time", clock.time)
+    return clock
+
+
+def test_response_cache_keys_ignore_credentials():
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    key = LMResponseCache.make_key({**request, "max_tokens": 10})
+
+    assert key == LMResponseCache.make_key(
+        {
+            **request,
+            "max_tokens": 10,
+            "api_key": "secret",
+            "Authorization": "Bearer secret",
+            "access_token": "secret",
+        }
+    )
+    assert key != LMResponseCache.make_key({**request, "max_tokens": 20})
+    assert key != LMResponseCache.make_key({**request, "max_tokens": 10}, "v2")
+    assert key != LMResponseCache.make_key(
+        {**request, "max_tokens": 10}, model_type="text"
+    )
+
+
+def test_response_cache_evicts_least_recently_used_responses():
+    cache = LMResponseCache(cache_path="", max_memory_bytes=100)
+    response = {"text": "x" * 30}
+    size = len(json.dumps(response))
+    cache.set("a", response)
+    cache.set("b", response)
+    assert cache.get("a") == response
+    cache.set("c", response)
+
+    assert 2 * size <= 100 < 3 * size
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == response
+    stats = cache.get_stats()["memory"]
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2 and stats["bytes"] == 2 * size
+
+
+def test_response_cache_expires_responses(tmp_path, wall_clock):
+    cache = LMResponseCache(cache_path=str(tmp_path / "lm.db"), ttl_seconds=100)
+    cache.set("key", {"text": "a"})
+
+    wall_clock.now += 99
+    assert cache.get("key") == {"text": "a"}
+    wall_clock.now += 2
+    assert cache.get("key") is None
+    assert cache.get_stats()["disk"]["expirations"] == 1
+
+
+def test_response_cache_promotes_disk_entries_with_their_age(tmp_path, wall_clock):
+    path = str(tmp_path / "lm.db")
+    LMResponseCache(cache_path=path, ttl_seconds=100).set("key", {"text": "a"})
+    # A new process starts with an empty memory tier.
+    cache = LMResponseCache(cache_path=path, ttl_seconds=100)
+
+    wall_clock.now += 60
+    assert cache.get("key") == {"text": "a"}
+    assert cache.get_stats()["memory"]["entries"] == 1
+    assert cache.get("key") == {"text": "a"}
+    assert cache.get_stats()["disk"]["hits"] == 1
+    wall_clock.now += 41
+    assert cache.get("key") is None
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    cache = LMResponseCache(cache_path=str(tmp_path / "lm.db"))
+    monkeypatch.setattr(lm_module, "_lm_response_cache", cache)
+    return cache
+
+
+def fake_completion(requests):
+    def completion(request):
+        requests.append(json.loads(request))
+        content = requests[-1]["messages"][-1]["content"]
+        return {
+            "choices": [{"message": {"role": "assistant", "content": f"re {content}"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        }
+
+    return completion
+
+
+def test_lm_counts_its_own_cache_hits(response_cache, monkeypatch):
+    requests = []
+    monkeypatch.setattr(lm_module, "litellm_completion", fake_completion(requests))
+    lm = LM(model="test/model", api_key="secret")
+    other_lm = LM(model="test/model", api_key="other-secret")
+
+    assert lm("hello") == ["re hello"]
+    assert lm("hello") == ["re hello"]
+    assert other_lm("hello") == ["re hello"]
+    assert LM(model="test/model", cache_namespace="v2")("hello") == ["re hello"]
+
+    assert len(requests) == 2
+    assert lm.get_cache_stats_and_reset() == {"hits": 1, "misses": 1}
+    assert lm.get_cache_stats_and_reset() == {"hits": 0, "misses": 0}
+    assert other_lm.get_cache_stats_and_reset() == {"hits": 1, "misses": 0}
+
+
+def test_litellm_model_acall_logs_like_call(response_cache, monkeypatch):
+    requests = []
+    completion = fake_completion(requests)
+
+    async def acompletion(request):
+        return completion(request)
+
+    monkeypatch.setattr(lm_module, "litellm_acompletion", acompletion)
+    monkeypatch.setattr(lm_module, "litellm_completion", completion)
+    async_lm = LitellmModel(model="test/model", api_key="secret")
+    lm = LitellmModel(model="test/model", api_key="secret")
+
+    async def call_twice():
+        return [await async_lm.acall("hello"), await async_lm.acall("hello")]
+
+    assert asyncio.run(call_twice()) == [["re hello"], ["re hello"]]
+    assert len(requests) == 1
+    assert async_lm.get_cache_stats_and_reset() == {"hits": 1, "misses": 1}
+    assert [lm("hello"), lm("hello")] == [["re hello"], ["re hello"]]
+    assert len(requests) == 1
+
+    assert async_lm.history == lm.history
+    assert len(async_lm.history) == 2
+    assert async_lm.history[0]["outputs"] == ["re hello"]
+    assert async_lm.history[0]["usage"]["prompt_tokens"] == 3
+    assert "api_key" not in async_lm.history[0]["kwargs"]
+    usage = {"test/model": {"prompt_tokens": 6, "completion_tokens": 4}}
+    assert async_lm.get_usage_and_reset() == usage == lm.get_usage_and_reset()
+
+
+def fake_stream_completion(requests):
+    completion = fake_completion(requests)
+
+    def stream_completion(request, on_chunk):
+        response = completion(request)
+        for word in response["choices"][0]["message"]["content"].split(" "):
+            on_chunk(word + " ")
+        return response
+
+    return stream_completion
+
+
+def test_lm_streams_chunks_and_sends_cache_hits_whole(response_cache, monkeypatch):
+    requests = []
+    monkeypatch.setattr(
+        lm_module, "litellm_stream_completion", fake_stream_completion(requests)
+    )
+    lm = LitellmModel(model="test/model")
+    chunks = []
+
+    with stream_lm_output(chunks.append):
+        assert lm("to be streamed") == ["re to be streamed"]
+    streamed, chunks[:] = list(chunks), []
+    with stream_lm_output(chunks.append):
+        assert lm("to be streamed") == ["re to be streamed"]
+    cached, chunks[:] = list(chunks), []
+    lm("to be streamed")
+
+    assert streamed == ["re ", "to ", "be ", "streamed "]
+    assert cached == ["re to be streamed"]
+    assert chunks == []
+    assert len(requests) == 1
@@ -0,0 +1,389 @@
+import asyncio
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import knowledge_storm.rm as rm_module
+import knowledge_storm.utils as utils
+from knowledge_storm.rm import (
+    BingSearch,
+    BraveRM,
+    CachedRM,
+    GoogleSearch,
+    RecordingRM,
+    ReplayRM,
+    SearXNG,
+    SerperRM,
+    TavilySearchRM,
+    YouRM,
+)
+from knowledge_storm.utils import CallRecording, ExtractedPageCache
+
+
+class FakeRM:
+    """Returns one result per query and counts the queries that reach it."""
+
+    def __init__(self, k=3, empty_queries=()):
+        self.k = k
+        self.queries = []
+        self.empty_queries = set(empty_queries)
+
+    def __call__(self, query_or_queries, exclude_urls=[]):
+        return self.forward(query_or_queries, exclude_urls)
+
+    def forward(self, query_or_queries, exclude_urls=[]):
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        results = []
+        for query in queries:
+            self.queries.append(query)
+            if query not in self.empty_queries:
+                results.append(
+                    {
+                        "url": f"https://example.com/{query}",
+                        "title": query,
+                        "description": "",
+                        "snippets": [f"about {query}"],
+                    }
+                )
+        return results
+
+    def get_usage_and_reset(self):
+        usage = {"FakeRM": len(self.queries)}
+        self.queries = []
+        return usage
+
+
+def test_cached_rm_serves_repeated_queries(tmp_path):
+    rm = FakeRM()
+    cached_rm = CachedRM(rm, cache_path=str(tmp_path / "search.db"))
+
+    first = cached_rm.forward(["solar power", "wind power"])
+    second = cached_rm.forward(["  Solar   POWER ", "tidal power"])
+
+    assert rm.queries == ["solar power", "wind power", "tidal power"]
+    assert second[0] == first[0]
+    assert cached_rm.get_usage_and_reset() == {"FakeRM": 3, "FakeRM (cache hit)": 1}
+
+
+def test_cached_rm_keys_on_excluded_urls_and_skips_empty_results(tmp_path):
+    rm = FakeRM(empty_queries={"nothing"})
+    cached_rm = CachedRM(rm, cache_path=str(tmp_path / "search.db"))
+
+    cached_rm.forward("query")
+    cached_rm.forward("query", exclude_urls=["https://example.com/other"])
+    cached_rm.forward("nothing")
+    cached_rm.forward("nothing")
+
+    assert rm.queries == ["query", "query", "nothing", "nothing"]
+
+
+def test_cached_rm_is_shared_through_the_cache_file(tmp_path):
+    CachedRM(FakeRM(), cache_path=str(tmp_path / "search.db")).forward("query")
+    rm = FakeRM()
+
+    results = CachedRM(rm, cache_path=str(tmp_path / "search.db")).forward("query")
+
+    assert rm.queries == [] and results[0]["title"] == "query"
+
+
+def test_cached_rm_aforward_does_not_block_the_event_loop(tmp_path, monkeypatch):
+    rm = FakeRM()
+    cached_rm = CachedRM(rm, cache_path=str(tmp_path / "search.db"))
+    cached_rm.forward("cached")
+    cache_threads = set()
+
+    def lookup(key, lookup=cached_rm._lookup):
+        # A slow SQLite lookup would stall every other coroutine if it ran on the loop's thread.
+        cache_threads.add(threading.current_thread())
+        return lookup(key)
+
+    monkeypatch.setattr(cached_rm, "_lookup", lookup)
+
+    results = asyncio.run(cached_rm.aforward(["cached", "new"]))
+
+    assert [result["title"] for result in results] == ["cached", "new"]
+    assert threading.main_thread() not in cache_threads
+    assert rm.queries == ["cached", "new"]
+
+
+def test_replay_rm_serves_recorded_queries(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    rm = FakeRM(empty_queries={"nothing"})
+    recording = CallRecording(path)
+    recorded = RecordingRM(rm, recording).forward(
+        ["solar power", "nothing"], exclude_urls=["https://a"]
+    )
+    recording.close()
+
+    replay_rm = ReplayRM(CallRecording(path))
+
+    # Queries are recorded one by one, so they replay however they are batched.
+    assert replay_rm.forward("solar power", exclude_urls=["https://a"]) == recorded
+    assert replay_rm.forward(["nothing"], exclude_urls=["https://a"]) == []
+    assert replay_rm.forward("solar power") == []
+    assert replay_rm.get_usage_and_reset() == {
+        "ReplayRM": 3,
+        "ReplayRM (not recorded)": 1,
+    }
+
+
+def test_replay_rm_injects_latencies_concurrently(tmp_path, monkeypatch):
+    recording = CallRecording(str(tmp_path / "calls.jsonl"))
+    RecordingRM(FakeRM(), recording).forward(["a", "b", "c"])
+    replay_rm = ReplayRM(recording, latency_sampler=lambda: 0.2)
+
+    start = time.monotonic()
+    results = asyncio.run(replay_rm.aforward(["a", "b", "c"]))
+
+    assert [result["title"] for result in results] == ["a", "b", "c"]
+    assert 0.2 <= time.monotonic() - start < 0.5
+
+
+def test_serper_fallback_searches_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        utils,
+        "_extracted_page_cache",
+        ExtractedPageCache(str(tmp_path / "pages.db")),
+    )
+    rm = SerperRM(serper_search_api_key="test", webpage_helper_max_threads=3)
+    in_flight, max_in_flight = [0], [0]
+    lock = threading.Lock()
+
+    def serper_runner(query_params):
+        if isinstance(query_params, list):
+            raise RuntimeError("batch endpoint unavailable")
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return {"organic": []}
+
+    monkeypatch.setattr(rm, "serper_runner", serper_runner)
+
+    results = rm._search_batch(rm._search_params([f"q{idx}" for idx in range(20)])[0])
+
+    assert len(results) == 20
+    assert max_in_flight[0] == 3
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeAsyncHTTPClient:
+    """Answers every GET request to a URL with the canned JSON response of that URL."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    async def get(self, url, params=None, headers=None):
+        self.requests.append((url, params))
+        return FakeResponse(self.responses[url])
+
+
+@pytest.fixture
+def http_client(monkeypatch):
+    client = FakeAsyncHTTPClient({})
+    monkeypatch.setattr(rm_module, "get_async_http_client", lambda: client)
+    return client
+
+
+def fake_snippets(rm):
+    """Makes the webpage helper of `rm` answer with one snippet per URL instead of downloading the pages."""
+
+    async def aurls_to_snippets(urls):
+        return {url: {"snippets": [f"page {url}"]} for url in urls}
+
+    rm.webpage_helper.aurls_to_snippets = aurls_to_snippets
+
+
+def search(rm, queries, exclude_urls=()):
+    results = asyncio.run(rm.aforward(queries, exclude_urls=list(exclude_urls)))
+    return results, rm.get_usage_and_reset()
+
+
+def test_you_rm_aforward(http_client):
+    http_client.responses["https://api.ydc-index.io/search"] = {
+        "hits": [
+            {"url": f"https://a/{idx}", "title": "A", "description": "", "snippets": []}
+            for idx in range(4)
+        ]
+    }
+    rm = YouRM(ydc_api_key="test", k=2)
+
+    results, usage = search(rm, ["q1", "q2"], exclude_urls=["https://a/0"])
+
+    assert [r["url"] for r in results] == ["https://a/1", "https://a/2"] * 2
+    assert [params["query"] for _, params in http_client.requests] == ["q1", "q2"]
+    assert usage == {"YouRM": 2}
+
+
+def test_bing_search_aforward(http_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        utils, "_extracted_page_cache", ExtractedPageCache(str(tmp_path / "p.db"))
+    )
+    http_client.responses["https://api.bing.microsoft.com/v7.0/search"] = {
+        "webPages": {
+            "value": [
+                {"url": "https://a", "name": "A", "snippet": "about a"},
+                {"url": "https://b", "name": "B", "snippet": "about b"},
+            ]
+        }
+    }
+    rm = BingSearch(bing_search_api_key="test")
+    fake_snippets(rm)
+
+    results, usage = search(rm, ["q"], exclude_urls=["https://b"])
+
+    assert results == [
+        {
+            "url": "https://a",
+            "title": "A",
+            "description": "about a",
+            "snippets": ["page https://a"],
+        }
+    ]
+    assert http_client.requests[0][1]["q"] == "q"
+    assert usage == {"BingSearch": 1}
+
+
+def test_brave_rm_aforward(http_client):
+    http_client.responses["https://api.search.brave.com/res/v1/web/search"] = {
+        "web": {
+            "results": [
+                {
+                    "url": "https://a",
+                    "title": "A",
+                    "description": "about a",
+                    "extra_snippets": ["a1", "a2"],
+                }
+            ]
+        }
+    }
+
+    results, usage = search(BraveRM(brave_search_api_key="test"), ["q"])
+
+    assert results == [
+        {
+            "url": "https://a",
+            "title": "A",
+            "description": "about a",
+            "snippets": ["a1", "a2"],
+        }
+    ]
+    assert usage == {"BraveRM": 1}
+
+
+def test_searxng_aforward(http_client):
+    http_client.responses["http://searx.local/search"] = {
+        "results": [
+            {"url": "https://a", "title": "A", "content": "about a"},
+            {"url": "https://b", "title": "B", "content": "about b"},
+        ]
+    }
+    rm = SearXNG(
+        searxng_api_url="http://searx.local/search",
+        is_valid_source=lambda url: url != "https://b",
+    )
+
+    results, usage = search(rm, ["q"])
+
+    assert results == [
+        {
+            "url": "https://a",
+            "title": "A",
+            "description": "about a",
+            "snippets": ["about a"],
+        }
+    ]
+    assert http_client.requests == [
+        ("http://searx.local/search", {"q": "q", "format": "json"})
+    ]
+    assert usage == {"SearXNG": 1}
+
+
+class FakeTavilyClient:
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def search(self, query):
+        return {
+            "results": [
+                {"url": f"https://{query}", "title": query, "content": "text"},
+                {
+                    "url": "https://raw",
+                    "title": "Raw",
+                    "content": "short",
+                    "raw_body_content": "full text",
+                },
+                "not a result",
+            ]
+        }
+
+
+def test_tavily_search_rm_aforward(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        utils, "_extracted_page_cache", ExtractedPageCache(str(tmp_path / "p.db"))
+    )
+    monkeypatch.setitem(
+        sys.modules, "tavily", types.SimpleNamespace(TavilyClient=FakeTavilyClient)
+    )
+    rm = TavilySearchRM(tavily_search_api_key="test")
+
+    results, usage = search(rm, ["a", "b"], exclude_urls=["https://b"])
+
+    assert [(r["url"], r["snippets"]) for r in results] == [
+        ("https://a", ["text"]),
+        ("https://raw", ["full text"]),
+        ("https://raw", ["full text"]),
+    ]
+    assert usage == {"TavilySearchRM": 2}
+
+
+def test_google_search_aforward(http_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        utils, "_extracted_page_cache", ExtractedPageCache(str(tmp_path / "p.db"))
+    )
+    discovery = types.SimpleNamespace(build=lambda *args, **kwargs: None)
+    monkeypatch.setitem(sys.modules, "googleapiclient", types.ModuleType("g"))
+    monkeypatch.setitem(sys.modules, "googleapiclient.discovery", discovery)
+    http_client.responses["https://www.googleapis.com/customsearch/v1"] = {
+        "items": [{"link": "https://a", "title": "A", "snippet": "about a"}]
+    }
+    rm = GoogleSearch(google_search_api_key="test", google_cse_id="cse", k=5)
+    fake_snippets(rm)
+
+    results, usage = search(rm, ["q"])
+
+    assert results == [
+        {
+            "url": "https://a",
+            "title": "A",
+            "description": "about a",
+            "snippets": ["page https://a"],
+        }
+    ]
+    assert http_client.requests[0][1] == {
+        "key": "test",
+        "cx": "cse",
+        "q": "q",
+        "num": 5,
+    }
+    assert usage == {"GoogleSearch": 1}
@@ -0,0 +1,187 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+import knowledge_storm.storm_wiki.modules.storm_dataclass as storm_dataclass
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Builds the information table in a fresh interpreter with a fake sentence encoder and reports what it encoded.
+RELOAD_SCRIPT = textwrap.dedent("""
+    import hashlib, json, sys
+
+    import numpy as np
+
+    import knowledge_storm.storm_wiki.modules.storm_dataclass as storm_dataclass
+
+    class FakeSentenceEncoder:
+        def __init__(self):
+            self.num_encoded = 0
+
+        def encode(self, texts):
+            self.num_encoded += len(texts)
+            return np.array(
+                [np.frombuffer(hashlib.sha256(t.encode()).digest()[:16], dtype=np.uint8) for t in texts],
+                dtype=np.float32,
+            )
+
+    encoder = FakeSentenceEncoder()
+    storm_dataclass.get_sentence_transformer = lambda *args, **kwargs: encoder
+    log_path, embeddings_dir = sys.argv[1:]
+    table = storm_dataclass.StormInformationTable.from_conversation_log_file(log_path)
+    table.prepare_table_for_retrieval(embeddings_dir=embeddings_dir)
+    expected = storm_dataclass.l2_normalize(encoder.encode(table.collected_snippets))
+    print(json.dumps({
+        "num_encoded": encoder.num_encoded - len(table.collected_snippets),
+        "rows_match": bool(np.allclose(table.normalized_snippets, expected)),
+    }))
+    """)
+
+
+def make_conversation_log(path):
+    def info(url, snippets):
+        return {
+            "url": url,
+            "description": "",
+            "snippets": snippets,
+            "title": url,
+            "meta": {},
+        }
+
+    turns = [
+        {
+            "agent_utterance": "",
+            "user_utterance": "",
+            "search_queries": [],
+            "search_results": [
+                info("https://a", [f"a{idx}" for idx in range(20)]),
+                info("https://b", ["b0", "b1"]),
+            ],
+        },
+        {
+            "agent_utterance": "",
+            "user_utterance": "",
+            "search_queries": [],
+            "search_results": [info("https://a", [f"a{idx}" for idx in range(10, 30)])],
+        },
+    ]
+    with open(path, "w") as f:
+        json.dump([{"perspective": "", "dlg_turns": turns}], f)
+
+
+def run_in_fresh_process(tmp_path, hash_seed):
+    script_path = tmp_path / "reload.py"
+    script_path.write_text(RELOAD_SCRIPT)
+    # The script runs from a temporary directory, so the repository has to be on the path.
+    python_path = os.pathsep.join(
+        filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])
+    )
+    env = dict(os.environ, PYTHONHASHSEED=str(hash_seed), PYTHONPATH=python_path)
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(script_path),
+            str(tmp_path / "conversation_log.json"),
+            str(tmp_path / "embeddings"),
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_snippet_embeddings_are_reused_by_a_fresh_process(tmp_path):
+    make_conversation_log(tmp_path / "conversation_log.json")
+
+    first = run_in_fresh_process(tmp_path, hash_seed=1)
+    # A different hash seed changes the iteration order of sets of strings.
+    second = run_in_fresh_process(tmp_path, hash_seed=2)
+
+    assert first == {"num_encoded": 32, "rows_match": True}
+    assert second == {"num_encoded": 0, "rows_match": True}
+    index = json.loads(
+        (tmp_path / "embeddings" / "snippet_embeddings.json").read_text()
+    )
+    assert index["shape"] == [32, 16]
+    assert np.load(tmp_path / "embeddings" / "snippet_embeddings.npy").shape == (32, 16)
+
+
+def test_snippet_embeddings_are_recomputed_when_snippets_change(tmp_path):
+    make_conversation_log(tmp_path / "conversation_log.json")
+    run_in_fresh_process(tmp_path, hash_seed=1)
+
+    log = json.loads((tmp_path / "conversation_log.json").read_text())
+    log[0]["dlg_turns"][0]["search_results"][1]["snippets"].append("b2")
+    (tmp_path / "conversation_log.json").write_text(json.dumps(log))
+
+    assert run_in_fresh_process(tmp_path, hash_seed=1) == {
+        "num_encoded": 33,
+        "rows_match": True,
+    }
+
+
+class RandomEncoder:
+    """Encodes every text to a fixed random vector."""
+
+    def __init__(self):
+        self.vectors = {}
+        self.rng = np.random.default_rng(0)
+
+    def encode(self, texts):
+        texts = [texts] if isinstance(texts, str) else texts
+        for text in texts:
+            if text not in self.vectors:
+                self.vectors[text] = self.rng.normal(size=8)
+        return np.array([self.vectors[text] for text in texts])
+
+
+def rank_one_query_at_a_time(table, queries, search_top_k):
+    """The ranking of `retrieve_information` before queries were batched."""
+    snippets = np.array([table.encoder.vectors[s] for s in table.collected_snippets])
+    url_to_snippets = {}
+    for query in queries:
+        query_vector = table.encoder.vectors[query]
+        sim = (snippets @ query_vector) / (
+            np.linalg.norm(snippets, axis=1) * np.linalg.norm(query_vector)
+        )
+        for i in np.argsort(sim)[-search_top_k:][::-1]:
+            url_to_snippets.setdefault(table.collected_urls[i], set()).add(
+                table.collected_snippets[i]
+            )
+    return url_to_snippets
+
+
+def test_batched_retrieval_matches_ranking_one_query_at_a_time(tmp_path, monkeypatch):
+    encoder = RandomEncoder()
+    monkeypatch.setattr(
+        storm_dataclass, "get_sentence_transformer", lambda *args, **kwargs: encoder
+    )
+    make_conversation_log(tmp_path / "conversation_log.json")
+    table = storm_dataclass.StormInformationTable.from_conversation_log_file(
+        str(tmp_path / "conversation_log.json")
+    )
+    table.url_to_info["https://a"].meta = {"query": "original"}
+    table.prepare_table_for_retrieval()
+    queries = [f"query {idx}" for idx in range(6)]
+    encoder.encode(queries)
+
+    for search_top_k in [1, 3, 40]:
+        expected = rank_one_query_at_a_time(table, queries, search_top_k)
+        selected = table.retrieve_information(queries, search_top_k)
+        assert [info.url for info in selected] == list(expected)
+        assert [set(info.snippets) for info in selected] == list(expected.values())
+
+    info = next(
+        info
+        for info in table.retrieve_information(queries, 40)
+        if info.url == "https://a"
+    )
+    info.meta["query"] = "changed"
+    info.snippets.append("added")
+    assert table.url_to_info["https://a"].meta == {"query": "original"}
+    assert "added" not in table.url_to_info["https://a"].snippets
@@ -0,0 +1,49 @@
+from knowledge_storm.storm_wiki.engine import (
+    STORMWikiLMConfigs,
+    STORMWikiRunner,
+    STORMWikiRunnerArguments,
+)
+
+
+class FakeLM:
+    def __init__(self):
+        self.model = "fake-model"
+        self.kwargs = {}
+        self.history = []
+
+
+def make_runner(tmp_path, **kwargs):
+    lm_configs = STORMWikiLMConfigs()
+    lm_configs.set_conv_simulator_lm(FakeLM())
+    lm_configs.set_question_asker_lm(FakeLM())
+    lm_configs.set_outline_gen_lm(FakeLM())
+    lm_configs.set_article_gen_lm(FakeLM())
+    lm_configs.set_article_polish_lm(FakeLM())
+    args = STORMWikiRunnerArguments(output_dir=str(tmp_path), **kwargs)
+    return STORMWikiRunner(args, lm_configs, rm=None)
+
+
+def test_token_budgets_are_set_per_role(tmp_path):
+    runner = make_runner(
+        tmp_path,
+        question_asker_max_conv_tokens=100,
+        conv_simulator_max_info_tokens=200,
+        outline_gen_max_conv_tokens=300,
+        article_gen_max_info_tokens=400,
+    )
+
+    conv_simulator = runner.storm_knowledge_curation_module.conv_simulator
+    assert conv_simulator.wiki_writer.max_conv_tokens == 100
+    assert conv_simulator.topic_expert.max_info_tokens == 200
+    assert runner.storm_outline_generation_module.write_outline.max_conv_tokens == 300
+    assert runner.storm_article_generation.section_gen.max_info_tokens == 400
+
+
+def test_token_budgets_default_to_the_previous_limits(tmp_path):
+    runner = make_runner(tmp_path)
+
+    conv_simulator = runner.storm_knowledge_curation_module.conv_simulator
+    assert conv_simulator.wiki_writer.max_conv_tokens == 3300
+    assert conv_simulator.topic_expert.max_info_tokens == 1300
+    assert runner.storm_outline_generation_module.write_outline.max_conv_tokens == 6500
+    assert runner.storm_article_generation.section_gen.max_info_tokens == 2000
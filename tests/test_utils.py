@@ -0,0 +1,612 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import knowledge_storm.utils as utils
+from knowledge_storm.utils import (
+    AsyncHTTPClient,
+    CallRecording,
+    ExtractedPageCache,
+    LMHistorySink,
+    SingleFlight,
+    SQLiteCache,
+    TokenCounter,
+    WebPageHelper,
+)
+
+
+def stored_size(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+
+def test_sqlite_cache_round_trip(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+
+    cache.set("key", {"results": [1, 2, "three"]})
+
+    assert cache.get("key") == {"results": [1, 2, "three"]}
+    assert cache.get("missing") is None
+    assert cache.get_stats() == {
+        "hits": 1,
+        "misses": 1,
+        "expirations": 0,
+        "evictions": 0,
+        "entries": 1,
+        "bytes": stored_size(tmp_path / "cache.db"),
+    }
+
+
+def test_sqlite_cache_expires_old_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.set("key", "value")
+
+    now[0] += 59
+    assert cache.get("key") == "value"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_sqlite_cache_can_keep_the_creation_time_of_replaced_entries(
+    tmp_path, monkeypatch
+):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.set("kept", 1)
+    cache.set("renewed", 1)
+
+    now[0] += 40
+    cache.set("kept", 2, keep_created_at=True)
+    cache.set("renewed", 2)
+    now[0] += 40
+
+    assert cache.get("kept") is None
+    assert cache.get("renewed") == 2
+
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCache(path)
+    cache.set("probe", "x" * 100)
+    entry_size = stored_size(path)
+    cache.clear()
+    cache = SQLiteCache(path, max_bytes=int(entry_size * 3.5))
+
+    for key in ["a", "b", "c"]:
+        now[0] += 1
+        cache.set(key, key * 100)
+    now[0] += 1
+    cache.get("a")
+    now[0] += 1
+    cache.set("d", "d" * 100)
+
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in ["a", "c", "d"]] == [True] * 3
+    assert stored_size(path) <= cache.max_bytes
+
+
+def test_sqlite_cache_tracks_total_size_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCache(path), SQLiteCache(path)
+
+    first.set("a", "a" * 1000)
+    second.set("b", "b" * 10)
+    second.set("a", "short")  # Replacing an entry updates its size.
+    first.delete("b")
+    second.set("c", list(range(100)))
+
+    assert first.get_stats()["bytes"] == stored_size(path)
+    first.clear()
+    assert second.get_stats()["bytes"] == 0
+
+
+def test_sqlite_cache_sums_files_written_without_the_size_table(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteCache(path).set("a", "a" * 1000)
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE cache_size")
+        for name in ["insert", "delete", "update"]:
+            conn.execute(f"DROP TRIGGER cache_size_{name}")
+
+    cache = SQLiteCache(path)
+
+    assert cache.get_stats()["bytes"] == stored_size(path) > 0
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_search(query):
+        calls.append(query)
+        release.wait(5)
+        return f"results for {query}"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.do("key", slow_search, "query"))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while single_flight.coalesced < 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["query"]
+    assert results == ["results for query"] * 5
+    assert single_flight.get_coalesced_and_reset() == 4
+    # Finished calls are not cached.
+    assert single_flight.do("key", lambda: "again") == "again"
+
+
+def test_single_flight_shares_exceptions_with_waiters():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("search failed")
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while single_flight.coalesced < 1:
+        threading.Event().wait(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_single_flight_coalesces_async_and_sync_callers():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def search():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "results"
+
+    async def main():
+        return await asyncio.gather(
+            *(single_flight.ado("key", search) for _ in range(3)),
+            asyncio.to_thread(single_flight.do, "key", lambda: "sync call"),
+        )
+
+    results = asyncio.run(main())
+
+    assert calls == [1]
+    assert results == ["results"] * 4
+
+
+def test_history_buffers_keep_recent_calls_per_lm(tmp_path):
+    sink = LMHistorySink(str(tmp_path / "history.jsonl.gz"), max_in_memory_entries=2)
+    first, second = sink.buffer(), sink.buffer()
+
+    for idx in range(3):
+        first.append({"lm": "first", "call": idx})
+        second.append({"lm": "second", "call": idx})
+
+    assert list(first) == [{"lm": "first", "call": 1}, {"lm": "first", "call": 2}]
+    assert first[-1] == {"lm": "first", "call": 2} and len(second) == 2
+    assert [entry["lm"] for entry in sink.read()] == ["first", "second"] * 3
+
+
+def test_history_sink_reads_calls_since_the_last_reset(tmp_path):
+    sink = LMHistorySink(str(tmp_path / "history.jsonl.gz"))
+    buffer = sink.buffer()
+    buffer.extend([{"call": 0}, {"call": 1}])
+
+    assert list(sink.read_and_reset()) == [{"call": 0}, {"call": 1}]
+    buffer.append({"call": 2})
+    assert list(sink.read_and_reset()) == [{"call": 2}]
+    assert list(sink.read(1)) == [{"call": 1}, {"call": 2}]
+
+
+def test_history_sink_removes_its_temporary_file():
+    sink = LMHistorySink()
+    sink.buffer().append({"call": 0})
+    path = sink.path
+
+    sink.close()
+
+    assert not os.path.exists(path)
+
+
+def test_call_recording_replays_repeated_calls_in_order(tmp_path):
+    path = str(tmp_path / "recording" / "calls.jsonl")
+    recording = CallRecording(path)
+    recording.record_config("lm", "model", {"kwargs": {"temperature": 0}})
+    key = CallRecording.make_key("prompt", {"n": 1})
+    recording.record("lm", key, {"prompt": "prompt"}, ["first"], 0.5)
+    recording.record("lm", key, {"prompt": "prompt"}, ["second"], 1.5)
+    recording.close()
+
+    replay = CallRecording(path)
+
+    assert replay.get_config("lm", "model") == {"kwargs": {"temperature": 0}}
+    assert [replay.lookup("lm", key)["response"] for _ in range(3)] == [
+        ["first"],
+        ["second"],
+        ["second"],
+    ]
+    assert replay.lookup("rm", key) is None
+    assert replay.lookup("lm", CallRecording.make_key("other")) is None
+
+
+def test_call_recording_replay_delay():
+    call = {"latency_seconds": 2.0}
+
+    assert CallRecording.replay_delay(call) == 0.0
+    assert CallRecording.replay_delay(call, latency_scale=0.5) == 1.0
+    assert CallRecording.replay_delay(call, latency_sampler=lambda: 3.0) == 3.0
+    assert CallRecording.replay_delay(call, latency_sampler=lambda: -1.0) == 0.0
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch):
+    def encoding_for_model(model):
+        if model.startswith("gpt-"):
+            return FakeEncoding()
+        raise KeyError(model)
+
+    tiktoken = types.SimpleNamespace(
+        encoding_for_model=encoding_for_model,
+        get_encoding=lambda name: FakeEncoding(),
+    )
+    monkeypatch.setitem(sys.modules, "tiktoken", tiktoken)
+    monkeypatch.setattr(TokenCounter, "_fallback_models", set())
+
+
+def test_token_counter_logs_the_fallback_encoding_once_per_model(fake_tiktoken, caplog):
+    with caplog.at_level(logging.WARNING):
+        for _ in range(3):
+            assert TokenCounter("ollama/llama3").count("a b c") == 3
+        TokenCounter("vllm/mistral")
+        TokenCounter("openai/gpt-4o")
+
+    fallbacks = [
+        r.getMessage() for r in caplog.records if "o200k_base" in r.getMessage()
+    ]
+    assert len(fallbacks) == 2
+    assert "ollama/llama3" in fallbacks[0] and "vllm/mistral" in fallbacks[1]
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    Serves a page with an ETag, answering conditional requests with 304, or fails while `server.down` is set. Other
+    paths serve a large page, a PDF, a page that never arrives, articles and pages that take a while.
+    """
+
+    ETAG = '"v1"'
+    BODY = b"<html><body><p>Some article text.</p></body></html>"
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.path == "/large":
+            self.send_body(b"x" * 100_000)
+        elif self.path == "/pdf":
+            self.send_body(b"%PDF-1.4", content_type="application/pdf")
+        elif self.path == "/hanging":
+            self.server.released.wait(timeout=10)
+        elif self.path.startswith("/article/"):
+            # Later articles arrive first, so results do not follow the order of completion.
+            idx = int(self.path.rsplit("/", 1)[1])
+            time.sleep(0.02 * (5 - idx))
+            paragraphs = "".join(
+                f"<p>Paragraph {p} of article {idx}. "
+                + "Some article text. " * 5
+                + "</p>"
+                for p in range(4)
+            )
+            self.send_body(
+                f"<html><body><article>{paragraphs}</article></body></html>".encode()
+            )
+        elif self.path.startswith("/slow"):
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(
+                    self.server.max_in_flight, self.server.in_flight
+                )
+            time.sleep(0.05)
+            with self.server.lock:
+                self.server.in_flight -= 1
+            self.send_body(self.BODY)
+        elif self.server.down:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == self.ETAG:
+            self.send_response(304)
+            self.send_header("ETag", self.ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_body(self.BODY)
+
+    def send_body(self, body, content_type="text/html"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", self.ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.requests = []
+    server.down = False
+    server.released = threading.Event()
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.released.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_extraction(monkeypatch):
+    def extract_article(html, min_char_count, snippet_chunk_size, split):
+        text = html.decode()
+        return {"text": text, "snippets": [text]} if split else {"text": text}
+
+    monkeypatch.setattr(utils, "_extract_article", extract_article)
+
+
+@pytest.fixture
+def page_cache(tmp_path, monkeypatch, fake_extraction):
+    cache = ExtractedPageCache(
+        str(tmp_path / "pages.db"), revalidate_after_seconds=0, ttl_seconds=60
+    )
+    monkeypatch.setattr(utils, "_extracted_page_cache", cache)
+    return cache
+
+
+def test_web_page_helper_cuts_off_large_pages(page_server):
+    helper = WebPageHelper(max_bytes=1000, use_page_cache=False)
+
+    status_code, _, body = asyncio.run(
+        helper.afetch_webpage(f"{page_server.url}/large")
+    )
+
+    assert status_code == 200
+    assert body == b"x" * 1000
+
+
+def test_web_page_helper_skips_disallowed_content_types(page_server):
+    url = f"{page_server.url}/pdf"
+
+    assert WebPageHelper(use_page_cache=False).download_webpage(url) is None
+    helper = WebPageHelper(
+        use_page_cache=False,
+        allowed_content_types=[*WebPageHelper.DEFAULT_CONTENT_TYPES, "application/pdf"],
+    )
+    assert helper.download_webpage(url) == b"%PDF-1.4"
+
+
+def test_web_page_helper_gives_up_on_slow_pages_only(page_server, fake_extraction):
+    helper = WebPageHelper(min_char_count=10, url_timeout=0.5, use_page_cache=False)
+    urls = [f"{page_server.url}/hanging", f"{page_server.url}/page"]
+
+    start = time.monotonic()
+    articles = helper.urls_to_articles(urls)
+
+    assert 0.5 <= time.monotonic() - start < 5
+    assert articles == {urls[1]: {"text": PageHandler.BODY.decode()}}
+
+
+def test_web_page_helper_limits_connections_per_host(page_server, fake_extraction):
+    helper = WebPageHelper(
+        min_char_count=10, max_connections_per_host=2, use_page_cache=False
+    )
+    urls = [f"{page_server.url}/slow/{idx}" for idx in range(8)]
+
+    articles = helper.urls_to_articles(urls)
+
+    assert list(articles) == urls
+    assert page_server.max_in_flight == 2
+
+
+def test_extracted_page_cache_revalidates_and_serves_stale_pages(
+    page_server, page_cache, tmp_path
+):
+    url = f"http://127.0.0.1:{page_server.server_address[1]}/page"
+    helper = WebPageHelper(min_char_count=10)
+    # Creating a helper does not open the cache file.
+    assert not os.path.exists(tmp_path / "pages.db")
+
+    downloaded = helper.urls_to_snippets([url])[url]
+    revalidated = helper.urls_to_snippets([url])[url]
+    page_server.down = True
+    stale = helper.urls_to_articles([url])[url]
+
+    assert page_server.requests == [None, PageHandler.ETAG, PageHandler.ETAG]
+    assert revalidated == downloaded
+    assert stale == {"text": downloaded["text"]}
+    stats = page_cache.get_stats()
+    assert (stats["misses"], stats["revalidated"], stats["stale"]) == (1, 1, 1)
+    assert stats["hit_rate"] == round(2 / 3, 4)
+
+
+def test_extracted_page_cache_revalidation_keeps_the_expiry(
+    page_server, page_cache, monkeypatch
+):
+    url = f"http://127.0.0.1:{page_server.server_address[1]}/page"
+    helper = WebPageHelper(min_char_count=10)
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+
+    helper.urls_to_articles([url])
+    now[0] += 40
+    helper.urls_to_articles([url])
+    now[0] += 40
+    helper.urls_to_articles([url])
+
+    # The entry expired 60s after the download despite the revalidation in between, so the page is downloaded again.
+    assert page_server.requests == [None, PageHandler.ETAG, None]
+    assert page_cache.get_stats()["misses"] == 2
+
+
+def test_extracted_page_cache_is_used_off_the_event_loop(
+    page_server, page_cache, monkeypatch
+):
+    url = f"http://127.0.0.1:{page_server.server_address[1]}/page"
+    helper = WebPageHelper(min_char_count=10)
+    sqlite_cache = page_cache.cache
+    cache_threads = set()
+
+    def record_thread(method):
+        def wrapper(*args, **kwargs):
+            cache_threads.add(threading.current_thread())
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(sqlite_cache, "get", record_thread(sqlite_cache.get))
+    monkeypatch.setattr(sqlite_cache, "set", record_thread(sqlite_cache.set))
+
+    # Downloaded and stored, then revalidated and stored again.
+    for _ in range(2):
+        assert url in asyncio.run(helper.aurls_to_articles([url]))
+
+    assert cache_threads
+    assert threading.main_thread() not in cache_threads
+
+
+@pytest.fixture
+def extraction_pools(monkeypatch):
+    pools = {}
+    monkeypatch.setattr(utils, "_extraction_pools", pools)
+    yield pools
+    for pool in pools.values():
+        pool.shutdown()
+
+
+def test_web_page_helper_extracts_in_worker_processes(page_server, extraction_pools):
+    urls = [f"{page_server.url}/article/{idx}" for idx in range(5)]
+    in_process = WebPageHelper(
+        min_char_count=10, snippet_chunk_size=100, use_page_cache=False
+    )
+    in_workers = WebPageHelper(
+        min_char_count=10,
+        snippet_chunk_size=100,
+        extraction_processes=2,
+        use_page_cache=False,
+    )
+
+    expected = in_process.urls_to_snippets(urls)
+    snippets = in_workers.urls_to_snippets(urls)
+
+    assert list(snippets) == urls
+    assert snippets == expected
+    assert all(len(article["snippets"]) > 1 for article in snippets.values())
+    assert list(extraction_pools) == [2]
+
+
+class BrokenPool:
+    def submit(self, *args):
+        future = concurrent.futures.Future()
+        future.set_exception(concurrent.futures.process.BrokenProcessPool("died"))
+        return future
+
+
+def test_web_page_helper_extracts_in_process_when_the_pool_breaks(
+    page_server, extraction_pools, fake_extraction
+):
+    extraction_pools[2] = BrokenPool()
+    helper = WebPageHelper(
+        min_char_count=10, extraction_processes=2, use_page_cache=False
+    )
+    url = f"{page_server.url}/page"
+
+    assert helper.urls_to_articles([url]) == {url: {"text": PageHandler.BODY.decode()}}
+    # The broken pool is dropped, so the next extraction starts a new one.
+    assert extraction_pools == {}
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_async_http_client_counts_reused_connections():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    client = AsyncHTTPClient()
+
+    async def get_sequentially():
+        for _ in range(3):
+            await client.get(url)
+        async with client.stream("GET", url) as response:
+            await response.aread()
+        await client.aclose()
+
+    try:
+        asyncio.run(get_sequentially())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert client.get_stats(reset=True) == {
+        "127.0.0.1": {"requests": 4, "new_connections": 1, "reused_connections": 3}
+    }
+    assert client.get_stats()["127.0.0.1"]["requests"] == 0